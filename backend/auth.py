@@ -1,25 +1,51 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import String, cast, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
 from backend.config import settings
-from backend.database import get_db
-from backend.models import User, UserRole
+from backend.database import get_async_db
+from backend.models import User, UserRole, VersionCounter
+from backend.services.cache import TTLCache
+from backend.services.versions import read_versions, user_scope
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer(auto_error=False)
+token_cache = TTLCache("auth_tokens", settings.auth_cache_size, settings.auth_cache_ttl_s)
+user_cache = TTLCache("auth_users", settings.auth_cache_size, settings.auth_cache_ttl_s)
 
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    username: str
+    role: UserRole
+    leave_balance: int
+    is_active: bool
+    created_at: datetime
+    # The user_scope counter the row was read at; every change to the user bumps it.
+    version: int
 
+    @classmethod
+    def from_user(cls, user: User, version: int) -> "UserSnapshot":
+        return cls(user.id, user.username, user.role, user.leave_balance, user.is_active, user.created_at, version)
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(password, hashed_password)
+    async def attach(self, db: AsyncSession) -> User:
+        # Re-attach without a SELECT; password_hash and relationships stay unloaded until refreshed.
+        user = User(
+            id=self.id,
+            username=self.username,
+            role=self.role,
+            leave_balance=self.leave_balance,
+            is_active=self.is_active,
+            created_at=self.created_at,
+        )
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
 
 
 def create_access_token(subject: str) -> str:
@@ -29,29 +55,65 @@ def create_access_token(subject: str) -> str:
     return jwt.encode(payload, settings.jwt_secret, algorithm=settings.jwt_algo)
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials | None = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
-    if not credentials:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+def invalidate_cached_user(username: str):
+    # Only this process; other workers notice the change through the user_scope counter.
+    user_cache.pop(username)
+
+
+def decode_token_subject(token: str) -> str:
+    username = token_cache.get(token)
+    if username is not None:
+        return username
 
-    token = credentials.credentials
     try:
         payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algo])
-        username: str | None = payload.get("sub")
+        username = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     except JWTError as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token") from exc
 
-    user = db.query(User).filter(User.username == username).first()
+    expires_in = payload["exp"] - datetime.now(timezone.utc).timestamp() if "exp" in payload else settings.auth_cache_ttl_s
+    token_cache.set(token, username, min(settings.auth_cache_ttl_s, expires_in))
+    return username
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials | None = Depends(security),
+    db: AsyncSession = Depends(get_async_db),
+) -> User:
+    if not credentials:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+    username = decode_token_subject(credentials.credentials)
+    snapshot: UserSnapshot | None = user_cache.get(username)
+    if snapshot is not None:
+        # The cache is per process, so a hit is checked against the shared counter: a primary
+        # key lookup that drops the snapshot once any worker changed the user.
+        scope = user_scope(snapshot.id)
+        if (await read_versions(db, [scope]))[scope] != snapshot.version:
+            snapshot = None
+    if snapshot is None:
+        # The counter comes from the same statement, so a change can never slip in between.
+        row = (
+            await db.execute(
+                select(User, VersionCounter.version)
+                .outerjoin(VersionCounter, VersionCounter.scope == literal("user:") + cast(User.id, String))
+                .where(User.username == username)
+            )
+        ).first()
+        user = row[0] if row else None
+        if user:
+            user_cache.set(username, UserSnapshot.from_user(user, row[1] or 0))
+    else:
+        user = await snapshot.attach(db)
+
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Inactive or missing user")
     return user
 
 
-def require_admin(current_user: User = Depends(get_current_user)) -> User:
+async def require_admin(current_user: User = Depends(get_current_user)) -> User:
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required")
     return current_user
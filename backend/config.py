@@ -1,6 +1,8 @@
 import os
 from dataclasses import dataclass
 
+from backend.units import days_to_units
+
 
 def get_env(name: str, default: str | None = None) -> str | None:
     value = os.getenv(name)
@@ -13,13 +15,80 @@ def get_env(name: str, default: str | None = None) -> str | None:
 class Settings:
     app_name: str = "Leave Management"
     database_url: str = get_env("DATABASE_URL", "sqlite:///./leave_app.db") or "sqlite:///./leave_app.db"
+    db_pool_size: int = int(get_env("DB_POOL_SIZE", "10") or "10")
+    db_max_overflow: int = int(get_env("DB_MAX_OVERFLOW", "10") or "10")
+    db_pool_timeout_s: float = float(get_env("DB_POOL_TIMEOUT_S", "10") or "10")
+    db_pool_recycle_s: int = int(get_env("DB_POOL_RECYCLE_S", "1800") or "1800")
+    db_pre_ping: str = get_env("DB_PRE_PING", "idle") or "idle"
+    db_pre_ping_idle_s: float = float(get_env("DB_PRE_PING_IDLE_S", "60") or "60")
+    db_max_connections: int = int(get_env("DB_MAX_CONNECTIONS", "100") or "100")
+    db_reserved_connections: int = int(get_env("DB_RESERVED_CONNECTIONS", "10") or "10")
+    db_recent_statements: int = int(get_env("DB_RECENT_STATEMENTS", "500") or "500")
+    # Comma-separated read replica URLs; empty sends every read to DATABASE_URL.
+    db_replica_urls: str = get_env("DATABASE_REPLICA_URLS", "") or ""
+    db_replica_check_s: float = float(get_env("DB_REPLICA_CHECK_S", "5") or "5")
+    db_replica_check_timeout_s: float = float(get_env("DB_REPLICA_CHECK_TIMEOUT_S", "2") or "2")
+    db_replica_max_lag_s: float = float(get_env("DB_REPLICA_MAX_LAG_S", "10") or "10")
+    db_read_your_writes_s: float = float(get_env("DB_READ_YOUR_WRITES_S", "5") or "5")
+    web_concurrency: int = int(get_env("WEB_CONCURRENCY", "1") or "1")
     jwt_secret: str = get_env("JWT_SECRET", "change-me-in-prod") or "change-me-in-prod"
     jwt_algo: str = "HS256"
     token_expire_minutes: int = int(get_env("TOKEN_EXPIRE_MINUTES", "720") or "720")
-    accrual_amount: float = float(get_env("ACCRUAL_AMOUNT", "1.2") or "1.2")
+    auth_cache_size: int = int(get_env("AUTH_CACHE_SIZE", "10000") or "10000")
+    auth_cache_ttl_s: float = float(get_env("AUTH_CACHE_TTL_S", "30") or "30")
+    bcrypt_rounds: int = int(get_env("BCRYPT_ROUNDS", "12") or "12")
+    password_hash_workers: int = int(get_env("PASSWORD_HASH_WORKERS", "2") or "2")
+    password_hash_queue_max: int = int(get_env("PASSWORD_HASH_QUEUE_MAX", "32") or "32")
+    failed_login_ttl_s: float = float(get_env("FAILED_LOGIN_TTL_S", "60") or "60")
+    failed_login_free_attempts: int = int(get_env("FAILED_LOGIN_FREE_ATTEMPTS", "3") or "3")
+    failed_login_backoff_s: float = float(get_env("FAILED_LOGIN_BACKOFF_S", "1") or "1")
+    # ACCRUAL_AMOUNT is given in days; kept in hundredths like every other leave quantity.
+    accrual_units: int = days_to_units(get_env("ACCRUAL_AMOUNT", "1.2") or "1.2")
+    accrual_mode: str = get_env("ACCRUAL_MODE", "bulk") or "bulk"
+    accrual_chunk_size: int = int(get_env("ACCRUAL_CHUNK_SIZE", "1000") or "1000")
+    scheduler_tick_s: float = float(get_env("SCHEDULER_TICK_S", "30") or "30")
+    scheduler_lease_ttl_s: float = float(get_env("SCHEDULER_LEASE_TTL_S", "90") or "90")
+    scheduler_catchup_runs: int = int(get_env("SCHEDULER_CATCHUP_RUNS", "3") or "3")
+    job_lease_ttl_s: float = float(get_env("JOB_LEASE_TTL_S", "3600") or "3600")
+    job_retry_delay_s: float = float(get_env("JOB_RETRY_DELAY_S", "300") or "300")
+    # Days a checkpoint run stays behind its fire time. created_at is stamped at flush, so a
+    # transaction committed after midnight can still carry yesterday's date.
+    checkpoint_lag_days: int = int(get_env("CHECKPOINT_LAG_DAYS", "1") or "1")
+    archive_deleted_after_days: int = int(get_env("ARCHIVE_DELETED_AFTER_DAYS", "90") or "90")
+    # Ledger years kept hot, counting the current one; older years move to the archive.
+    archive_hot_years: int = int(get_env("ARCHIVE_HOT_YEARS", "2") or "2")
+    archive_batch_size: int = int(get_env("ARCHIVE_BATCH_SIZE", "5000") or "5000")
     timezone: str = "Asia/Ho_Chi_Minh"
+    request_log_sample_rate: float = float(get_env("REQUEST_LOG_SAMPLE_RATE", "0.01") or "0.01")
+    holidays: str = get_env("LEAVE_HOLIDAYS", "") or ""
+    max_range_days: int = int(get_env("MAX_RANGE_DAYS", "366") or "366")
+    calendar_max_days: int = int(get_env("CALENDAR_MAX_DAYS", "92") or "92")
+    calendar_cache_ttl_s: float = float(get_env("CALENDAR_CACHE_TTL_S", "300") or "300")
+    report_cache_ttl_s: float = float(get_env("REPORT_CACHE_TTL_S", "60") or "60")
+    export_batch_size: int = int(get_env("EXPORT_BATCH_SIZE", "2000") or "2000")
+    import_chunk_size: int = int(get_env("IMPORT_CHUNK_SIZE", "1000") or "1000")
+    import_max_errors: int = int(get_env("IMPORT_MAX_ERRORS", "1000") or "1000")
     page_size_default: int = int(get_env("PAGE_SIZE_DEFAULT", "20") or "20")
     page_size_max: int = int(get_env("PAGE_SIZE_MAX", "100") or "100")
+    # Comma-separated vLLM chat completion URLs callers may pick from; the first is the
+    # default when a bot names none. Empty disables vLLM bots.
+    chat_vllm_endpoints: str = get_env("CHAT_VLLM_ENDPOINTS", "") or ""
+    chat_max_connections: int = int(get_env("CHAT_MAX_CONNECTIONS", "100") or "100")
+    chat_max_keepalive: int = int(get_env("CHAT_MAX_KEEPALIVE", "20") or "20")
+    chat_keepalive_expiry_s: float = float(get_env("CHAT_KEEPALIVE_EXPIRY_S", "30") or "30")
+    chat_http2: bool = (get_env("CHAT_HTTP2", "1") or "1") == "1"
+    chat_endpoint_concurrency: int = int(get_env("CHAT_ENDPOINT_CONCURRENCY", "16") or "16")
+    chat_cache_size: int = int(get_env("CHAT_CACHE_SIZE", "1000") or "1000")
+    chat_cache_ttl_s: float = float(get_env("CHAT_CACHE_TTL_S", "3600") or "3600")
+    chat_cache_path: str = get_env("CHAT_CACHE_PATH", "") or ""
+    chat_batch_dir: str = get_env("CHAT_BATCH_DIR", "./chat_batches") or "./chat_batches"
+    chat_batch_concurrency: int = int(get_env("CHAT_BATCH_CONCURRENCY", "8") or "8")
+    chat_batch_rate_limits: str = get_env("CHAT_BATCH_RATE_LIMITS", "vllm=20,qwen_api=5") or ""
 
 
 settings = Settings()
+
+VLLM_TIMEOUT_S = float(get_env("VLLM_TIMEOUT_S", "60") or "60")
+QWEN_TIMEOUT_S = float(get_env("QWEN_TIMEOUT_S", "60") or "60")
+QWEN_API_BASE = get_env("QWEN_API_BASE", "https://dashscope-intl.aliyuncs.com/compatible-mode/v1") or ""
+QWEN_API_KEY = get_env("QWEN_API_KEY")
@@ -1,18 +1,247 @@
-from sqlalchemy import create_engine
+import asyncio
+import logging
+import math
+import time
+from typing import Any
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from backend.config import settings
+from backend.services.cache import TTLCache
+from backend.services.metrics import db_replica_healthy, instrument_engine, timed_pool
+
+logger = logging.getLogger("database")
 
 connect_args = {"check_same_thread": False} if settings.database_url.startswith("sqlite") else {}
+PRE_PING_MODES = ("always", "idle", "off")
+
+if settings.db_pre_ping not in PRE_PING_MODES:
+    raise ValueError(f"DB_PRE_PING must be one of {', '.join(PRE_PING_MODES)}")
+
+
+def pool_options() -> dict[str, Any]:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_s,
+        "pool_recycle": settings.db_pool_recycle_s,
+        "pool_pre_ping": settings.db_pre_ping == "always",
+    }
+
 
-engine = create_engine(settings.database_url, pool_pre_ping=True, connect_args=connect_args)
+def install_idle_pre_ping(engine: Engine, idle_s: float):
+    # Only connections that sat in the pool longer than idle_s get a SELECT 1; a busy pool
+    # skips the extra round trip that pool_pre_ping=True pays on every checkout.
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_s:
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        except Exception as exc:
+            raise DisconnectionError("Stale pooled connection") from exc
+
+
+def configure_engine(engine: Engine, label: str):
+    instrument_engine(engine, label)
+    if settings.db_pre_ping == "idle":
+        install_idle_pre_ping(engine, settings.db_pre_ping_idle_s)
+
+
+engine = create_engine(
+    settings.database_url, poolclass=timed_pool(QueuePool, "sync"), connect_args=connect_args, **pool_options()
+)
+configure_engine(engine, "sync")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def async_database_url(url: str) -> str:
+    driver, sep, rest = url.partition("://")
+    dialect = driver.split("+", 1)[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+async_engine = create_async_engine(
+    async_database_url(settings.database_url), poolclass=timed_pool(AsyncAdaptedQueuePool, "async"), **pool_options()
+)
+configure_engine(async_engine.sync_engine, "async")
+# expire_on_commit=False: async handlers cannot lazy-load expired attributes after a commit.
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# Caught up when everything received is replayed; otherwise age of the last replayed commit.
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def create_replica_engine(url: str, label: str) -> AsyncEngine:
+    replica = create_async_engine(async_database_url(url), poolclass=timed_pool(AsyncAdaptedQueuePool, label), **pool_options())
+    configure_engine(replica.sync_engine, label)
+    return replica
+
+
+async def replica_healthy(replica: AsyncEngine) -> bool:
+    try:
+        async with asyncio.timeout(settings.db_replica_check_timeout_s):
+            async with replica.connect() as conn:
+                if conn.dialect.name != "postgresql":
+                    await conn.execute(text("SELECT 1"))
+                    return True
+                lag = await conn.scalar(REPLICA_LAG_SQL)
+                return lag is None or lag <= settings.db_replica_max_lag_s
+    except Exception as exc:
+        logger.warning("Replica %s failed its health check: %s", replica.url.render_as_string(hide_password=True), exc)
+        return False
+
+
+class ReplicaPool:
+    # Round-robin over the replicas that passed their last health check. Replicas start out
+    # unchecked, and with none configured or none healthy every read goes to the primary.
+    def __init__(self, engines: list[AsyncEngine]):
+        self.engines = engines
+        self.labels = [f"replica{idx}" for idx in range(len(engines))]
+        self.healthy: set[int] = set()
+        self._next = 0
+
+    def pick(self) -> AsyncEngine | None:
+        for _ in range(len(self.engines)):
+            idx = self._next % len(self.engines)
+            self._next += 1
+            if idx in self.healthy:
+                return self.engines[idx]
+        return None
+
+    async def check(self):
+        results = await asyncio.gather(*(replica_healthy(replica) for replica in self.engines))
+        for idx, healthy in enumerate(results):
+            if healthy:
+                self.healthy.add(idx)
+            else:
+                self.healthy.discard(idx)
+            db_replica_healthy.set(self.labels[idx], value=1 if healthy else 0)
+
+    async def run_checks(self):
+        while True:
+            await asyncio.sleep(settings.db_replica_check_s)
+            await self.check()
+
+    def status(self) -> list[dict[str, Any]]:
+        return [
+            {"engine": label, "healthy": idx in self.healthy, "pool": pool_status(replica.sync_engine)}
+            for idx, (label, replica) in enumerate(zip(self.labels, self.engines))
+        ]
+
+    async def dispose(self):
+        for replica in self.engines:
+            await replica.dispose()
+
+
+replicas = ReplicaPool(
+    [
+        create_replica_engine(url.strip(), f"replica{idx}")
+        for idx, url in enumerate(url for url in settings.db_replica_urls.split(",") if url.strip())
+    ]
+)
+# Keyed by the Authorization header: the client that just wrote is the one that must not
+# read a replica that has not replayed the write yet.
+primary_pins = TTLCache("primary_pins", settings.auth_cache_size, settings.db_read_your_writes_s)
+PRIMARY_PIN_COOKIE = "primary_until"
+
+
+def pin_to_primary(request: Request, response: Response):
+    window = settings.db_read_your_writes_s
+    if not replicas.engines or window <= 0:
+        return
+    authorization = request.headers.get("authorization")
+    if authorization:
+        primary_pins.set(authorization, True)
+    # The cookie carries the pin to other workers, whose in-process pins never saw the write.
+    response.set_cookie(
+        PRIMARY_PIN_COOKIE, str(math.ceil(time.time() + window)), max_age=math.ceil(window), httponly=True, samesite="lax"
+    )
+
+
+def pinned_to_primary(request: Request) -> bool:
+    authorization = request.headers.get("authorization")
+    if authorization and primary_pins.get(authorization):
+        return True
+    try:
+        return float(request.cookies.get(PRIMARY_PIN_COOKIE, "0")) > time.time()
+    except ValueError:
+        return False
+
+
+def read_engine(request: Request) -> AsyncEngine:
+    if pinned_to_primary(request):
+        return async_engine
+    return replicas.pick() or async_engine
+
+
+def pool_status(engine: Engine) -> dict[str, int]:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+
+
+def pool_sizing(workers: int | None = None) -> dict[str, Any]:
+    # Request handlers only use the async pool; the sync pool serves startup and the
+    # scheduler, which the reserved connections are meant to cover.
+    workers = max(workers or settings.web_concurrency, 1)
+    available = settings.db_max_connections - settings.db_reserved_connections
+    per_worker_budget = max(available // workers, 1)
+    configured_per_worker = settings.db_pool_size + settings.db_max_overflow
+    suggested_pool_size = max(per_worker_budget * 2 // 3, 1)
+    return {
+        "workers": workers,
+        "db_max_connections": settings.db_max_connections,
+        "reserved_connections": settings.db_reserved_connections,
+        "per_worker_budget": per_worker_budget,
+        "configured_per_worker": configured_per_worker,
+        "configured_total": configured_per_worker * workers,
+        "fits": configured_per_worker * workers <= available,
+        "suggested_pool_size": suggested_pool_size,
+        "suggested_max_overflow": max(per_worker_budget - suggested_pool_size, 0),
+    }
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db(request: Request):
+    # For read-only handlers: a healthy replica unless this client just wrote.
+    async with AsyncSessionLocal(bind=read_engine(request)) as db:
+        yield db
@@ -1,17 +1,36 @@
+import asyncio
 import logging
+import random
 import time
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
 from backend.config import settings
-from backend.database import Base, engine
+from backend.database import Base, async_engine, engine, pin_to_primary, pool_sizing, replicas
 from backend.routers.admin import router as admin_router
 from backend.routers.auth import router as auth_router
+from backend.routers.chat import router as chat_router
 from backend.routers.leave import router as leave_router
+from backend.services.http_pool import close_clients
+from backend.services.metrics import (
+    RequestStats,
+    http_in_flight,
+    http_latency,
+    http_requests,
+    render_metrics,
+    request_db_queries,
+    request_db_time,
+    request_stats,
+)
+from backend.services.passwords import hash_pool
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("leave-app")
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
 
 app = FastAPI(title=settings.app_name, version="1.0.0")
 
@@ -25,28 +44,103 @@ app.add_middleware(
 
 
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
+async def observe_requests(request: Request, call_next):
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    http_in_flight.inc()
     start = time.perf_counter()
+    status_code = 500
     try:
         response = await call_next(request)
+        status_code = response.status_code
+        return response
     except Exception:
         logger.exception("Unhandled error: %s %s", request.method, request.url.path)
         raise
-    duration_ms = (time.perf_counter() - start) * 1000
-    logger.info("%s %s -> %s (%.2f ms)", request.method, request.url.path, response.status_code, duration_ms)
+    finally:
+        duration_s = time.perf_counter() - start
+        http_in_flight.dec()
+        request_stats.reset(token)
+        route = request.scope.get("route")
+        template = getattr(route, "path", "unmatched")
+        http_requests.inc(request.method, template, str(status_code))
+        http_latency.observe(duration_s, request.method, template)
+        request_db_queries.observe(stats.db_queries, template)
+        request_db_time.observe(stats.db_seconds, template)
+        if status_code >= 500 or random.random() < settings.request_log_sample_rate:
+            logger.info(
+                "%s %s -> %s (%.2f ms, %d queries, %.2f ms db)",
+                request.method,
+                request.url.path,
+                status_code,
+                duration_s * 1000,
+                stats.db_queries,
+                stats.db_seconds * 1000,
+            )
+
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in READ_METHODS and response.status_code < 400:
+        pin_to_primary(request, response)
     return response
 
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    logger.warning("DB pool exhausted: %s %s", request.method, request.url.path)
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, retry shortly"}, headers={"Retry-After": "1"})
+
+
 @app.on_event("startup")
-def on_startup():
-    Base.metadata.create_all(bind=engine)
+async def on_startup():
+    await asyncio.to_thread(Base.metadata.create_all, bind=engine)
+    # Open and validate one pooled connection now instead of on the first request.
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    if replicas.engines:
+        await replicas.check()
+        logger.info("Read replicas: %s of %s healthy", len(replicas.healthy), len(replicas.engines))
+        app.state.replica_checks = asyncio.create_task(replicas.run_checks())
+
+    sizing = pool_sizing()
+    if not sizing["fits"]:
+        logger.warning(
+            "DB pools can open %s connections across %s workers but only %s are available; "
+            "try DB_POOL_SIZE=%s DB_MAX_OVERFLOW=%s",
+            sizing["configured_total"],
+            sizing["workers"],
+            sizing["db_max_connections"] - sizing["reserved_connections"],
+            sizing["suggested_pool_size"],
+            sizing["suggested_max_overflow"],
+        )
+    else:
+        logger.info("DB pool sizing: %s", sizing)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    hash_pool.shutdown()
+    await close_clients()
+    checks = getattr(app.state, "replica_checks", None)
+    if checks is not None:
+        checks.cancel()
+    await replicas.dispose()
+    await async_engine.dispose()
 
 
 app.include_router(auth_router)
 app.include_router(leave_router)
 app.include_router(admin_router)
+app.include_router(chat_router)
 
 
 @app.get("/healthz")
 def health_check() -> dict[str, str]:
     return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,7 +1,22 @@
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import Boolean, Column, DateTime, Enum as SQLEnum, Float, ForeignKey, Integer, Numeric, String, Text, UniqueConstraint
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Enum as SQLEnum,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    event,
+)
 from sqlalchemy.orm import relationship
 
 from backend.database import Base
@@ -21,6 +36,25 @@ class RecordType(str, Enum):
     EARLY = "EARLY"
 
 
+class DayPart(str, Enum):
+    AM = "AM"
+    PM = "PM"
+    FULL = "FULL"
+
+
+class JobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+
+class JobTrigger(str, Enum):
+    SCHEDULE = "SCHEDULE"
+    CATCHUP = "CATCHUP"
+    MANUAL = "MANUAL"
+
+
 class TransactionSource(str, Enum):
     MONTHLY_ACCRUAL = "MONTHLY_ACCRUAL"
     LEAVE_USED = "LEAVE_USED"
@@ -30,27 +64,56 @@ class TransactionSource(str, Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Newest-first keyset paging for the admin user list.
+        Index("ix_users_created_id", "created_at", "id"),
+        # Substring search.
+        Index(
+            "ix_users_username_trgm", "username", postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+        # Prefix search: LIKE 'q%' can only use a b-tree that compares bytes, and the unique
+        # index follows the database collation.
+        Index("ix_users_username_pattern", "username", postgresql_ops={"username": "varchar_pattern_ops"}).ddl_if(
+            dialect="postgresql"
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(80), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
     role = Column(SQLEnum(UserRole), nullable=False, default=UserRole.USER)
-    leave_balance = Column(Numeric(8, 2), nullable=False, default=0)
+    leave_balance = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
 
     leave_records = relationship("LeaveRecord", back_populates="user")
 
 
+event.listen(User.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+
+
 class LeaveRecord(Base):
     __tablename__ = "leave_records"
+    __table_args__ = (
+        Index("ix_leave_records_user_deleted_start", "user_id", "deleted_at", "start_datetime", "id"),
+        Index("ix_leave_records_deleted_start", "deleted_at", "start_datetime", "id"),
+        # Lets the admin GROUP BY reports run as index-only scans on Postgres.
+        Index(
+            "ix_leave_records_report",
+            "deleted_at",
+            "start_datetime",
+            "user_id",
+            "record_type",
+            postgresql_include=["total_leave_days", "minutes"],
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     record_type = Column(SQLEnum(RecordType), nullable=False)
     start_datetime = Column(DateTime, nullable=False)
     end_datetime = Column(DateTime, nullable=False)
-    total_leave_days = Column(Float, default=0, nullable=False)
+    total_leave_days = Column(Integer, default=0, nullable=False)
     minutes = Column(Integer, nullable=True)
     note = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -60,15 +123,99 @@ class LeaveRecord(Base):
     user = relationship("User", back_populates="leave_records")
 
 
+class LeaveDay(Base):
+    __tablename__ = "leave_days"
+    __table_args__ = (
+        UniqueConstraint("record_id", "day", name="uq_leave_days_record_day"),
+        Index("ix_leave_days_day_user", "day", "user_id"),
+        Index("ix_leave_days_user_day", "user_id", "day"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_id = Column(Integer, ForeignKey("leave_records.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    part = Column(SQLEnum(DayPart), nullable=False)
+
+
+class UserLeaveSummary(Base):
+    __tablename__ = "user_leave_summary"
+    __table_args__ = (UniqueConstraint("user_id", "year", "month", "record_type", name="uq_leave_summary_bucket"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    record_type = Column(SQLEnum(RecordType), nullable=False)
+    days = Column(Integer, default=0, nullable=False)
+    minutes = Column(Integer, default=0, nullable=False)
+
+
 class LeaveTransaction(Base):
     __tablename__ = "leave_transactions"
+    # Point-in-time balances read a user's tail of transactions after a checkpoint.
+    __table_args__ = (Index("ix_leave_transactions_user_created", "user_id", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    change_amount = Column(Float, nullable=False)
-    balance_after = Column(Float, nullable=False)
+    change_amount = Column(Integer, nullable=False)
+    balance_after = Column(Integer, nullable=False)
+    source = Column(SQLEnum(TransactionSource), nullable=False)
+    reference_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Archive tables hold rows moved out of the hot tables by services/archive.py. On Postgres they
+# are range-partitioned by year (partitions are created as rows arrive), so the primary key
+# carries the partition column; ids are the original ones.
+class LeaveRecordArchive(Base):
+    __tablename__ = "leave_records_archive"
+    __table_args__ = (
+        Index("ix_leave_records_archive_user_start", "user_id", "start_datetime"),
+        {"postgresql_partition_by": "RANGE (start_datetime)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    start_datetime = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    record_type = Column(SQLEnum(RecordType), nullable=False)
+    end_datetime = Column(DateTime, nullable=False)
+    total_leave_days = Column(Integer, default=0, nullable=False)
+    minutes = Column(Integer, nullable=True)
+    note = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    deleted_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class LeaveTransactionArchive(Base):
+    __tablename__ = "leave_transactions_archive"
+    __table_args__ = (
+        Index("ix_leave_transactions_archive_user_created", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_at = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    change_amount = Column(Integer, nullable=False)
+    balance_after = Column(Integer, nullable=False)
     source = Column(SQLEnum(TransactionSource), nullable=False)
     reference_id = Column(Integer, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+
+class BalanceCheckpoint(Base):
+    __tablename__ = "balance_checkpoints"
+    # The unique constraint doubles as the (user_id, as_of) lookup index.
+    __table_args__ = (UniqueConstraint("user_id", "as_of", name="uq_balance_checkpoint"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Balance after every transaction created strictly before as_of (UTC).
+    as_of = Column(DateTime, nullable=False)
+    balance = Column(Integer, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
@@ -81,3 +228,35 @@ class SystemJob(Base):
     run_month = Column(Integer, nullable=False)
     run_year = Column(Integer, nullable=False)
     executed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class VersionCounter(Base):
+    __tablename__ = "version_counters"
+
+    scope = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+
+
+class JobRun(Base):
+    __tablename__ = "job_runs"
+    __table_args__ = (Index("ix_job_runs_job_scheduled", "job_name", "scheduled_for"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String(100), nullable=False)
+    scheduled_for = Column(DateTime, nullable=False)
+    trigger = Column(SQLEnum(JobTrigger), nullable=False)
+    status = Column(SQLEnum(JobStatus), nullable=False, default=JobStatus.RUNNING)
+    holder = Column(String(200), nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    duration_s = Column(Float, nullable=True)
+    rows = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+
+class JobLease(Base):
+    __tablename__ = "job_leases"
+
+    name = Column(String(100), primary_key=True)
+    holder = Column(String(200), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -1,83 +1,380 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from datetime import date, timedelta
+from typing import Literal
 
-from backend.auth import hash_password, require_admin
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth import invalidate_cached_user, require_admin
 from backend.config import settings
-from backend.database import get_db
-from backend.models import LeaveRecord, TransactionSource, User, UserRole
+from backend.database import async_engine, engine, get_async_db, get_read_db, pool_sizing, pool_status, read_engine, replicas
+from backend.models import LeaveRecord, TransactionSource, User, UserLeaveSummary, UserRole
 from backend.schemas import (
     AdminCreateUserRequest,
     AdminPatchUserRequest,
     AdjustLeaveRequest,
+    AdjustLeaveResponse,
+    AdminSummaryResponse,
+    AdminSummaryRow,
+    BalanceAtResponse,
+    BalanceAtRow,
+    DayAmount,
+    JobOut,
+    JobRunOut,
+    LeaveImportResponse,
+    MonthUsageReport,
     PaginatedLeaveResponse,
+    PaginatedUserResponse,
+    TypeUsageReport,
     UserOut,
+    UserUsageReport,
+)
+from backend.services.cache import cache_stats
+from backend.services.export import (
+    EXPORT_FORMATS,
+    deleted_records_export_query,
+    export_rows,
+    records_export_query,
+    transactions_export_query,
 )
-from backend.services.leave import apply_balance_change
+from backend.services.jobs import JOBS, Job, job_overview, recent_runs, request_run, worker_id
+from backend.services.ledger import balances_at, local_day_start
+from backend.services.leave import apply_balance_change, vn_now
+from backend.services.leave_calendar import invalidate_months
+from backend.services.leave_import import import_leave_rows, parse_import_file, prepare_import_rows
+from backend.services.metrics import slowest_statements
+from backend.services.pagination import count_rows, keyset_paginate, should_count
+from backend.services.passwords import hash_password_async
+from backend.services.reports import cached_report, usage_by_month, usage_by_type, usage_by_user
+from backend.services.users import user_list_query
+from backend.services.versions import ALL_SCOPE, RECORDS_SCOPE, USERS_SCOPE, bump_versions, conditional_get, user_scope
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
+async def get_user_or_404(db: AsyncSession, user_id: int) -> User:
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
+
+
 @router.post("/users", response_model=UserOut)
-def create_user(payload: AdminCreateUserRequest, _: User = Depends(require_admin), db: Session = Depends(get_db)):
-    exists = db.query(User).filter(User.username == payload.username).first()
+async def create_user(payload: AdminCreateUserRequest, _: User = Depends(require_admin), db: AsyncSession = Depends(get_async_db)):
+    exists = await db.scalar(select(User).where(User.username == payload.username))
     if exists:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
 
     user = User(
         username=payload.username,
-        password_hash=hash_password(payload.password),
+        password_hash=await hash_password_async(payload.password),
         role=UserRole(payload.role),
-        leave_balance=payload.leave_balance,
+        leave_balance=0,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.flush()
+    # The starting balance is a ledger entry like any other, so balance-at-date queries and
+    # the ledger check see it.
+    if payload.leave_balance:
+        await db.run_sync(apply_balance_change, user, payload.leave_balance, TransactionSource.ADMIN_ADJUST, None)
+    await db.run_sync(bump_versions, user_scope(user.id), USERS_SCOPE)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
-@router.get("/users", response_model=list[UserOut])
-def get_users(_: User = Depends(require_admin), db: Session = Depends(get_db)):
-    return db.query(User).order_by(User.created_at.desc()).all()
+@router.get("/users", response_model=PaginatedUserResponse)
+async def get_users(
+    request: Request,
+    response: Response,
+    q: str | None = Query(default=None, min_length=1, max_length=80),
+    match: Literal["prefix", "contains"] = Query(default="prefix"),
+    role: UserRole | None = Query(default=None),
+    is_active: bool | None = Query(default=None),
+    min_balance: DayAmount | None = Query(default=None),
+    max_balance: DayAmount | None = Query(default=None),
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=settings.page_size_default, ge=1, le=settings.page_size_max),
+    cursor: str | None = Query(default=None),
+    include_total: bool | None = Query(default=None),
+    _: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    not_modified = await conditional_get(request, response, db, USERS_SCOPE, ALL_SCOPE)
+    if not_modified:
+        return not_modified
+    stmt = user_list_query(q, match, role, is_active, min_balance, max_balance, dialect=db.get_bind().dialect.name)
+    total = await count_rows(db, stmt) if should_count(include_total, cursor) else None
+    # Plain rows of the listed columns: no ORM identity map, relationships or password hashes.
+    items, next_cursor = await keyset_paginate(db, stmt, [User.created_at, User.id], page, page_size, cursor, scalars=False)
+    return PaginatedUserResponse(
+        items=[UserOut.model_validate(row) for row in items], total=total, page=page, page_size=page_size, next_cursor=next_cursor
+    )
 
 
 @router.patch("/users/{user_id}", response_model=UserOut)
-def patch_user(user_id: int, payload: AdminPatchUserRequest, _: User = Depends(require_admin), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+async def patch_user(
+    user_id: int, payload: AdminPatchUserRequest, _: User = Depends(require_admin), db: AsyncSession = Depends(get_async_db)
+):
+    user = await get_user_or_404(db, user_id)
 
     if payload.is_active is not None:
         user.is_active = payload.is_active
     if payload.role is not None:
         user.role = UserRole(payload.role)
-    if payload.leave_balance is not None:
-        user.leave_balance = payload.leave_balance
+    if payload.leave_balance is not None and payload.leave_balance != user.leave_balance:
+        # Setting a balance is recorded as the adjustment that gets there.
+        await db.run_sync(
+            apply_balance_change, user, payload.leave_balance - user.leave_balance, TransactionSource.ADMIN_ADJUST, None
+        )
     if payload.reset_password:
-        user.password_hash = hash_password(payload.reset_password)
+        user.password_hash = await hash_password_async(payload.reset_password)
 
-    db.commit()
-    db.refresh(user)
+    await db.run_sync(bump_versions, user_scope(user.id), USERS_SCOPE)
+    await db.commit()
+    invalidate_cached_user(user.username)
+    await db.refresh(user)
     return user
 
 
-@router.post("/adjust-leave")
-def adjust_leave(payload: AdjustLeaveRequest, _: User = Depends(require_admin), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == payload.user_id).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    apply_balance_change(db, user, payload.change_amount, TransactionSource.ADMIN_ADJUST, None)
-    db.commit()
-    return {"message": "Leave adjusted", "balance": float(user.leave_balance)}
+@router.post("/adjust-leave", response_model=AdjustLeaveResponse)
+async def adjust_leave(payload: AdjustLeaveRequest, _: User = Depends(require_admin), db: AsyncSession = Depends(get_async_db)):
+    user = await get_user_or_404(db, payload.user_id)
+    await db.run_sync(apply_balance_change, user, payload.change_amount, TransactionSource.ADMIN_ADJUST, None)
+    await db.run_sync(bump_versions, USERS_SCOPE)
+    await db.commit()
+    invalidate_cached_user(user.username)
+    return AdjustLeaveResponse(message="Leave adjusted", balance=user.leave_balance)
+
+
+@router.get("/balances", response_model=BalanceAtResponse)
+async def balances_on(
+    on: date | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    _: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    on = on or vn_now().date()
+    cutoff = local_day_start(on + timedelta(days=1))
+    rows = await db.run_sync(balances_at, cutoff, None if user_id is None else [user_id])
+    items = [BalanceAtRow(user_id=row_id, username=username, balance=balance) for row_id, username, balance in rows]
+    return BalanceAtResponse(on=on, cutoff=cutoff, items=items)
+
+
+@router.get("/summary", response_model=AdminSummaryResponse)
+async def leave_summary(
+    year: int | None = Query(default=None, ge=2000, le=2100),
+    month: int | None = Query(default=None, ge=1, le=12),
+    user_id: int | None = Query(default=None),
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=settings.page_size_default, ge=1, le=settings.page_size_max),
+    _: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    year = year or vn_now().year
+    filters = [UserLeaveSummary.year == year]
+    if month is not None:
+        filters.append(UserLeaveSummary.month == month)
+    if user_id is not None:
+        filters.append(UserLeaveSummary.user_id == user_id)
+    stmt = (
+        select(
+            User.id,
+            User.username,
+            UserLeaveSummary.record_type,
+            func.sum(UserLeaveSummary.days),
+            func.sum(UserLeaveSummary.minutes),
+        )
+        .join(User, User.id == UserLeaveSummary.user_id)
+        .where(*filters)
+        .group_by(User.id, User.username, UserLeaveSummary.record_type)
+        .having((func.sum(UserLeaveSummary.days) != 0) | (func.sum(UserLeaveSummary.minutes) != 0))
+        .order_by(User.username, UserLeaveSummary.record_type)
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+    items = [
+        AdminSummaryRow(user_id=row[0], username=row[1], record_type=row[2].value, days=row[3], minutes=row[4])
+        for row in (await db.execute(stmt)).all()
+    ]
+    return AdminSummaryResponse(year=year, month=month, items=items, page=page, page_size=page_size)
+
+
+@router.get("/reports/by-user", response_model=UserUsageReport)
+async def report_by_user(
+    start: date | None = Query(default=None),
+    end: date | None = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=1000),
+    _: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    rows = await cached_report(("by-user", start, end, limit), lambda: usage_by_user(db, start, end, limit))
+    return UserUsageReport(start=start, end=end, rows=rows)
+
+
+@router.get("/reports/by-type", response_model=TypeUsageReport)
+async def report_by_type(
+    start: date | None = Query(default=None),
+    end: date | None = Query(default=None),
+    _: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    rows = await cached_report(("by-type", start, end), lambda: usage_by_type(db, start, end))
+    return TypeUsageReport(start=start, end=end, rows=rows)
+
+
+@router.get("/reports/by-month", response_model=MonthUsageReport)
+async def report_by_month(
+    start: date | None = Query(default=None),
+    end: date | None = Query(default=None),
+    _: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_read_db),
+):
+    rows = await cached_report(("by-month", start, end), lambda: usage_by_month(db, start, end))
+    return MonthUsageReport(start=start, end=end, rows=rows)
+
+
+def export_response(request: Request, name: str, stmt, fmt: str, gzip: bool) -> StreamingResponse:
+    filename = f"{name}.{fmt}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_rows(stmt, fmt, gzip, read_engine(request)),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/export/records")
+async def export_records(
+    request: Request,
+    format: Literal["csv", "ndjson"] = Query(default="csv"),
+    start: date | None = Query(default=None),
+    end: date | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    gzip: bool = Query(default=False),
+    _: User = Depends(require_admin),
+):
+    return export_response(request, "leave_records", records_export_query(start, end, user_id), format, gzip)
+
+
+@router.get("/export/deleted-records")
+async def export_deleted_records(
+    request: Request,
+    format: Literal["csv", "ndjson"] = Query(default="csv"),
+    start: date | None = Query(default=None),
+    end: date | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    gzip: bool = Query(default=False),
+    _: User = Depends(require_admin),
+):
+    return export_response(request, "deleted_leave_records", deleted_records_export_query(start, end, user_id), format, gzip)
+
+
+@router.get("/export/transactions")
+async def export_transactions(
+    request: Request,
+    format: Literal["csv", "ndjson"] = Query(default="csv"),
+    start: date | None = Query(default=None),
+    end: date | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    include_archived: bool = Query(default=False),
+    gzip: bool = Query(default=False),
+    _: User = Depends(require_admin),
+):
+    stmt = transactions_export_query(start, end, user_id, include_archived)
+    return export_response(request, "leave_transactions", stmt, format, gzip)
+
+
+@router.post("/import/leave", response_model=LeaveImportResponse)
+async def import_leave(
+    file: UploadFile = File(...),
+    dry_run: bool = Form(default=False),
+    charge_balance: bool = Form(default=True),
+    _: User = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Parsing and per-row validation are pure CPU and take seconds on large uploads, so they
+    # run off the event loop; run_sync is left with the user lookups and chunked writes.
+    rows = await run_in_threadpool(parse_import_file, await file.read(), file.filename)
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No rows in upload")
+    prepared = await run_in_threadpool(prepare_import_rows, rows)
+    result = await db.run_sync(import_leave_rows, prepared, dry_run, charge_balance)
+    for username in result["charged_users"]:
+        invalidate_cached_user(username)
+    invalidate_months(result.pop("months"))
+    return result
+
+
+@router.get("/cache-stats")
+async def get_cache_stats(_: User = Depends(require_admin)):
+    return cache_stats()
+
+
+@router.get("/db-pool")
+async def get_db_pool(limit: int = Query(default=10, ge=1, le=100), _: User = Depends(require_admin)):
+    return {
+        "pools": {"async": pool_status(async_engine.sync_engine), "sync": pool_status(engine)},
+        "replicas": replicas.status(),
+        "config": {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout_s": settings.db_pool_timeout_s,
+            "pool_recycle_s": settings.db_pool_recycle_s,
+            "pre_ping": settings.db_pre_ping,
+        },
+        "sizing": pool_sizing(),
+        "slowest_statements": slowest_statements(limit),
+    }
+
+
+@router.get("/jobs", response_model=list[JobOut])
+async def list_jobs(_: User = Depends(require_admin), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(job_overview)
+
+
+def get_job_or_404(name: str) -> Job:
+    job = JOBS.get(name)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{name}/runs", response_model=list[JobRunOut])
+async def list_job_runs(
+    name: str, limit: int = Query(default=20, ge=1, le=200), _: User = Depends(require_admin), db: AsyncSession = Depends(get_async_db)
+):
+    get_job_or_404(name)
+    return await db.run_sync(recent_runs, name, limit)
+
+
+@router.post("/jobs/{name}/run", response_model=JobRunOut, status_code=status.HTTP_202_ACCEPTED)
+async def run_job_now(name: str, admin: User = Depends(require_admin), db: AsyncSession = Depends(get_async_db)):
+    # Only queues the run: the scheduler worker picks it up on its next tick, so a long job
+    # never ties up the API. Poll /jobs/{name}/runs for the outcome.
+    job = get_job_or_404(name)
+    run = await db.run_sync(request_run, job, worker_id(f"api:{admin.username}"))
+    if run is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Job is already queued or running")
+    return run
 
 
 @router.get("/all-records", response_model=PaginatedLeaveResponse)
-def all_records(
+async def all_records(
+    request: Request,
+    response: Response,
     page: int = Query(default=1, ge=1),
     page_size: int = Query(default=settings.page_size_default, ge=1, le=settings.page_size_max),
+    cursor: str | None = Query(default=None),
+    include_total: bool | None = Query(default=None),
     _: User = Depends(require_admin),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    q = db.query(LeaveRecord).filter(LeaveRecord.deleted_at.is_(None))
-    total = q.count()
-    items = q.order_by(LeaveRecord.start_datetime.desc()).offset((page - 1) * page_size).limit(page_size).all()
-    return PaginatedLeaveResponse(items=items, total=total, page=page, page_size=page_size)
+    not_modified = await conditional_get(request, response, db, RECORDS_SCOPE)
+    if not_modified:
+        return not_modified
+    stmt = select(LeaveRecord).where(LeaveRecord.deleted_at.is_(None))
+    total = await count_rows(db, stmt) if should_count(include_total, cursor) else None
+    items, next_cursor = await keyset_paginate(db, stmt, [LeaveRecord.start_datetime, LeaveRecord.id], page, page_size, cursor)
+    return PaginatedLeaveResponse(items=items, total=total, page=page, page_size=page_size, next_cursor=next_cursor)
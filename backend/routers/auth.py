@@ -1,50 +1,92 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import math
 
-from backend.auth import create_access_token, get_current_user, hash_password, verify_password
-from backend.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth import create_access_token, get_current_user
+from backend.database import get_async_db
 from backend.models import User, UserRole
 from backend.schemas import ChangePasswordRequest, LoginRequest, RegisterRequest, TokenResponse, UserOut
+from backend.services.passwords import (
+    forget_failed_logins,
+    hash_password_async,
+    login_retry_after,
+    remember_failed_login,
+    verify_and_update_password_async,
+    verify_password_async,
+)
+from backend.services.versions import ALL_SCOPE, USERS_SCOPE, bump_versions, conditional_get, user_scope
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
 @router.post("/register", response_model=TokenResponse)
-def register(payload: RegisterRequest, db: Session = Depends(get_db)):
-    exists = db.query(User).filter(User.username == payload.username).first()
+async def register(payload: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
+    exists = await db.scalar(select(User).where(User.username == payload.username))
     if exists:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists")
 
-    user = User(username=payload.username, password_hash=hash_password(payload.password), role=UserRole.USER, leave_balance=0)
+    user = User(
+        username=payload.username,
+        password_hash=await hash_password_async(payload.password),
+        role=UserRole.USER,
+        leave_balance=0,
+    )
     db.add(user)
-    db.commit()
+    await db.flush()
+    await db.run_sync(bump_versions, user_scope(user.id), USERS_SCOPE)
+    await db.commit()
     token = create_access_token(payload.username)
     return TokenResponse(access_token=token)
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == payload.username).first()
-    if not user or not verify_password(payload.password, user.password_hash):
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.username == payload.username))
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    retry_after = login_retry_after(user.username, user.password_hash)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed logins",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    verified, new_hash = await verify_and_update_password_async(payload.password, user.password_hash)
+    if not verified:
+        remember_failed_login(user.username, user.password_hash)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    forget_failed_logins(user.username, user.password_hash)
     if not user.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is disabled")
+    if new_hash:
+        user.password_hash = new_hash
+        await db.commit()
     return TokenResponse(access_token=create_access_token(user.username))
 
 
 @router.get("/me", response_model=UserOut)
-def me(current_user: User = Depends(get_current_user)):
+async def me(
+    request: Request, response: Response, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)
+):
+    not_modified = await conditional_get(request, response, db, user_scope(current_user.id), ALL_SCOPE)
+    if not_modified:
+        return not_modified
+    await db.refresh(current_user, ["role", "leave_balance", "is_active"])
     return current_user
 
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     payload: ChangePasswordRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    if not verify_password(payload.old_password, current_user.password_hash):
+    await db.refresh(current_user, ["password_hash"])
+    if not await verify_password_async(payload.old_password, current_user.password_hash):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Old password incorrect")
-    current_user.password_hash = hash_password(payload.new_password)
-    db.commit()
+    current_user.password_hash = await hash_password_async(payload.new_password)
+    await db.commit()
     return {"message": "Password updated"}
@@ -1,38 +1,61 @@
 import asyncio
+import json
+from collections.abc import AsyncIterator
+from typing import Any
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi.responses import StreamingResponse
 
+from backend.auth import get_current_user
 from backend.config import QWEN_TIMEOUT_S, VLLM_TIMEOUT_S
-from backend.schemas import BotConfig, BotResult, CompareRequest, CompareResponse
-from backend.services.qwen_client import call_qwen_api
-from backend.services.vllm_client import call_vllm
+from backend.models import User
+from backend.schemas import BatchCompareRequest, BotConfig, BotResult, CompareRequest, CompareResponse
+from backend.services.chat_batch import load_results, make_job_id, parse_questions_jsonl, result_path, run_batch, summarize
+from backend.services.chat_cache import cached_call
+from backend.services.chat_stream import error_stream, multiplex
+from backend.services.metrics import chat_latency
+from backend.services.qwen_client import call_qwen_api, stream_qwen_api
+from backend.services.timer import elapsed_ms, start_timer
+from backend.services.vllm_client import call_vllm, stream_vllm, vllm_endpoint
 
 
-router = APIRouter(prefix="/chat", tags=["chat"])
+# Every route makes outbound calls on the server's behalf, so none of them are anonymous.
+router = APIRouter(prefix="/chat", tags=["chat"], dependencies=[Depends(get_current_user)])
 
 
-async def dispatch_bot(bot: BotConfig, question: str, side: str) -> BotResult:
+def check_endpoints(*bots: BotConfig):
+    # Refused up front, before any stream starts; the clients also refuse unlisted endpoints.
+    for bot in bots:
+        if bot.type == "vllm" and bot.endpoint and vllm_endpoint(bot) is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="vLLM endpoint is not in CHAT_VLLM_ENDPOINTS")
+
+
+async def dispatch_bot(bot: BotConfig, question: str, side: str, bypass_cache: bool = False) -> BotResult:
+    start_time = start_timer()
     if bot.type == "vllm":
-        result = await call_vllm(bot, question, VLLM_TIMEOUT_S)
-        return result.model_copy(update={"side": side})
-    if bot.type == "qwen_api":
-        result = await call_qwen_api(bot, question, QWEN_TIMEOUT_S)
-        return result.model_copy(update={"side": side})
-    return BotResult(
-        side=side,
-        bot_name=bot.name,
-        model=bot.model,
-        answer="",
-        latency_ms=0,
-        provider=bot.type,
-        error=f"Unsupported bot type: {bot.type}.",
-    )
+        result = await cached_call(bot, question, lambda: call_vllm(bot, question, VLLM_TIMEOUT_S), bypass_cache)
+    elif bot.type == "qwen_api":
+        result = await cached_call(bot, question, lambda: call_qwen_api(bot, question, QWEN_TIMEOUT_S), bypass_cache)
+    else:
+        return BotResult(
+            side=side,
+            bot_name=bot.name,
+            model=bot.model,
+            answer="",
+            latency_ms=0,
+            provider=bot.type,
+            error=f"Unsupported bot type: {bot.type}.",
+        )
+    outcome = "error" if result.error else "cached" if result.cached else "ok"
+    chat_latency.observe(elapsed_ms(start_time) / 1000, bot.type, outcome)
+    return result.model_copy(update={"side": side})
 
 
 @router.post("/compare", response_model=CompareResponse)
 async def compare_chat(payload: CompareRequest) -> CompareResponse:
-    left_task = dispatch_bot(payload.left_bot, payload.question, "left")
-    right_task = dispatch_bot(payload.right_bot, payload.question, "right")
+    check_endpoints(payload.left_bot, payload.right_bot)
+    left_task = dispatch_bot(payload.left_bot, payload.question, "left", payload.bypass_cache)
+    right_task = dispatch_bot(payload.right_bot, payload.question, "right", payload.bypass_cache)
 
     left_result, right_result = await asyncio.gather(left_task, right_task)
 
@@ -40,3 +63,84 @@ async def compare_chat(payload: CompareRequest) -> CompareResponse:
         question=payload.question,
         results=[left_result, right_result],
     )
+
+
+def stream_bot(bot: BotConfig, question: str, side: str) -> AsyncIterator[dict[str, Any]]:
+    if bot.type == "vllm":
+        return stream_vllm(bot, question, VLLM_TIMEOUT_S, side)
+    if bot.type == "qwen_api":
+        return stream_qwen_api(bot, question, QWEN_TIMEOUT_S, side)
+    return error_stream(bot, side, bot.type, f"Unsupported bot type: {bot.type}.")
+
+
+async def compare_events(payload: CompareRequest) -> AsyncIterator[str]:
+    stats: dict[str, dict[str, Any]] = {}
+    left_stream = stream_bot(payload.left_bot, payload.question, "left")
+    right_stream = stream_bot(payload.right_bot, payload.question, "right")
+    async for event in multiplex(left_stream, right_stream):
+        if event["type"] == "stats":
+            stats[event["side"]] = event["stats"].model_dump()
+            continue
+        yield json.dumps(event) + "\n"
+    yield json.dumps({"type": "done", "question": payload.question, "results": [stats.get("left"), stats.get("right")]}) + "\n"
+
+
+@router.post("/compare/stream")
+async def compare_chat_stream(payload: CompareRequest) -> StreamingResponse:
+    check_endpoints(payload.left_bot, payload.right_bot)
+    return StreamingResponse(
+        compare_events(payload),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def batch_response(
+    job_id: str, user_id: int, questions: list[str], left_bot: BotConfig, right_bot: BotConfig, bypass_cache: bool
+) -> StreamingResponse:
+    # Reject bad input here: once the StreamingResponse is returned the 200 is already sent.
+    result_path(job_id, user_id)
+    check_endpoints(left_bot, right_bot)
+
+    async def lines():
+        async for event in run_batch(job_id, user_id, questions, left_bot, right_bot, dispatch_bot, bypass_cache):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Batch-Job-Id": job_id},
+    )
+
+
+@router.post("/batch")
+async def batch_compare(payload: BatchCompareRequest, current_user: User = Depends(get_current_user)) -> StreamingResponse:
+    job_id = payload.job_id or make_job_id(payload.questions, payload.left_bot, payload.right_bot)
+    return batch_response(job_id, current_user.id, payload.questions, payload.left_bot, payload.right_bot, payload.bypass_cache)
+
+
+@router.post("/batch/upload")
+async def batch_compare_upload(
+    file: UploadFile = File(...),
+    left_bot: str = Form(...),
+    right_bot: str = Form(...),
+    job_id: str | None = Form(default=None),
+    bypass_cache: bool = Form(default=False),
+    current_user: User = Depends(get_current_user),
+) -> StreamingResponse:
+    if job_id is not None:
+        result_path(job_id, current_user.id)
+    questions = parse_questions_jsonl(await file.read())
+    if not questions:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No questions in upload")
+    left = BotConfig.model_validate_json(left_bot)
+    right = BotConfig.model_validate_json(right_bot)
+    return batch_response(job_id or make_job_id(questions, left, right), current_user.id, questions, left, right, bypass_cache)
+
+
+@router.get("/batch/{job_id}")
+async def batch_status(job_id: str, current_user: User = Depends(get_current_user)) -> dict[str, Any]:
+    path = result_path(job_id, current_user.id)
+    if not path.exists():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch job not found")
+    return {"job_id": job_id, **summarize(load_results(path))}
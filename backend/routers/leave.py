@@ -1,26 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from datetime import date, timedelta
 
-from backend.auth import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.auth import get_current_user, invalidate_cached_user
 from backend.config import settings
-from backend.database import get_db
-from backend.models import LeaveRecord, RecordType, TransactionSource, User
-from backend.schemas import LeaveBalanceResponse, LeaveCreateRequest, LeaveOut, LeaveUpdateRequest, PaginatedLeaveResponse
-from backend.services.leave import apply_balance_change, build_leave_payload, soft_delete_record
+from backend.database import get_async_db, get_read_db
+from backend.models import LeaveRecord, RecordType, TransactionSource, User, UserLeaveSummary
+from backend.schemas import (
+    BalanceAtResponse,
+    BalanceAtRow,
+    LeaveBalanceResponse,
+    LeaveCalendarResponse,
+    LeaveCreateRequest,
+    LeaveOut,
+    LeaveSummaryResponse,
+    LeaveSummaryRow,
+    LeaveUpdateRequest,
+    PaginatedLeaveResponse,
+)
+from backend.services.ledger import balances_at, local_day_start
+from backend.services.leave import apply_balance_change, build_leave_payload, range_halves, soft_delete_record, vn_now
+from backend.services.leave_calendar import (
+    calendar_window,
+    ensure_no_overlap,
+    invalidate_months,
+    remove_record_days,
+    write_record_days,
+)
+from backend.services.pagination import count_rows, keyset_paginate, should_count
+from backend.services.summary import apply_summary_change
+from backend.services.versions import ALL_SCOPE, RECORDS_SCOPE, USERS_SCOPE, bump_versions, conditional_get, user_scope
 
 router = APIRouter(prefix="/leave", tags=["leave"])
 
 
 @router.post("", response_model=LeaveOut)
-def create_leave(payload: LeaveCreateRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_leave(
+    payload: LeaveCreateRequest, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)
+):
     record_type = RecordType(payload.record_type)
     start_dt, end_dt, total_leave_days = build_leave_payload(
         record_type, payload.start_date, payload.end_date, payload.start_half, payload.end_half, payload.minutes
     )
 
-    if total_leave_days > 0:
-        apply_balance_change(db, current_user, -total_leave_days, TransactionSource.LEAVE_USED, None)
-
     record = LeaveRecord(
         user_id=current_user.id,
         record_type=record_type,
@@ -30,78 +54,166 @@ def create_leave(payload: LeaveCreateRequest, current_user: User = Depends(get_c
         minutes=payload.minutes,
         note=payload.note,
     )
+    if total_leave_days > 0:
+        await db.run_sync(apply_balance_change, current_user, -total_leave_days, TransactionSource.LEAVE_USED, None)
+    # Checked after the balance UPDATE: its row lock serializes concurrent requests for the
+    # same user, so the second one sees the first one's days.
+    await db.run_sync(ensure_no_overlap, record)
+
     db.add(record)
-    db.flush()
-    db.commit()
-    db.refresh(record)
+    await db.flush()
+    await db.run_sync(apply_summary_change, record, 1)
+    months = await db.run_sync(write_record_days, record)
+    await db.run_sync(bump_versions, user_scope(current_user.id), USERS_SCOPE, RECORDS_SCOPE)
+    await db.commit()
+    invalidate_cached_user(current_user.username)
+    invalidate_months(months)
+    await db.refresh(record)
     return record
 
 
 @router.get("/my", response_model=PaginatedLeaveResponse)
-def my_leaves(
+async def my_leaves(
+    request: Request,
+    response: Response,
     page: int = Query(default=1, ge=1),
     page_size: int = Query(default=settings.page_size_default, ge=1, le=settings.page_size_max),
+    cursor: str | None = Query(default=None),
+    include_total: bool | None = Query(default=None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
 ):
-    q = db.query(LeaveRecord).filter(LeaveRecord.user_id == current_user.id, LeaveRecord.deleted_at.is_(None))
-    total = q.count()
-    items = q.order_by(LeaveRecord.start_datetime.desc()).offset((page - 1) * page_size).limit(page_size).all()
-    return PaginatedLeaveResponse(items=items, total=total, page=page, page_size=page_size)
+    not_modified = await conditional_get(request, response, db, user_scope(current_user.id))
+    if not_modified:
+        return not_modified
+    stmt = select(LeaveRecord).where(LeaveRecord.user_id == current_user.id, LeaveRecord.deleted_at.is_(None))
+    total = await count_rows(db, stmt) if should_count(include_total, cursor) else None
+    items, next_cursor = await keyset_paginate(db, stmt, [LeaveRecord.start_datetime, LeaveRecord.id], page, page_size, cursor)
+    return PaginatedLeaveResponse(items=items, total=total, page=page, page_size=page_size, next_cursor=next_cursor)
 
 
 @router.get("/balance", response_model=LeaveBalanceResponse)
-def balance(current_user: User = Depends(get_current_user)):
-    return LeaveBalanceResponse(leave_balance=float(current_user.leave_balance))
+async def balance(
+    request: Request, response: Response, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)
+):
+    not_modified = await conditional_get(request, response, db, user_scope(current_user.id), ALL_SCOPE)
+    if not_modified:
+        return not_modified
+    # The user may come from the auth cache; re-read so the body matches the fresh ETag.
+    await db.refresh(current_user, ["leave_balance"])
+    return LeaveBalanceResponse(leave_balance=current_user.leave_balance)
 
 
-@router.put("/{record_id}", response_model=LeaveOut)
-def update_leave(record_id: int, payload: LeaveUpdateRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    record = (
-        db.query(LeaveRecord)
-        .filter(LeaveRecord.id == record_id, LeaveRecord.user_id == current_user.id, LeaveRecord.deleted_at.is_(None))
-        .first()
+@router.get("/balance/at", response_model=BalanceAtResponse)
+async def balance_at(
+    on: date | None = Query(default=None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    on = on or vn_now().date()
+    cutoff = local_day_start(on + timedelta(days=1))
+    rows = await db.run_sync(balances_at, cutoff, [current_user.id])
+    items = [BalanceAtRow(user_id=user_id, username=username, balance=balance) for user_id, username, balance in rows]
+    return BalanceAtResponse(on=on, cutoff=cutoff, items=items)
+
+
+@router.get("/summary", response_model=LeaveSummaryResponse)
+async def my_summary(
+    year: int | None = Query(default=None, ge=2000, le=2100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    year = year or vn_now().year
+    rows = (
+        await db.scalars(
+            select(UserLeaveSummary)
+            .where(UserLeaveSummary.user_id == current_user.id, UserLeaveSummary.year == year)
+            .order_by(UserLeaveSummary.month, UserLeaveSummary.record_type)
+        )
+    ).all()
+    return LeaveSummaryResponse(
+        user_id=current_user.id,
+        year=year,
+        total_days=sum(row.days for row in rows),
+        total_minutes=sum(row.minutes for row in rows),
+        rows=[LeaveSummaryRow.model_validate(row) for row in rows if row.days or row.minutes],
+    )
+
+
+@router.get("/calendar", response_model=LeaveCalendarResponse)
+async def team_calendar(
+    start: date = Query(...),
+    end: date = Query(...),
+    user_ids: list[int] | None = Query(default=None),
+    _: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    days = await db.run_sync(calendar_window, start, end, user_ids)
+    return LeaveCalendarResponse(start=start, end=end, days=days)
+
+
+async def get_own_record(db: AsyncSession, record_id: int, user_id: int) -> LeaveRecord:
+    record = await db.scalar(
+        select(LeaveRecord).where(LeaveRecord.id == record_id, LeaveRecord.user_id == user_id, LeaveRecord.deleted_at.is_(None))
     )
     if not record:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Record not found")
+    return record
+
+
+@router.put("/{record_id}", response_model=LeaveOut)
+async def update_leave(
+    record_id: int,
+    payload: LeaveUpdateRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    record = await get_own_record(db, record_id, current_user.id)
 
     prev_days = record.total_leave_days
+    start_half, end_half = range_halves(record.start_datetime, record.end_datetime)
     start_dt, end_dt, total_leave_days = build_leave_payload(
         record.record_type,
         payload.start_date or record.start_datetime,
         payload.end_date or record.end_datetime,
-        payload.start_half,
-        payload.end_half,
+        payload.start_half or start_half,
+        payload.end_half or end_half,
         payload.minutes or record.minutes,
     )
 
     delta = prev_days - total_leave_days
-    if abs(delta) > 1e-9:
-        apply_balance_change(db, current_user, delta, TransactionSource.ADMIN_ADJUST, record.id)
+    if delta:
+        await db.run_sync(apply_balance_change, current_user, delta, TransactionSource.ADMIN_ADJUST, record.id)
 
+    await db.run_sync(apply_summary_change, record, -1)
     record.start_datetime = start_dt
     record.end_datetime = end_dt
     record.total_leave_days = total_leave_days
     record.minutes = payload.minutes if payload.minutes is not None else record.minutes
     record.note = payload.note if payload.note is not None else record.note
-    db.commit()
-    db.refresh(record)
+    await db.run_sync(ensure_no_overlap, record, record.id)
+    await db.run_sync(apply_summary_change, record, 1)
+    months = await db.run_sync(write_record_days, record)
+    await db.run_sync(bump_versions, user_scope(current_user.id), USERS_SCOPE, RECORDS_SCOPE)
+    await db.commit()
+    invalidate_cached_user(current_user.username)
+    invalidate_months(months)
+    await db.refresh(record)
     return record
 
 
 @router.delete("/{record_id}")
-def delete_leave(record_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    record = (
-        db.query(LeaveRecord)
-        .filter(LeaveRecord.id == record_id, LeaveRecord.user_id == current_user.id, LeaveRecord.deleted_at.is_(None))
-        .first()
-    )
-    if not record:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Record not found")
+async def delete_leave(record_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    record = await get_own_record(db, record_id, current_user.id)
 
     if record.total_leave_days > 0:
-        apply_balance_change(db, current_user, record.total_leave_days, TransactionSource.DELETE_RECORD, record.id)
-
-    soft_delete_record(db, record)
-    db.commit()
+        await db.run_sync(apply_balance_change, current_user, record.total_leave_days, TransactionSource.DELETE_RECORD, record.id)
+
+    await db.run_sync(apply_summary_change, record, -1)
+    months = await db.run_sync(remove_record_days, record.id)
+    await db.run_sync(soft_delete_record, record)
+    await db.run_sync(bump_versions, user_scope(current_user.id), USERS_SCOPE, RECORDS_SCOPE)
+    await db.commit()
+    invalidate_cached_user(current_user.username)
+    invalidate_months(months)
     return {"message": "Record deleted"}
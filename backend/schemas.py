@@ -1,7 +1,14 @@
-from datetime import datetime
-from typing import Literal
+from datetime import date, datetime
+from typing import Annotated, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, BeforeValidator, Field
+
+from backend.units import days_to_units, units_to_days
+
+# Leave quantities are integer hundredths of a day inside the app; these are the only
+# places they turn into (Days, responses) or come from (DayAmount, requests) days.
+Days = Annotated[float, BeforeValidator(units_to_days)]
+DayAmount = Annotated[int, BeforeValidator(days_to_units)]
 
 
 class TokenResponse(BaseModel):
@@ -27,7 +34,7 @@ class UserOut(BaseModel):
     id: int
     username: str
     role: Literal["admin", "user"]
-    leave_balance: float
+    leave_balance: Days
     is_active: bool
     created_at: datetime
 
@@ -45,6 +52,51 @@ class LeaveCreateRequest(BaseModel):
     note: str | None = Field(default=None, max_length=1000)
 
 
+class LeaveImportRow(LeaveCreateRequest):
+    username: str = Field(..., min_length=3, max_length=80)
+
+
+class LeaveImportError(BaseModel):
+    row: int
+    error: str
+
+
+class LeaveImportResponse(BaseModel):
+    dry_run: bool
+    total_rows: int
+    imported: int
+    valid: int
+    failed: int
+    charged_users: list[str]
+    errors: list[LeaveImportError]
+
+
+class JobRunOut(BaseModel):
+    id: int
+    job_name: str
+    scheduled_for: datetime
+    trigger: str
+    status: str
+    holder: str
+    started_at: datetime
+    finished_at: datetime | None
+    duration_s: float | None
+    rows: int
+    error: str | None
+
+    class Config:
+        from_attributes = True
+
+
+class JobOut(BaseModel):
+    name: str
+    schedule: str
+    next_run_at: datetime | None
+    lease_holder: str | None
+    lease_expires_at: datetime | None
+    last_run: JobRunOut | None
+
+
 class LeaveUpdateRequest(BaseModel):
     start_date: datetime | None = None
     end_date: datetime | None = None
@@ -60,7 +112,7 @@ class LeaveOut(BaseModel):
     record_type: str
     start_datetime: datetime
     end_datetime: datetime
-    total_leave_days: float
+    total_leave_days: Days
     minutes: int | None
     note: str | None
     created_at: datetime
@@ -71,35 +123,209 @@ class LeaveOut(BaseModel):
 
 
 class LeaveBalanceResponse(BaseModel):
-    leave_balance: float
+    leave_balance: Days
+
+
+class PaginatedUserResponse(BaseModel):
+    items: list[UserOut]
+    total: int | None
+    page: int
+    page_size: int
+    next_cursor: str | None = None
 
 
 class PaginatedLeaveResponse(BaseModel):
     items: list[LeaveOut]
-    total: int
+    total: int | None
     page: int
     page_size: int
+    next_cursor: str | None = None
+
+
+class LeaveSummaryRow(BaseModel):
+    year: int
+    month: int
+    record_type: str
+    days: Days
+    minutes: int
+
+    class Config:
+        from_attributes = True
+
+
+class LeaveSummaryResponse(BaseModel):
+    user_id: int
+    year: int
+    total_days: Days
+    total_minutes: int
+    rows: list[LeaveSummaryRow]
+
+
+class CalendarAbsence(BaseModel):
+    user_id: int
+    username: str
+    part: Literal["AM", "PM", "FULL"]
+    record_id: int
+
+
+class CalendarDay(BaseModel):
+    date: date
+    absences: list[CalendarAbsence]
+
+
+class LeaveCalendarResponse(BaseModel):
+    start: date
+    end: date
+    days: list[CalendarDay]
+
+
+class AdminSummaryRow(BaseModel):
+    user_id: int
+    username: str
+    record_type: str
+    days: Days
+    minutes: int
+
+
+class AdminSummaryResponse(BaseModel):
+    year: int
+    month: int | None
+    items: list[AdminSummaryRow]
+    page: int
+    page_size: int
+
+
+class UserUsageRow(BaseModel):
+    user_id: int
+    username: str
+    records: int
+    days: Days
+    late_minutes: int
+    early_minutes: int
+
+
+class TypeUsageRow(BaseModel):
+    record_type: str
+    records: int
+    days: Days
+    minutes: int
+
+
+class MonthUsageRow(BaseModel):
+    year: int
+    month: int
+    records: int
+    days: Days
+    late_minutes: int
+    early_minutes: int
+
+
+class UserUsageReport(BaseModel):
+    start: date | None
+    end: date | None
+    rows: list[UserUsageRow]
+
+
+class TypeUsageReport(BaseModel):
+    start: date | None
+    end: date | None
+    rows: list[TypeUsageRow]
+
+
+class MonthUsageReport(BaseModel):
+    start: date | None
+    end: date | None
+    rows: list[MonthUsageRow]
 
 
 class AdminCreateUserRequest(BaseModel):
     username: str = Field(..., min_length=3, max_length=80)
     password: str = Field(..., min_length=6, max_length=120)
     role: Literal["admin", "user"] = "user"
-    leave_balance: float = Field(default=0, ge=0)
+    leave_balance: DayAmount = Field(default=0, ge=0)
 
 
 class AdminPatchUserRequest(BaseModel):
     is_active: bool | None = None
     role: Literal["admin", "user"] | None = None
-    leave_balance: float | None = Field(default=None, ge=0)
+    leave_balance: DayAmount | None = Field(default=None, ge=0)
     reset_password: str | None = Field(default=None, min_length=6, max_length=120)
 
 
 class AdjustLeaveRequest(BaseModel):
     user_id: int
-    change_amount: float
+    change_amount: DayAmount
     note: str | None = None
 
 
+class AdjustLeaveResponse(BaseModel):
+    message: str
+    balance: Days
+
+
+class BalanceAtRow(BaseModel):
+    user_id: int
+    username: str
+    balance: Days
+
+
+class BalanceAtResponse(BaseModel):
+    on: date
+    # Transactions created before this UTC instant (the end of `on`, Vietnam time) count.
+    cutoff: datetime
+    items: list[BalanceAtRow]
+
+
 class MessageResponse(BaseModel):
     message: str
+
+
+class BotConfig(BaseModel):
+    type: str
+    name: str
+    model: str
+    endpoint: str | None = None
+    temperature: float = Field(default=0.7, ge=0, le=2)
+
+
+class BotResult(BaseModel):
+    side: Literal["left", "right"]
+    bot_name: str
+    model: str
+    answer: str
+    latency_ms: float
+    provider: str
+    error: str | None = None
+    cached: bool = False
+
+
+class BotStreamStats(BaseModel):
+    side: Literal["left", "right"]
+    bot_name: str
+    model: str
+    provider: str
+    first_token_ms: float | None
+    latency_ms: float
+    completion_tokens: int
+    tokens_per_s: float
+    error: str | None = None
+
+
+class CompareRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    left_bot: BotConfig
+    right_bot: BotConfig
+    bypass_cache: bool = False
+
+
+class BatchCompareRequest(BaseModel):
+    questions: list[str] = Field(..., min_length=1)
+    left_bot: BotConfig
+    right_bot: BotConfig
+    job_id: str | None = Field(default=None, pattern="^[A-Za-z0-9]{1,64}$")
+    bypass_cache: bool = False
+
+
+class CompareResponse(BaseModel):
+    question: str
+    results: list[BotResult]
@@ -0,0 +1,108 @@
+import logging
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import ColumnElement, Table, delete, func, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.models import BalanceCheckpoint, LeaveRecord, LeaveRecordArchive, LeaveTransaction, LeaveTransactionArchive, SystemJob
+from backend.services.ledger import LEDGER_ARCHIVE_MARKER, balances_at, local_day_start
+
+logger = logging.getLogger("archive")
+
+
+def ensure_year_partitions(db: Session, table: Table, first_year: int, last_year: int):
+    # Postgres routes each archived row to its year's partition; SQLite keeps one plain table.
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for year in range(first_year, last_year + 1):
+        db.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {table.name}_{year} PARTITION OF {table.name} "
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            )
+        )
+
+
+def move_rows(db: Session, source: Table, target: Table, condition: ColumnElement, batch_size: int) -> int:
+    # Copy then delete one id batch per transaction: a crash loses no rows and never leaves one
+    # in both tables, and each commit keeps locks and WAL bounded on multi-million-row moves.
+    # Walking the primary key makes the whole move a single pass over the table.
+    names = [column.name for column in source.columns]
+    archived_at = datetime.utcnow()
+    moved = last_id = 0
+    while True:
+        batch = select(source.c.id).where(condition, source.c.id > last_id).order_by(source.c.id).limit(batch_size)
+        ids = db.scalars(batch).all()
+        if not ids:
+            return moved
+        last_id = ids[-1]
+        db.execute(
+            insert(target).from_select(
+                [*names, "archived_at"], select(*source.columns, literal(archived_at)).where(source.c.id.in_(ids))
+            )
+        )
+        db.execute(delete(source).where(source.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+
+
+def archive_deleted_records(db: Session, before: datetime, batch_size: int) -> int:
+    # Soft-deleted records are already out of balances, summaries and the calendar.
+    condition = LeaveRecord.deleted_at < before
+    span = select(func.min(LeaveRecord.start_datetime), func.max(LeaveRecord.start_datetime)).where(condition)
+    first, last = db.execute(span).one()
+    if first is None:
+        return 0
+    ensure_year_partitions(db, LeaveRecordArchive.__table__, first.year, last.year)
+    moved = move_rows(db, LeaveRecord.__table__, LeaveRecordArchive.__table__, condition, batch_size)
+    logger.info("archived %s soft-deleted leave records", moved)
+    return moved
+
+
+def seal_ledger(db: Session, through_year: int, batch_size: int) -> int:
+    # Every user with history before the horizon gets a checkpoint exactly at it, so balances
+    # from the horizon on never need the archived rows. Older checkpoints describe archived
+    # history and would no longer match a replay of the hot ledger, so they go.
+    horizon = local_day_start(date(through_year + 1, 1, 1))
+    sealed = select(BalanceCheckpoint.user_id).where(BalanceCheckpoint.as_of == horizon)
+    user_ids = list(
+        db.scalars(
+            select(LeaveTransaction.user_id)
+            .where(LeaveTransaction.created_at < horizon, LeaveTransaction.user_id.not_in(sealed))
+            .distinct()
+        )
+    )
+    for offset in range(0, len(user_ids), batch_size):
+        balances = balances_at(db, horizon, user_ids[offset : offset + batch_size])
+        rows = [{"user_id": user_id, "as_of": horizon, "balance": balance} for user_id, _, balance in balances]
+        if rows:
+            db.execute(insert(BalanceCheckpoint), rows)
+    db.execute(delete(BalanceCheckpoint).where(BalanceCheckpoint.as_of < horizon))
+    # Written with the seal, before any row moves, so reads union the archive from here on.
+    marker = (SystemJob.job_name == LEDGER_ARCHIVE_MARKER, SystemJob.run_year == through_year + 1, SystemJob.run_month == 1)
+    if not db.scalar(select(func.count()).select_from(SystemJob).where(*marker)):
+        db.add(SystemJob(job_name=LEDGER_ARCHIVE_MARKER, run_month=1, run_year=through_year + 1))
+    db.commit()
+    return len(user_ids)
+
+
+def archive_closed_ledger(db: Session, through_year: int, batch_size: int) -> int:
+    horizon = local_day_start(date(through_year + 1, 1, 1))
+    condition = LeaveTransaction.created_at < horizon
+    first = db.scalar(select(func.min(LeaveTransaction.created_at)).where(condition))
+    if first is None:
+        return 0
+    sealed = seal_ledger(db, through_year, batch_size)
+    ensure_year_partitions(db, LeaveTransactionArchive.__table__, first.year, through_year)
+    moved = move_rows(db, LeaveTransaction.__table__, LeaveTransactionArchive.__table__, condition, batch_size)
+    logger.info("archived %s ledger rows through %s, sealed %s balances", moved, through_year, sealed)
+    return moved
+
+
+def run_archive(db: Session, today: date, batch_size: int | None = None) -> int:
+    batch_size = batch_size or settings.archive_batch_size
+    before = local_day_start(today - timedelta(days=settings.archive_deleted_after_days))
+    records = archive_deleted_records(db, before, batch_size)
+    transactions = archive_closed_ledger(db, today.year - settings.archive_hot_years, batch_size)
+    return records + transactions
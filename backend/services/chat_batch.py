@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import math
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+from fastapi import HTTPException, status
+
+from backend.config import settings
+from backend.schemas import BotConfig, BotResult
+
+Dispatch = Callable[[BotConfig, str, str, bool], Awaitable[BotResult]]
+
+
+class RateLimiter:
+    def __init__(self, rate_per_s: float):
+        self.rate_per_s = rate_per_s
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate_per_s <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait_s = self._next_at - now
+            self._next_at = max(now, self._next_at) + 1 / self.rate_per_s
+        if wait_s > 0:
+            await asyncio.sleep(wait_s)
+
+
+def _parse_rate_limits(raw: str) -> dict[str, float]:
+    limits = {}
+    for item in raw.split(","):
+        if "=" in item:
+            provider, rate = item.split("=", 1)
+            limits[provider.strip()] = float(rate)
+    return limits
+
+
+_rate_limits = _parse_rate_limits(settings.chat_batch_rate_limits)
+_limiters: dict[str, RateLimiter] = {}
+
+
+def get_limiter(provider: str) -> RateLimiter:
+    if provider not in _limiters:
+        _limiters[provider] = RateLimiter(_rate_limits.get(provider, 0))
+    return _limiters[provider]
+
+
+def parse_questions_jsonl(raw: bytes) -> list[str]:
+    questions = []
+    for line_no, line in enumerate(raw.decode("utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            question = item["question"] if isinstance(item, dict) else item
+        except (ValueError, KeyError) as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSONL on line {line_no}") from exc
+        if not isinstance(question, str) or not question.strip():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Missing question on line {line_no}")
+        questions.append(question)
+    return questions
+
+
+def make_job_id(questions: list[str], left_bot: BotConfig, right_bot: BotConfig) -> str:
+    raw = json.dumps([questions, left_bot.model_dump(), right_bot.model_dump()])
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def result_path(job_id: str, user_id: int) -> Path:
+    # Job ids are guessable (make_job_id hashes the input), so each user gets a directory.
+    if not job_id.isalnum():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="job_id must be alphanumeric")
+    return Path(settings.chat_batch_dir) / str(user_id) / f"{job_id}.jsonl"
+
+
+def load_results(path: Path) -> dict[int, dict[str, Any]]:
+    rows: dict[int, dict[str, Any]] = {}
+    if not path.exists():
+        return rows
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interruption is simply redone
+            rows[row["index"]] = row
+    return rows
+
+
+def completed_cleanly(row: dict[str, Any]) -> bool:
+    return not any(result.get("error") for result in row["results"])
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(rows: dict[int, dict[str, Any]]) -> dict[str, Any]:
+    sides: dict[str, dict[str, Any]] = {}
+    for side in ("left", "right"):
+        results = [row["results"][0 if side == "left" else 1] for row in rows.values()]
+        latencies = [result["latency_ms"] for result in results if not result.get("error")]
+        sides[side] = {
+            "bot_name": results[0]["bot_name"] if results else None,
+            "count": len(results),
+            "errors": sum(1 for result in results if result.get("error")),
+            "cached": sum(1 for result in results if result.get("cached")),
+            "p50_ms": percentile(latencies, 50),
+            "p90_ms": percentile(latencies, 90),
+            "p99_ms": percentile(latencies, 99),
+            "mean_ms": sum(latencies) / len(latencies) if latencies else None,
+        }
+    return {"completed": len(rows), "bots": sides}
+
+
+async def run_batch(
+    job_id: str,
+    user_id: int,
+    questions: list[str],
+    left_bot: BotConfig,
+    right_bot: BotConfig,
+    dispatch: Dispatch,
+    bypass_cache: bool = False,
+) -> AsyncIterator[dict[str, Any]]:
+    path = result_path(job_id, user_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    done = load_results(path)
+    # A job id reused for different questions starts over instead of mixing in stale rows.
+    if any(index >= len(questions) or row["question"] != questions[index] for index, row in done.items()):
+        path.write_text("", encoding="utf-8")
+        done = {}
+    window = asyncio.Semaphore(settings.chat_batch_concurrency)
+
+    async def run_side(bot: BotConfig, question: str, side: str) -> BotResult:
+        await get_limiter(bot.type).acquire()
+        return await dispatch(bot, question, side, bypass_cache)
+
+    async def run_one(index: int, question: str) -> dict[str, Any]:
+        async with window:
+            left, right = await asyncio.gather(
+                run_side(left_bot, question, "left"), run_side(right_bot, question, "right")
+            )
+        return {"index": index, "question": question, "results": [left.model_dump(), right.model_dump()]}
+
+    # Rows where either bot errored are redone on resume; the new line supersedes the old one.
+    finished = {index for index, row in done.items() if completed_cleanly(row)}
+    yield {"type": "start", "job_id": job_id, "total": len(questions), "already_done": len(finished)}
+    pending = [asyncio.create_task(run_one(index, question)) for index, question in enumerate(questions) if index not in finished]
+    try:
+        with path.open("a", encoding="utf-8") as handle:
+            for next_row in asyncio.as_completed(pending):
+                row = await next_row
+                handle.write(json.dumps(row) + "\n")
+                handle.flush()
+                done[row["index"]] = row
+                yield {"type": "result", **row}
+    finally:
+        for task in pending:
+            task.cancel()
+
+    summary = summarize(done)
+    path.with_suffix(".summary.json").write_text(json.dumps(summary), encoding="utf-8")
+    yield {"type": "done", "job_id": job_id, **summary}
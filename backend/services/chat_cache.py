@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable
+
+from backend.config import settings
+from backend.schemas import BotConfig, BotResult
+from backend.services.cache import TTLCache
+from backend.services.vllm_client import vllm_endpoint
+
+memory_cache = TTLCache("chat_responses", settings.chat_cache_size, settings.chat_cache_ttl_s)
+_inflight: dict[str, asyncio.Task] = {}
+
+
+class DiskCache:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chat_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM chat_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str, ttl_s: float):
+        with self._lock:
+            self._conn.execute("DELETE FROM chat_cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chat_cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, time.time() + ttl_s)
+            )
+            self._conn.commit()
+
+
+disk_cache = DiskCache(settings.chat_cache_path) if settings.chat_cache_path else None
+
+
+def cache_key(bot: BotConfig, question: str) -> str:
+    # Only vLLM bots pick a server, and by the endpoint actually called; the Qwen provider is
+    # pinned to QWEN_API_BASE whatever endpoint the caller sent.
+    endpoint = vllm_endpoint(bot) if bot.type == "vllm" else None
+    raw = json.dumps([bot.type, bot.model, endpoint, question, bot.temperature])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def _lookup(key: str) -> BotResult | None:
+    result = memory_cache.get(key)
+    if result is None and disk_cache is not None:
+        raw = await asyncio.to_thread(disk_cache.get, key)
+        if raw is not None:
+            result = BotResult.model_validate_json(raw)
+            memory_cache.set(key, result)
+    return result
+
+
+async def _fetch_and_store(key: str, call: Callable[[], Awaitable[BotResult]]) -> BotResult:
+    result = await call()
+    if not result.error:
+        memory_cache.set(key, result)
+        if disk_cache is not None:
+            await asyncio.to_thread(disk_cache.set, key, result.model_dump_json(), settings.chat_cache_ttl_s)
+    return result
+
+
+async def cached_call(bot: BotConfig, question: str, call: Callable[[], Awaitable[BotResult]], bypass: bool = False) -> BotResult:
+    if bypass or settings.chat_cache_ttl_s <= 0:
+        return await call()
+
+    key = cache_key(bot, question)
+    result = await _lookup(key)
+    if result is not None:
+        return result.model_copy(update={"cached": True})
+
+    # Identical in-flight requests share one upstream call; the task is shielded so a
+    # disconnecting first caller does not cancel it for everyone else.
+    task = _inflight.get(key)
+    leader = task is None
+    if leader:
+        task = asyncio.create_task(_fetch_and_store(key, call))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    result = await asyncio.shield(task)
+    return result if leader else result.model_copy(update={"cached": True})
@@ -0,0 +1,105 @@
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+
+from backend.schemas import BotConfig, BotStreamStats
+from backend.services.http_pool import stream_sse
+from backend.services.timer import elapsed_ms, start_timer
+
+
+def stats_event(stats: BotStreamStats) -> dict[str, Any]:
+    return {"type": "stats", "side": stats.side, "stats": stats}
+
+
+def error_event(bot: BotConfig, side: str, provider: str, error: str) -> dict[str, Any]:
+    return stats_event(
+        BotStreamStats(
+            side=side,
+            bot_name=bot.name,
+            model=bot.model,
+            provider=provider,
+            first_token_ms=None,
+            latency_ms=0,
+            completion_tokens=0,
+            tokens_per_s=0,
+            error=error,
+        )
+    )
+
+
+async def error_stream(bot: BotConfig, side: str, provider: str, error: str) -> AsyncIterator[dict[str, Any]]:
+    yield error_event(bot, side, provider, error)
+
+
+async def stream_completion(
+    bot: BotConfig,
+    side: str,
+    provider: str,
+    url: str,
+    payload: dict[str, Any],
+    timeout_s: float,
+    headers: dict[str, str] | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    start_time = start_timer()
+    first_token_ms: float | None = None
+    chunks = 0
+    usage_tokens: int | None = None
+    model_name = bot.model
+    error: str | None = None
+
+    stream_payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+    try:
+        async for chunk in stream_sse(url, stream_payload, timeout_s, headers=headers):
+            model_name = chunk.get("model", model_name)
+            if chunk.get("usage"):
+                usage_tokens = chunk["usage"].get("completion_tokens")
+            for choice in chunk.get("choices") or []:
+                content = (choice.get("delta") or {}).get("content")
+                if not content:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = elapsed_ms(start_time)
+                chunks += 1
+                yield {"type": "delta", "side": side, "content": content}
+    except Exception as exc:  # pragma: no cover - surface to client
+        error = str(exc)
+
+    latency = elapsed_ms(start_time)
+    completion_tokens = usage_tokens or chunks
+    yield stats_event(
+        BotStreamStats(
+            side=side,
+            bot_name=bot.name,
+            model=model_name,
+            provider=provider,
+            first_token_ms=first_token_ms,
+            latency_ms=latency,
+            completion_tokens=completion_tokens,
+            tokens_per_s=completion_tokens / (latency / 1000) if latency else 0,
+            error=error,
+        )
+    )
+
+
+async def multiplex(*streams: AsyncIterator[dict[str, Any]]) -> AsyncIterator[dict[str, Any]]:
+    queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+
+    async def pump(stream: AsyncIterator[dict[str, Any]]):
+        try:
+            async for event in stream:
+                await queue.put(event)
+        finally:
+            await queue.put(None)
+
+    tasks = [asyncio.create_task(pump(stream)) for stream in streams]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            event = await queue.get()
+            if event is None:
+                remaining -= 1
+                continue
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
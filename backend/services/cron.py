@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+# Enough to find the next Feb 29 for "0 0 29 2 *".
+SEARCH_DAYS = 366 * 8
+
+
+def _parse_field(field: str, low: int, high: int) -> frozenset[int]:
+    values: set[int] = set()
+    for part in field.split(","):
+        spec, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (int(value) for value in spec.split("-", 1))
+        else:
+            start = int(spec)
+            end = high if step_text else start
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"cron field {field!r} out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class CronSchedule:
+    expression: str
+    minutes: frozenset[int]
+    hours: frozenset[int]
+    days: frozenset[int]
+    months: frozenset[int]
+    weekdays: frozenset[int]
+    any_day: bool
+    any_weekday: bool
+
+    @classmethod
+    def parse(cls, expression: str) -> "CronSchedule":
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression {expression!r} must have 5 fields")
+        # Both 0 and 7 mean Sunday.
+        fields[4] = ",".join("0" if part == "7" else part for part in fields[4].split(","))
+        minutes, hours, days, months, weekdays = (_parse_field(field, *bounds) for field, bounds in zip(fields, FIELD_RANGES))
+        return cls(expression, minutes, hours, days, months, weekdays, fields[2] == "*", fields[4] == "*")
+
+    def matches_day(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        # Classic cron: when both day fields are restricted, either one may match.
+        if not self.any_day and not self.any_weekday:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def _times(self, reverse: bool) -> list[time]:
+        return sorted((time(hour, minute) for hour in self.hours for minute in self.minutes), reverse=reverse)
+
+    def previous(self, before: datetime, limit: int | None = 1, after: datetime | None = None) -> list[datetime]:
+        # Newest first, stopping at `after` when given; fire times are wall-clock times in
+        # `before`'s timezone.
+        found: list[datetime] = []
+        times = self._times(reverse=True)
+        day = before.date()
+        for _ in range(SEARCH_DAYS):
+            if self.matches_day(day):
+                for at in times:
+                    candidate = datetime.combine(day, at, tzinfo=before.tzinfo)
+                    if after is not None and candidate <= after:
+                        return found
+                    if candidate <= before:
+                        found.append(candidate)
+                        if limit is not None and len(found) >= limit:
+                            return found
+            day -= timedelta(days=1)
+        return found
+
+    def next_after(self, after: datetime) -> datetime | None:
+        times = self._times(reverse=False)
+        day = after.date()
+        for _ in range(SEARCH_DAYS):
+            if self.matches_day(day):
+                for at in times:
+                    candidate = datetime.combine(day, at, tzinfo=after.tzinfo)
+                    if candidate > after:
+                        return candidate
+            day += timedelta(days=1)
+        return None
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+import zlib
+from collections.abc import AsyncIterator, Sequence
+from datetime import date, datetime, time, timedelta
+from enum import Enum
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import Float, Select, cast, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql.elements import ColumnElement
+
+from backend.config import settings
+from backend.database import AsyncSessionLocal, async_engine
+from backend.models import LeaveRecord, LeaveRecordArchive, User
+from backend.services.ledger import ledger_table
+from backend.units import UNITS_PER_DAY
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _date_filters(column: ColumnElement, start: date | None, end: date | None) -> list[Any]:
+    if start and end and end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must be >= start")
+    filters = []
+    if start:
+        filters.append(column >= datetime.combine(start, time.min))
+    if end:
+        filters.append(column < datetime.combine(end + timedelta(days=1), time.min))
+    return filters
+
+
+def _in_days(column: ColumnElement) -> ColumnElement:
+    # Exports are read by people and spreadsheets, so amounts leave in days like the API's.
+    return (cast(column, Float) / UNITS_PER_DAY).label(column.key)
+
+
+def records_export_query(start: date | None, end: date | None, user_id: int | None) -> Select:
+    stmt = (
+        select(
+            LeaveRecord.id,
+            LeaveRecord.user_id,
+            User.username,
+            LeaveRecord.record_type,
+            LeaveRecord.start_datetime,
+            LeaveRecord.end_datetime,
+            _in_days(LeaveRecord.total_leave_days),
+            LeaveRecord.minutes,
+            LeaveRecord.note,
+            LeaveRecord.created_at,
+            LeaveRecord.updated_at,
+        )
+        .join(User, User.id == LeaveRecord.user_id)
+        .where(LeaveRecord.deleted_at.is_(None), *_date_filters(LeaveRecord.start_datetime, start, end))
+        .order_by(LeaveRecord.id)
+    )
+    return stmt.where(LeaveRecord.user_id == user_id) if user_id is not None else stmt
+
+
+def deleted_records_export_query(start: date | None, end: date | None, user_id: int | None) -> Select:
+    # Deleted records are history only: recently deleted ones are still in leave_records, older
+    # ones were moved to the archive.
+    def deleted(table, archived: bool) -> Select:
+        stmt = select(
+            table.c.id,
+            table.c.user_id,
+            table.c.record_type,
+            table.c.start_datetime,
+            table.c.end_datetime,
+            table.c.total_leave_days,
+            table.c.minutes,
+            table.c.note,
+            table.c.created_at,
+            table.c.deleted_at,
+            literal(archived).label("archived"),
+        ).where(table.c.deleted_at.is_not(None), *_date_filters(table.c.start_datetime, start, end))
+        return stmt.where(table.c.user_id == user_id) if user_id is not None else stmt
+
+    records = union_all(deleted(LeaveRecord.__table__, False), deleted(LeaveRecordArchive.__table__, True)).subquery("records")
+    return (
+        select(
+            records.c.id,
+            records.c.user_id,
+            User.username,
+            records.c.record_type,
+            records.c.start_datetime,
+            records.c.end_datetime,
+            _in_days(records.c.total_leave_days),
+            records.c.minutes,
+            records.c.note,
+            records.c.created_at,
+            records.c.deleted_at,
+            records.c.archived,
+        )
+        .join(User, User.id == records.c.user_id)
+        .order_by(records.c.id)
+    )
+
+
+def transactions_export_query(start: date | None, end: date | None, user_id: int | None, include_archived: bool = False) -> Select:
+    ledger = ledger_table(include_archived)
+    stmt = (
+        select(
+            ledger.c.id,
+            ledger.c.user_id,
+            User.username,
+            _in_days(ledger.c.change_amount),
+            _in_days(ledger.c.balance_after),
+            ledger.c.source,
+            ledger.c.reference_id,
+            ledger.c.created_at,
+        )
+        .join(User, User.id == ledger.c.user_id)
+        .where(*_date_filters(ledger.c.created_at, start, end))
+        .order_by(ledger.c.id)
+    )
+    return stmt.where(ledger.c.user_id == user_id) if user_id is not None else stmt
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(columns: Sequence[str], rows: Sequence[Sequence[Any]], header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([_plain(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def _encode_ndjson(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    return "".join(json.dumps({column: _plain(value) for column, value in zip(columns, row)}) + "\n" for row in rows)
+
+
+async def export_rows(stmt: Select, fmt: str, compress: bool, engine: AsyncEngine = async_engine) -> AsyncIterator[bytes]:
+    # The generator owns its session: it outlives the request handler, and a server-side
+    # cursor plus yield_per keeps only one batch of rows in memory at a time.
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    columns = [column.name for column in stmt.selected_columns]
+    async with AsyncSessionLocal(bind=engine) as db:
+        result = await db.stream(stmt.execution_options(yield_per=settings.export_batch_size))
+        first = True
+        async for rows in result.partitions():
+            text = _encode_csv(columns, rows, first) if fmt == "csv" else _encode_ndjson(columns, rows)
+            first = False
+            chunk = text.encode()
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if fmt == "csv" and first:
+            header = _encode_csv(columns, [], True).encode()
+            yield compressor.compress(header) if compressor is not None else header
+    if compressor is not None:
+        yield compressor.flush()
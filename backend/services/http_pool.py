@@ -0,0 +1,79 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+from backend.config import QWEN_API_BASE, settings
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_semaphores: dict[str, asyncio.Semaphore] = {}
+
+
+def endpoint_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def allowed_key(url: str) -> str:
+    # Clients and semaphores are only made for configured servers, so the pool stays bounded
+    # however many hosts callers name.
+    key = endpoint_key(url)
+    configured = (QWEN_API_BASE, *settings.chat_vllm_endpoints.split(","))
+    if key not in {endpoint_key(item.strip()) for item in configured if item.strip()}:
+        raise ValueError(f"{key} is not a configured chat endpoint")
+    return key
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    key = allowed_key(url)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.chat_max_connections,
+                max_keepalive_connections=settings.chat_max_keepalive,
+                keepalive_expiry=settings.chat_keepalive_expiry_s,
+            ),
+            http2=settings.chat_http2,
+        )
+        _clients[key] = client
+    return client
+
+
+def get_semaphore(url: str) -> asyncio.Semaphore:
+    key = allowed_key(url)
+    if key not in _semaphores:
+        _semaphores[key] = asyncio.Semaphore(settings.chat_endpoint_concurrency)
+    return _semaphores[key]
+
+
+async def post_json(url: str, payload: dict[str, Any], timeout_s: float, headers: dict[str, str] | None = None) -> dict[str, Any]:
+    async with get_semaphore(url):
+        response = await get_client(url).post(url, json=payload, headers=headers, timeout=timeout_s)
+        response.raise_for_status()
+        return response.json()
+
+
+async def stream_sse(
+    url: str, payload: dict[str, Any], timeout_s: float, headers: dict[str, str] | None = None
+) -> AsyncIterator[dict[str, Any]]:
+    async with get_semaphore(url):
+        async with get_client(url).stream("POST", url, json=payload, headers=headers, timeout=timeout_s) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                yield json.loads(data)
+
+
+async def close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    _semaphores.clear()
+    await asyncio.gather(*(client.aclose() for client in clients))
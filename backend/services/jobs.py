@@ -0,0 +1,432 @@
+import logging
+import os
+import socket
+import threading
+import time as clock
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.models import JobLease, JobRun, JobStatus, JobTrigger
+from backend.services.archive import run_archive
+from backend.services.cron import CronSchedule
+from backend.services.ledger import check_ledger, local_day_start, write_checkpoints
+from backend.services.leave import ACCRUAL_DAY, ACCRUAL_JOB, VN_TZ, accrue_month, last_accrual_month
+from backend.services.metrics import job_duration, job_rows, job_runs
+
+logger = logging.getLogger("scheduler")
+
+SCHEDULER_LEASE = "scheduler"
+
+
+@dataclass(frozen=True)
+class Job:
+    name: str
+    schedule: CronSchedule
+    # Receives the tz-aware local fire time being served; returns the number of rows written.
+    run: Callable[[Session, datetime], int]
+    # Latest fire time known to be done; defaults to the newest succeeded JobRun.
+    last_done: Callable[[Session], datetime | None] | None = None
+    # Most missed fire times served in one go; older ones are recorded as skipped. None for
+    # jobs that must serve every one of them, such as accrual.
+    catchup_runs: int | None = settings.scheduler_catchup_runs
+    # False for checks whose failure is the finding: recorded once, not retried, and it does
+    # not hold back later fire times.
+    retry: bool = True
+    # Whether a job with no history serves its latest fire time right away. Heavy jobs opt
+    # out, so the first start after an upgrade waits for the next fire time.
+    backfill_first_run: bool = True
+
+
+JOBS: dict[str, Job] = {}
+
+
+def register_job(job: Job) -> Job:
+    JOBS[job.name] = job
+    return job
+
+
+def worker_id(prefix: str = "worker") -> str:
+    return f"{prefix}:{socket.gethostname()}:{os.getpid()}"
+
+
+def utc_naive(moment: datetime) -> datetime:
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_time(moment: datetime) -> datetime:
+    return moment.replace(tzinfo=timezone.utc).astimezone(VN_TZ)
+
+
+def acquire_lease(db: Session, name: str, holder: str, ttl_s: float) -> bool:
+    # Take (or renew) the lease when it is ours or has expired; the row lock makes the
+    # UPDATE the arbiter, so at most one holder wins per expiry.
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_s)
+    taken = db.execute(
+        update(JobLease)
+        .where(JobLease.name == name, or_(JobLease.holder == holder, JobLease.expires_at < now))
+        .values(holder=holder, expires_at=expires_at)
+    ).rowcount
+    if not taken:
+        try:
+            with db.begin_nested():
+                db.add(JobLease(name=name, holder=holder, expires_at=expires_at))
+        except IntegrityError:
+            db.rollback()
+            return False
+    db.commit()
+    return True
+
+
+def renew_lease(db: Session, name: str, holder: str, ttl_s: float) -> bool:
+    # Unlike acquire_lease this never takes a lease over: once it has expired, someone else
+    # may already be acting on it.
+    now = datetime.utcnow()
+    renewed = db.execute(
+        update(JobLease)
+        .where(JobLease.name == name, JobLease.holder == holder, JobLease.expires_at >= now)
+        .values(expires_at=now + timedelta(seconds=ttl_s))
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class LeaseHeartbeat:
+    # Renews leases from its own thread and session while a job runs, so a job that outlives
+    # a TTL keeps them. When a renewal fails another worker may take over; from then on the
+    # job session refuses to commit, which aborts the job at its next batch boundary.
+    def __init__(self, db: Session, holder: str, leases: dict[str, float]):
+        self.db = db
+        self.holder = holder
+        self.leases = leases
+        self.lost: str | None = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name="lease-heartbeat", daemon=True)
+
+    def _beat(self):
+        interval = min(self.leases.values()) / 3
+        with Session(bind=self.db.get_bind()) as session:
+            while not self._stop.wait(interval):
+                for name, ttl_s in self.leases.items():
+                    try:
+                        renewed = renew_lease(session, name, self.holder, ttl_s)
+                    except Exception:
+                        logger.exception("renewing lease %s failed", name)
+                        session.rollback()
+                        renewed = False
+                    if not renewed:
+                        logger.error("lease %s lost by %s, aborting the running job", name, self.holder)
+                        self.lost = name
+                        return
+
+    def _guard(self, session: Session):
+        if self.lost:
+            raise LeaseLost(f"lease {self.lost} expired while the job was running")
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        event.listen(self.db, "before_commit", self._guard)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        event.remove(self.db, "before_commit", self._guard)
+
+
+def release_lease(db: Session, name: str, holder: str):
+    db.execute(update(JobLease).where(JobLease.name == name, JobLease.holder == holder).values(expires_at=datetime.utcnow()))
+    db.commit()
+
+
+def last_succeeded(db: Session, job: Job) -> datetime | None:
+    latest = db.scalar(
+        select(func.max(JobRun.scheduled_for)).where(JobRun.job_name == job.name, JobRun.status == JobStatus.SUCCEEDED)
+    )
+    return local_time(latest) if latest else None
+
+
+def missed_runs(db: Session, job: Job, now: datetime | None = None) -> list[datetime]:
+    # Every fire time after the last completed one, oldest first. With no history at all
+    # only the latest fire time is due, or none when the job does not backfill its first run.
+    now = now or datetime.now(tz=VN_TZ)
+    last_done = (job.last_done or (lambda session: last_succeeded(session, job)))(db)
+    if last_done is None:
+        return job.schedule.previous(now) if job.backfill_first_run else []
+    return list(reversed(job.schedule.previous(now, None, after=last_done)))
+
+
+def due_runs(job: Job, missed: list[datetime]) -> list[datetime]:
+    # The newest catchup_runs missed fire times, so a worker that was down over a fire time
+    # still serves it.
+    if job.catchup_runs is None:
+        return missed
+    return missed[max(len(missed) - job.catchup_runs, 0) :]
+
+
+def record_skipped(db: Session, job: Job, skipped: list[datetime], holder: str):
+    # Fire times beyond the catchup cap are never served; a failed run per fire time keeps
+    # them visible in the job history instead of dropping them silently.
+    recorded = set(
+        db.scalars(
+            select(JobRun.scheduled_for).where(
+                JobRun.job_name == job.name, JobRun.scheduled_for.in_([utc_naive(moment) for moment in skipped])
+            )
+        )
+    )
+    now = datetime.utcnow()
+    new = [moment for moment in skipped if utc_naive(moment) not in recorded]
+    for moment in new:
+        db.add(
+            JobRun(
+                job_name=job.name,
+                scheduled_for=utc_naive(moment),
+                trigger=JobTrigger.CATCHUP,
+                status=JobStatus.FAILED,
+                holder=holder,
+                started_at=now,
+                finished_at=now,
+                error=f"skipped: more than {job.catchup_runs} fire times missed",
+            )
+        )
+    db.commit()
+    if new:
+        logger.warning(
+            "job %s skipped %s missed fire times from %s to %s (catchup_runs=%s)",
+            job.name,
+            len(new),
+            new[0].isoformat(),
+            new[-1].isoformat(),
+            job.catchup_runs,
+        )
+
+
+def recently_failed(db: Session, job: Job, scheduled_for: datetime) -> bool:
+    stmt = (
+        select(func.count())
+        .select_from(JobRun)
+        .where(
+            JobRun.job_name == job.name,
+            JobRun.scheduled_for == utc_naive(scheduled_for),
+            JobRun.status == JobStatus.FAILED,
+        )
+    )
+    if job.retry:
+        stmt = stmt.where(JobRun.finished_at >= datetime.utcnow() - timedelta(seconds=settings.job_retry_delay_s))
+    return bool(db.scalar(stmt))
+
+
+def run_job(
+    db: Session,
+    job: Job,
+    scheduled_for: datetime,
+    trigger: JobTrigger,
+    holder: str,
+    held: dict[str, float] | None = None,
+    run: JobRun | None = None,
+) -> JobRun | None:
+    # A per-job lease keeps a manual trigger and the scheduler (or two schedulers across a
+    # failover) from running the same job at once. None when someone else holds it. The
+    # heartbeat also keeps the caller's own leases (held, name -> TTL) alive during the run.
+    lease = f"job:{job.name}"
+    if not acquire_lease(db, lease, holder, settings.job_lease_ttl_s):
+        return None
+    try:
+        # Whoever held the lease before us is gone; its unfinished runs never will.
+        db.execute(
+            update(JobRun)
+            .where(JobRun.job_name == job.name, JobRun.status == JobStatus.RUNNING)
+            .values(status=JobStatus.FAILED, finished_at=datetime.utcnow(), error="abandoned by a previous holder")
+        )
+        if run is None:
+            run = JobRun(job_name=job.name, scheduled_for=utc_naive(scheduled_for), trigger=trigger, holder=holder)
+            db.add(run)
+        else:
+            run.status, run.holder, run.started_at = JobStatus.RUNNING, holder, datetime.utcnow()
+        db.commit()
+
+        started = clock.perf_counter()
+        heartbeat = LeaseHeartbeat(db, holder, {lease: settings.job_lease_ttl_s, **(held or {})})
+        try:
+            with heartbeat:
+                rows = job.run(db, scheduled_for) or 0
+            status, error = JobStatus.SUCCEEDED, None
+        except Exception as exc:
+            db.rollback()
+            logger.exception("job %s for %s failed", job.name, scheduled_for.isoformat())
+            rows, status, error = 0, JobStatus.FAILED, f"{type(exc).__name__}: {exc}"
+        duration = clock.perf_counter() - started
+
+        run.status = status
+        run.rows = rows
+        run.error = error
+        run.duration_s = round(duration, 3)
+        run.finished_at = datetime.utcnow()
+        db.commit()
+        db.refresh(run)
+        job_runs.inc(job.name, status.value)
+        job_duration.observe(duration, job.name)
+        job_rows.inc(job.name, amount=rows)
+        logger.info("job %s for %s %s in %.2fs, rows=%s", job.name, scheduled_for.isoformat(), status.value, duration, rows)
+        if heartbeat.lost:
+            raise LeaseLost(f"lease {heartbeat.lost} lost during {job.name}")
+        return run
+    finally:
+        release_lease(db, lease, holder)
+
+
+def run_due_jobs(
+    db: Session, holder: str, now: datetime | None = None, jobs: list[Job] | None = None, held: dict[str, float] | None = None
+) -> list[JobRun]:
+    # Raises LeaseLost when one of the held leases could not be renewed; the caller is no
+    # longer the scheduler and must not start anything else.
+    runs = []
+    for job in JOBS.values() if jobs is None else jobs:
+        missed = missed_runs(db, job, now)
+        due = due_runs(job, missed)
+        if len(due) < len(missed):
+            record_skipped(db, job, missed[: len(missed) - len(due)], holder)
+        for scheduled_for in due:
+            if recently_failed(db, job, scheduled_for):
+                if job.retry:
+                    break
+                continue
+            trigger = JobTrigger.SCHEDULE if scheduled_for == due[-1] else JobTrigger.CATCHUP
+            run = run_job(db, job, scheduled_for, trigger, holder, held)
+            if run is None:
+                break
+            if run.status != JobStatus.SUCCEEDED:
+                # Fire times are served in order; a failure is retried after job_retry_delay_s.
+                if job.retry:
+                    break
+                continue
+            runs.append(run)
+    return runs
+
+
+def request_run(db: Session, job: Job, requested_by: str) -> JobRun | None:
+    # Manual runs are queued for the scheduler worker instead of running inside an API
+    # request. A run serves the latest fire time, so it is as idempotent as a scheduled one.
+    # None when one is already queued or the job is running.
+    queued = db.scalar(
+        select(func.count()).select_from(JobRun).where(JobRun.job_name == job.name, JobRun.status == JobStatus.PENDING)
+    )
+    lease = db.get(JobLease, f"job:{job.name}")
+    if queued or (lease is not None and lease.expires_at > datetime.utcnow()):
+        return None
+    now = datetime.now(tz=VN_TZ)
+    latest = job.schedule.previous(now)
+    run = JobRun(
+        job_name=job.name,
+        scheduled_for=utc_naive(latest[0] if latest else now),
+        trigger=JobTrigger.MANUAL,
+        status=JobStatus.PENDING,
+        holder=requested_by,
+    )
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    logger.info("job %s queued by %s as run %s", job.name, requested_by, run.id)
+    return run
+
+
+def run_pending_runs(db: Session, holder: str, held: dict[str, float] | None = None) -> list[JobRun]:
+    runs = []
+    for run in db.scalars(select(JobRun).where(JobRun.status == JobStatus.PENDING).order_by(JobRun.id)).all():
+        job = JOBS.get(run.job_name)
+        if job is None:
+            run.status, run.finished_at, run.error = JobStatus.FAILED, datetime.utcnow(), "unknown job"
+            db.commit()
+            continue
+        # Left pending when the job lease is taken; the next tick tries again.
+        done = run_job(db, job, local_time(run.scheduled_for), JobTrigger.MANUAL, holder, held, run=run)
+        if done is not None:
+            runs.append(done)
+    return runs
+
+
+def _accrual_last_done(db: Session) -> datetime | None:
+    # Driven by the SystemJob month markers, so runs made before this scheduler count too.
+    month = last_accrual_month(db)
+    return datetime(month[0], month[1], ACCRUAL_DAY, tzinfo=VN_TZ) if month else None
+
+
+register_job(
+    Job(
+        name=ACCRUAL_JOB,
+        schedule=CronSchedule.parse(f"0 0 {ACCRUAL_DAY} * *"),
+        run=lambda db, scheduled_for: accrue_month(db, scheduled_for.date()) or 0,
+        last_done=_accrual_last_done,
+        # Each month owes its own credit, so none is ever skipped.
+        catchup_runs=None,
+    )
+)
+
+
+# Seals days older than checkpoint_lag_days only: a transaction flushed before midnight but
+# committed after this run would otherwise land behind a checkpoint that never counted it.
+register_job(
+    Job(
+        name="balance_checkpoint",
+        schedule=CronSchedule.parse("5 0 * * *"),
+        run=lambda db, scheduled_for: write_checkpoints(
+            db, local_day_start(scheduled_for.date() - timedelta(days=settings.checkpoint_lag_days))
+        ),
+        backfill_first_run=False,
+    )
+)
+register_job(
+    Job(
+        name="ledger_check",
+        schedule=CronSchedule.parse("30 2 * * *"),
+        run=lambda db, scheduled_for: check_ledger(db),
+        catchup_runs=1,
+        retry=False,
+    )
+)
+# Monthly, off-hours and never straight after an upgrade: the first run moves years of rows in batches.
+register_job(
+    Job(
+        name="archive",
+        schedule=CronSchedule.parse("0 3 1 * *"),
+        run=lambda db, scheduled_for: run_archive(db, scheduled_for.date()),
+        catchup_runs=1,
+        backfill_first_run=False,
+    )
+)
+
+
+def recent_runs(db: Session, name: str, limit: int) -> list[JobRun]:
+    return list(db.scalars(select(JobRun).where(JobRun.job_name == name).order_by(JobRun.id.desc()).limit(limit)))
+
+
+def job_overview(db: Session) -> list[dict]:
+    leases = {lease.name: lease for lease in db.scalars(select(JobLease))}
+    now = datetime.now(tz=VN_TZ)
+    overview = []
+    for job in JOBS.values():
+        lease = leases.get(f"job:{job.name}")
+        active = lease is not None and lease.expires_at > datetime.utcnow()
+        runs = recent_runs(db, job.name, 1)
+        next_run = job.schedule.next_after(now)
+        overview.append(
+            {
+                "name": job.name,
+                "schedule": job.schedule.expression,
+                "next_run_at": utc_naive(next_run) if next_run else None,
+                "lease_holder": lease.holder if active else None,
+                "lease_expires_at": lease.expires_at if active else None,
+                "last_run": runs[0] if runs else None,
+            }
+        )
+    return overview
@@ -1,13 +1,29 @@
-from datetime import date, datetime, time, timedelta
+from collections.abc import Sequence
+from datetime import date, datetime, time
 from zoneinfo import ZoneInfo
 
+import numpy as np
 from fastapi import HTTPException, status
+from sqlalchemy import insert, select, update
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
 from backend.config import settings
 from backend.models import LeaveRecord, LeaveTransaction, RecordType, SystemJob, TransactionSource, User
+from backend.units import HALF_DAY, UNITS_PER_DAY
+from backend.services.workdays import (
+    count_business_days,
+    count_business_days_batch,
+    is_business_day,
+    is_business_day_batch,
+    to_datetime64,
+)
+from backend.services.versions import ALL_SCOPE, USERS_SCOPE, bump_versions, user_scope
 
 VN_TZ = ZoneInfo(settings.timezone)
+ACCRUAL_JOB = "monthly_accrual"
+ACCRUAL_DAY = 21
+ACCRUAL_PROGRESS_PREFIX = f"{ACCRUAL_JOB}:through:"
 
 
 def vn_now() -> datetime:
@@ -22,28 +38,70 @@ def normalize_date(dt: datetime | None) -> date:
     return dt.astimezone(VN_TZ).date()
 
 
-def day_weight(day: date) -> float:
-    return 0 if day.weekday() >= 5 else 1
+def day_weight(day: date) -> int:
+    return 1 if is_business_day(day) else 0
 
 
-def calculate_range_leave_days(start: date, end: date, start_half: str, end_half: str) -> float:
+def validate_range(start: date, end: date):
     if end < start:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end_date must be >= start_date")
-    total = 0.0
-    cursor = start
-    while cursor <= end:
-        total += day_weight(cursor)
-        cursor += timedelta(days=1)
+    if (end - start).days + 1 > settings.max_range_days:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Leave range cannot exceed {settings.max_range_days} days"
+        )
+
+
+def calculate_range_leave_days(start: date, end: date, start_half: str, end_half: str) -> int:
+    validate_range(start, end)
+    total = count_business_days(start, end) * UNITS_PER_DAY
 
     if day_weight(start) == 1 and start_half == "PM":
-        total -= 0.5
+        total -= HALF_DAY
     if day_weight(end) == 1 and end_half == "AM":
-        total -= 0.5
+        total -= HALF_DAY
 
     return max(total, 0)
 
 
-def build_leave_payload(record_type: RecordType, start_date: datetime | None, end_date: datetime | None, start_half: str | None, end_half: str | None, minutes: int | None) -> tuple[datetime, datetime, float]:
+def calculate_range_leave_days_batch(
+    starts: Sequence[date], ends: Sequence[date], start_halves: Sequence[str], end_halves: Sequence[str]
+) -> list[int]:
+    start_days = to_datetime64(starts)
+    end_days = to_datetime64(ends)
+    if (end_days < start_days).any():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end_date must be >= start_date")
+    if ((end_days - start_days).astype(int) + 1 > settings.max_range_days).any():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Leave range cannot exceed {settings.max_range_days} days"
+        )
+
+    totals = count_business_days_batch(start_days, end_days).astype(np.int64) * UNITS_PER_DAY
+    totals -= HALF_DAY * (is_business_day_batch(start_days) & (np.asarray(start_halves) == "PM"))
+    totals -= HALF_DAY * (is_business_day_batch(end_days) & (np.asarray(end_halves) == "AM"))
+    return np.maximum(totals, 0).tolist()
+
+
+def range_halves(start_dt: datetime, end_dt: datetime) -> tuple[str, str]:
+    return ("PM" if start_dt.time() >= time(12, 0) else "AM", "AM" if end_dt.time() <= time(12, 0) else "PM")
+
+
+def count_range_days(records: Sequence[LeaveRecord]):
+    # Prices every RANGE record in one vectorized pass; the ranges must already be validated.
+    ranges = [record for record in records if record.record_type == RecordType.RANGE]
+    if not ranges:
+        return
+    halves = [range_halves(record.start_datetime, record.end_datetime) for record in ranges]
+    totals = calculate_range_leave_days_batch(
+        [record.start_datetime.date() for record in ranges],
+        [record.end_datetime.date() for record in ranges],
+        [start_half for start_half, _ in halves],
+        [end_half for _, end_half in halves],
+    )
+    for record, total in zip(ranges, totals):
+        record.total_leave_days = total
+
+
+def build_leave_payload(record_type: RecordType, start_date: datetime | None, end_date: datetime | None, start_half: str | None, end_half: str | None, minutes: int | None, count_range: bool = True) -> tuple[datetime, datetime, int]:
     sd = normalize_date(start_date)
     ed = normalize_date(end_date) if end_date else sd
 
@@ -51,15 +109,22 @@ def build_leave_payload(record_type: RecordType, start_date: datetime | None, en
     end_dt = datetime.combine(ed, time(17, 0))
 
     if record_type == RecordType.FULL_DAY:
-        return start_dt, end_dt, day_weight(sd)
+        return start_dt, end_dt, day_weight(sd) * UNITS_PER_DAY
     if record_type == RecordType.HALF_AM:
-        return start_dt, datetime.combine(sd, time(12, 0)), 0.5 if day_weight(sd) else 0
+        return start_dt, datetime.combine(sd, time(12, 0)), day_weight(sd) * HALF_DAY
     if record_type == RecordType.HALF_PM:
-        return datetime.combine(sd, time(13, 0)), end_dt, 0.5 if day_weight(sd) else 0
+        return datetime.combine(sd, time(13, 0)), end_dt, day_weight(sd) * HALF_DAY
     if record_type == RecordType.RANGE:
         s_half = start_half or "AM"
         e_half = end_half or "PM"
-        return start_dt, end_dt, calculate_range_leave_days(sd, ed, s_half, e_half)
+        # Half-day edges live in the timestamps, the same way HALF_AM/HALF_PM records keep them.
+        range_start = datetime.combine(sd, time(13, 0)) if s_half == "PM" else start_dt
+        range_end = datetime.combine(ed, time(12, 0)) if e_half == "AM" else end_dt
+        if not count_range:
+            # Bulk callers leave the days at 0 and fill them in later with count_range_days.
+            validate_range(sd, ed)
+            return range_start, range_end, 0
+        return range_start, range_end, calculate_range_leave_days(sd, ed, s_half, e_half)
     if record_type in (RecordType.LATE, RecordType.EARLY):
         if not minutes:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="minutes is required for LATE/EARLY")
@@ -67,42 +132,131 @@ def build_leave_payload(record_type: RecordType, start_date: datetime | None, en
     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported record type")
 
 
-def apply_balance_change(db: Session, user: User, change_amount: float, source: TransactionSource, reference_id: int | None):
-    new_balance = float(user.leave_balance) + change_amount
-    if new_balance < 0:
+def apply_balance_change(db: Session, user: User, change_amount: int, source: TransactionSource, reference_id: int | None):
+    # One conditional UPDATE: concurrent changes for the same user serialize on the row lock
+    # instead of racing a Python read-modify-write, and an overdraft simply matches no row.
+    new_balance = db.execute(
+        update(User)
+        .where(User.id == user.id, User.leave_balance + change_amount >= 0)
+        .values(leave_balance=User.leave_balance + change_amount)
+        .returning(User.leave_balance)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if new_balance is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient leave balance")
-    user.leave_balance = round(new_balance, 2)
+    set_committed_value(user, "leave_balance", new_balance)
+    # Only the per-user counter here: it shares the lock this UPDATE already holds. Callers
+    # bump the global scopes right before they commit to keep those hot rows locked briefly.
+    bump_versions(db, user_scope(user.id))
     db.add(
         LeaveTransaction(
             user_id=user.id,
             change_amount=change_amount,
-            balance_after=float(user.leave_balance),
+            balance_after=new_balance,
             source=source,
             reference_id=reference_id,
         )
     )
 
 
-def run_monthly_accrual(db: Session, execute_date: date | None = None) -> bool:
-    current = execute_date or vn_now().date()
-    if current.day != 21:
-        return False
+def _accrual_job_filter(current: date):
+    return (SystemJob.run_month == current.month, SystemJob.run_year == current.year)
 
-    existing = (
-        db.query(SystemJob)
-        .filter(SystemJob.job_name == "monthly_accrual", SystemJob.run_month == current.month, SystemJob.run_year == current.year)
-        .first()
-    )
-    if existing:
-        return False
 
+def _accrue_per_user(db: Session) -> int:
     active_users = db.query(User).filter(User.is_active.is_(True)).all()
     for user in active_users:
-        apply_balance_change(db, user, settings.accrual_amount, TransactionSource.MONTHLY_ACCRUAL, None)
+        apply_balance_change(db, user, settings.accrual_units, TransactionSource.MONTHLY_ACCRUAL, None)
+    return len(active_users)
 
-    db.add(SystemJob(job_name="monthly_accrual", run_month=current.month, run_year=current.year))
+
+def _accrue_bulk(db: Session, current: date, chunk_size: int) -> int:
+    # Each chunk commits together with a progress marker, so a crashed run resumes
+    # after the last committed user id instead of accruing anyone twice.
+    markers = (
+        db.query(SystemJob.job_name)
+        .filter(SystemJob.job_name.like(f"{ACCRUAL_PROGRESS_PREFIX}%"), *_accrual_job_filter(current))
+        .all()
+    )
+    last_id = max((int(name[len(ACCRUAL_PROGRESS_PREFIX):]) for (name,) in markers), default=0)
+    amount = settings.accrual_units
+    accrued = 0
+
+    while True:
+        chunk_ids = (
+            select(User.id)
+            .where(User.is_active.is_(True), User.id > last_id)
+            .order_by(User.id)
+            .limit(chunk_size)
+            .scalar_subquery()
+        )
+        rows = db.execute(
+            update(User)
+            .where(User.id.in_(chunk_ids))
+            .values(leave_balance=User.leave_balance + amount)
+            .returning(User.id, User.leave_balance)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if not rows:
+            break
+
+        db.execute(
+            insert(LeaveTransaction),
+            [
+                {
+                    "user_id": row.id,
+                    "change_amount": amount,
+                    "balance_after": row.leave_balance,
+                    "source": TransactionSource.MONTHLY_ACCRUAL,
+                    "reference_id": None,
+                }
+                for row in rows
+            ],
+        )
+        last_id = max(row.id for row in rows)
+        db.add(SystemJob(job_name=f"{ACCRUAL_PROGRESS_PREFIX}{last_id}", run_month=current.month, run_year=current.year))
+        bump_versions(db, ALL_SCOPE, USERS_SCOPE)
+        db.commit()
+        accrued += len(rows)
+
+    db.query(SystemJob).filter(
+        SystemJob.job_name.like(f"{ACCRUAL_PROGRESS_PREFIX}%"), *_accrual_job_filter(current)
+    ).delete(synchronize_session=False)
+    return accrued
+
+
+def accrue_month(db: Session, current: date, mode: str | None = None) -> int | None:
+    # None when the month's SystemJob marker says it already ran.
+    existing = db.query(SystemJob).filter(SystemJob.job_name == ACCRUAL_JOB, *_accrual_job_filter(current)).first()
+    if existing:
+        return None
+
+    if (mode or settings.accrual_mode) == "bulk":
+        accrued = _accrue_bulk(db, current, settings.accrual_chunk_size)
+    else:
+        accrued = _accrue_per_user(db)
+
+    db.add(SystemJob(job_name=ACCRUAL_JOB, run_month=current.month, run_year=current.year))
+    bump_versions(db, ALL_SCOPE, USERS_SCOPE)
     db.commit()
-    return True
+    return accrued
+
+
+def last_accrual_month(db: Session) -> tuple[int, int] | None:
+    row = (
+        db.query(SystemJob.run_year, SystemJob.run_month)
+        .filter(SystemJob.job_name == ACCRUAL_JOB)
+        .order_by(SystemJob.run_year.desc(), SystemJob.run_month.desc())
+        .first()
+    )
+    return (row.run_year, row.run_month) if row else None
+
+
+def run_monthly_accrual(db: Session, execute_date: date | None = None, mode: str | None = None) -> bool:
+    current = execute_date or vn_now().date()
+    if current.day != ACCRUAL_DAY:
+        return False
+    return accrue_month(db, current, mode) is not None
 
 
 def soft_delete_record(db: Session, record: LeaveRecord):
@@ -0,0 +1,187 @@
+from calendar import monthrange
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import date, timedelta
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, delete, insert, select
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.models import DayPart, LeaveDay, LeaveRecord, RecordType, User
+from backend.services.cache import TTLCache
+from backend.services.leave import range_halves
+
+calendar_cache = TTLCache("leave_calendar", 240, settings.calendar_cache_ttl_s)
+
+Month = tuple[int, int]
+
+
+def expand_record(record: LeaveRecord) -> list[tuple[date, DayPart]]:
+    start = record.start_datetime.date()
+    end = record.end_datetime.date()
+    if record.record_type == RecordType.FULL_DAY:
+        return [(start, DayPart.FULL)]
+    if record.record_type == RecordType.HALF_AM:
+        return [(start, DayPart.AM)]
+    if record.record_type == RecordType.HALF_PM:
+        return [(start, DayPart.PM)]
+    if record.record_type != RecordType.RANGE:
+        return []  # LATE/EARLY are not absences
+
+    start_half, end_half = range_halves(record.start_datetime, record.end_datetime)
+    if start == end:
+        if start_half == "PM" and end_half == "AM":
+            return []
+        if start_half == "PM" or end_half == "AM":
+            return [(start, DayPart.PM if start_half == "PM" else DayPart.AM)]
+        return [(start, DayPart.FULL)]
+    days = [(start + timedelta(days=offset), DayPart.FULL) for offset in range((end - start).days + 1)]
+    if start_half == "PM":
+        days[0] = (start, DayPart.PM)
+    if end_half == "AM":
+        days[-1] = (end, DayPart.AM)
+    return days
+
+
+def parts_conflict(left: DayPart, right: DayPart) -> bool:
+    return DayPart.FULL in (left, right) or left == right
+
+
+def months_of(days: Iterable[date]) -> set[Month]:
+    return {(day.year, day.month) for day in days}
+
+
+def absence_query(start: date, end: date, user_ids: Iterable[int] | None = None) -> Select:
+    stmt = (
+        select(LeaveDay.day, LeaveDay.user_id, User.username, LeaveDay.part, LeaveDay.record_id)
+        .join(User, User.id == LeaveDay.user_id)
+        .where(LeaveDay.day >= start, LeaveDay.day <= end)
+        .order_by(LeaveDay.day, User.username)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(LeaveDay.user_id.in_(list(user_ids)))
+    return stmt
+
+
+def occupied_days(
+    db: Session, user_id: int, start: date, end: date, exclude_record_id: int | None = None
+) -> dict[date, list[DayPart]]:
+    occupied: dict[date, list[DayPart]] = defaultdict(list)
+    for row in db.execute(absence_query(start, end, [user_id])):
+        if row.record_id != exclude_record_id:
+            occupied[row.day].append(row.part)
+    return occupied
+
+
+def first_conflict(occupied: dict[date, list[DayPart]], days: list[tuple[date, DayPart]]) -> date | None:
+    for day, part in days:
+        if any(parts_conflict(part, taken) for taken in occupied.get(day, ())):
+            return day
+    return None
+
+
+def find_overlap(
+    db: Session, user_id: int, days: list[tuple[date, DayPart]], exclude_record_id: int | None = None
+) -> date | None:
+    if not days:
+        return None
+    occupied = occupied_days(db, user_id, min(day for day, _ in days), max(day for day, _ in days), exclude_record_id)
+    return first_conflict(occupied, days)
+
+
+def ensure_no_overlap(db: Session, record: LeaveRecord, exclude_record_id: int | None = None):
+    overlap = find_overlap(db, record.user_id, expand_record(record), exclude_record_id)
+    if overlap is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Overlaps existing leave on {overlap.isoformat()}")
+
+
+def remove_record_days(db: Session, record_id: int) -> set[Month]:
+    removed = db.scalars(delete(LeaveDay).where(LeaveDay.record_id == record_id).returning(LeaveDay.day)).all()
+    return months_of(removed)
+
+
+def write_record_days(db: Session, record: LeaveRecord) -> set[Month]:
+    months = remove_record_days(db, record.id)
+    days = expand_record(record)
+    if days:
+        db.execute(
+            insert(LeaveDay),
+            [{"record_id": record.id, "user_id": record.user_id, "day": day, "part": part} for day, part in days],
+        )
+    return months | months_of(day for day, _ in days)
+
+
+def write_days_batch(db: Session, records: list[LeaveRecord], chunk_size: int = 1000) -> set[Month]:
+    rows = [
+        {"record_id": record.id, "user_id": record.user_id, "day": day, "part": part}
+        for record in records
+        for day, part in expand_record(record)
+    ]
+    for offset in range(0, len(rows), chunk_size):
+        db.execute(insert(LeaveDay), rows[offset : offset + chunk_size])
+    return months_of(row["day"] for row in rows)
+
+
+def invalidate_months(months: Iterable[Month]):
+    for month in months:
+        calendar_cache.pop(month)
+
+
+def month_absences(db: Session, month: Month) -> dict[date, list[dict[str, Any]]]:
+    cached = calendar_cache.get(month)
+    if cached is not None:
+        return cached
+    year, number = month
+    first = date(year, number, 1)
+    last = date(year, number, monthrange(year, number)[1])
+    rendered: dict[date, list[dict[str, Any]]] = defaultdict(list)
+    for row in db.execute(absence_query(first, last)):
+        rendered[row.day].append(
+            {"user_id": row.user_id, "username": row.username, "part": row.part.value, "record_id": row.record_id}
+        )
+    rendered = dict(rendered)
+    calendar_cache.set(month, rendered)
+    return rendered
+
+
+def calendar_window(db: Session, start: date, end: date, user_ids: list[int] | None) -> list[dict[str, Any]]:
+    if end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must be >= start")
+    if (end - start).days + 1 > settings.calendar_max_days:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Calendar window cannot exceed {settings.calendar_max_days} days"
+        )
+    wanted = set(user_ids) if user_ids else None
+    months: dict[Month, dict[date, list[dict[str, Any]]]] = {}
+    days = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        month = (day.year, day.month)
+        if month not in months:
+            months[month] = month_absences(db, month)
+        absences = months[month].get(day, [])
+        if wanted is not None:
+            absences = [absence for absence in absences if absence["user_id"] in wanted]
+        days.append({"date": day, "absences": absences})
+    return days
+
+
+def rebuild_leave_days(db: Session, batch_size: int = 1000) -> int:
+    db.execute(delete(LeaveDay))
+    written = 0
+    batch: list[LeaveRecord] = []
+    records = db.scalars(
+        select(LeaveRecord).where(LeaveRecord.deleted_at.is_(None)).execution_options(yield_per=batch_size)
+    )
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            write_days_batch(db, batch, batch_size)
+            written += len(batch)
+            batch = []
+    write_days_batch(db, batch, batch_size)
+    db.commit()
+    calendar_cache.clear()
+    return written + len(batch)
@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.models import LeaveRecord, RecordType, TransactionSource, User
+from backend.schemas import LeaveImportRow
+from backend.services.leave import apply_balance_change, build_leave_payload, count_range_days
+from backend.services.leave_calendar import expand_record, first_conflict, occupied_days, write_days_batch
+from backend.services.summary import apply_summary_batch
+from backend.services.versions import RECORDS_SCOPE, USERS_SCOPE, bump_versions, user_scope
+from backend.units import units_to_days
+
+
+def parse_import_file(raw: bytes, filename: str | None) -> list[dict[str, Any]]:
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Import file must be UTF-8") from exc
+    if (filename or "").lower().endswith((".jsonl", ".ndjson")):
+        rows = []
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as exc:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSONL on line {line_no}") from exc
+            rows.append(item if isinstance(item, dict) else {})
+        return rows
+    # Blank CSV cells mean "not given", not an empty string.
+    return [{key: value for key, value in row.items() if value not in ("", None)} for row in csv.DictReader(io.StringIO(text))]
+
+
+def _validation_message(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors())
+
+
+@dataclass
+class PreparedImport:
+    total_rows: int
+    entries: list[tuple[int, str, LeaveRecord]] = field(default_factory=list)
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+
+def prepare_import_rows(rows: list[dict[str, Any]]) -> PreparedImport:
+    # Validation and pricing need no session, so the router runs this in a worker thread;
+    # only the lookups and chunked writes in import_leave_rows go through the connection.
+    prepared = PreparedImport(total_rows=len(rows))
+    for index, row in enumerate(rows, start=1):
+        try:
+            item = LeaveImportRow.model_validate(row)
+            record_type = RecordType(item.record_type)
+            start_dt, end_dt, days = build_leave_payload(
+                record_type, item.start_date, item.end_date, item.start_half, item.end_half, item.minutes, count_range=False
+            )
+        except ValidationError as exc:
+            prepared.errors.append({"row": index, "error": _validation_message(exc)})
+            continue
+        except HTTPException as exc:
+            prepared.errors.append({"row": index, "error": exc.detail})
+            continue
+        record = LeaveRecord(
+            record_type=record_type,
+            start_datetime=start_dt,
+            end_datetime=end_dt,
+            total_leave_days=days,
+            minutes=item.minutes,
+            note=item.note,
+        )
+        prepared.entries.append((index, item.username, record))
+    count_range_days([record for _, _, record in prepared.entries])
+    return prepared
+
+
+def import_leave_rows(db: Session, prepared: PreparedImport, dry_run: bool, charge_balance: bool) -> dict[str, Any]:
+    errors = list(prepared.errors)
+    users: dict[str, User] = {}
+    usernames = sorted({username for _, username, _ in prepared.entries})
+    for offset in range(0, len(usernames), settings.import_chunk_size):
+        chunk = usernames[offset : offset + settings.import_chunk_size]
+        users.update((user.username, user) for user in db.scalars(select(User).where(User.username.in_(chunk))))
+
+    by_user: dict[int, list[tuple[int, LeaveRecord]]] = defaultdict(list)
+    for index, username, record in prepared.entries:
+        user = users.get(username)
+        if user is None:
+            errors.append({"row": index, "error": f"Unknown user {username}"})
+            continue
+        record.user_id = user.id
+        by_user[user.id].append((index, record))
+
+    users_by_id = {user.id: user for user in users.values()}
+    accepted: list[LeaveRecord] = []
+    charged: list[str] = []
+    months: set[tuple[int, int]] = set()
+    for user_id, entries in by_user.items():
+        user = users_by_id[user_id]
+        # One range query per user; rows are then checked against it and against each other.
+        expanded = [(index, record, expand_record(record)) for index, record in entries]
+        days = [day for _, _, record_days in expanded for day, _ in record_days]
+        occupied = occupied_days(db, user_id, min(days), max(days)) if days else {}
+        entries = []
+        for index, record, record_days in expanded:
+            overlap = first_conflict(occupied, record_days)
+            if overlap is not None:
+                errors.append({"row": index, "error": f"Overlaps existing leave on {overlap.isoformat()}"})
+                continue
+            for day, part in record_days:
+                occupied.setdefault(day, []).append(part)
+            entries.append((index, record))
+        if not entries:
+            continue
+        total = sum(record.total_leave_days for _, record in entries)
+        if charge_balance and total > 0:
+            try:
+                if dry_run:
+                    if user.leave_balance < total:
+                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Insufficient leave balance")
+                else:
+                    # One ledger entry per user for the whole import; a savepoint keeps a
+                    # rejected user from undoing everyone else's rows.
+                    with db.begin_nested():
+                        apply_balance_change(db, user, -total, TransactionSource.LEAVE_USED, None)
+                    charged.append(user.username)
+            except HTTPException as exc:
+                errors.extend(
+                    {"row": index, "error": f"{exc.detail} for {user.username} ({units_to_days(total)} days)"} for index, _ in entries
+                )
+                continue
+        accepted.extend(record for _, record in entries)
+
+    if not dry_run and accepted:
+        columns = ("user_id", "record_type", "start_datetime", "end_datetime", "total_leave_days", "minutes", "note")
+        for offset in range(0, len(accepted), settings.import_chunk_size):
+            chunk = accepted[offset : offset + settings.import_chunk_size]
+            ids = db.scalars(
+                insert(LeaveRecord).returning(LeaveRecord.id, sort_by_parameter_order=True),
+                [{column: getattr(record, column) for column in columns} for record in chunk],
+            ).all()
+            for record, record_id in zip(chunk, ids):
+                record.id = record_id
+        apply_summary_batch(db, accepted, settings.import_chunk_size)
+        months = write_days_batch(db, accepted, settings.import_chunk_size)
+        bump_versions(
+            db, RECORDS_SCOPE, USERS_SCOPE, *(user_scope(record.user_id) for record in accepted), chunk_size=settings.import_chunk_size
+        )
+        db.commit()
+
+    errors.sort(key=lambda error: error["row"])
+    return {
+        "dry_run": dry_run,
+        "total_rows": prepared.total_rows,
+        "imported": 0 if dry_run else len(accepted),
+        "valid": len(accepted),
+        "failed": len(errors),
+        "charged_users": charged,
+        "months": sorted(months),
+        "errors": errors[: settings.import_max_errors],
+    }
@@ -0,0 +1,215 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timezone
+
+from sqlalchemy import FromClause, and_, func, insert, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from backend.models import BalanceCheckpoint, LeaveTransaction, LeaveTransactionArchive, SystemJob, User
+from backend.services.leave import VN_TZ
+
+# SystemJob marker per archived boundary: run_year Y means transactions created before
+# January 1st of Y (Vietnam time) may live in leave_transactions_archive.
+LEDGER_ARCHIVE_MARKER = "ledger_archive"
+LEDGER_COLUMNS = ("id", "user_id", "change_amount", "balance_after", "source", "reference_id", "created_at")
+
+
+class LedgerDriftError(Exception):
+    def __init__(self, problems: list[str]):
+        self.problems = problems
+        shown = "; ".join(problems[:5])
+        more = f" (+{len(problems) - 5} more)" if len(problems) > 5 else ""
+        super().__init__(f"{len(problems)} ledger problems: {shown}{more}")
+
+
+def local_day_start(day: date) -> datetime:
+    # Ledger timestamps are naive UTC; days are Vietnam days.
+    return datetime.combine(day, time(), tzinfo=VN_TZ).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def archive_horizon(db: Session) -> datetime | None:
+    year = db.scalar(select(func.max(SystemJob.run_year)).where(SystemJob.job_name == LEDGER_ARCHIVE_MARKER))
+    return local_day_start(date(year, 1, 1)) if year else None
+
+
+def ledger_table(include_archived: bool) -> FromClause:
+    # Hot queries read leave_transactions alone; history before the archive horizon needs both.
+    hot = LeaveTransaction.__table__
+    if not include_archived:
+        return hot
+    archive = LeaveTransactionArchive.__table__
+    return union_all(
+        select(*(hot.c[name] for name in LEDGER_COLUMNS)), select(*(archive.c[name] for name in LEDGER_COLUMNS))
+    ).subquery("ledger")
+
+
+def latest_checkpoints(db: Session, cutoff: datetime, user_ids: list[int] | None = None) -> dict[int, tuple[datetime, int]]:
+    latest = select(BalanceCheckpoint.user_id, func.max(BalanceCheckpoint.as_of).label("as_of")).where(
+        BalanceCheckpoint.as_of <= cutoff
+    )
+    if user_ids is not None:
+        latest = latest.where(BalanceCheckpoint.user_id.in_(user_ids))
+    latest = latest.group_by(BalanceCheckpoint.user_id).subquery()
+    rows = db.execute(
+        select(BalanceCheckpoint.user_id, BalanceCheckpoint.as_of, BalanceCheckpoint.balance).join(
+            latest, and_(BalanceCheckpoint.user_id == latest.c.user_id, BalanceCheckpoint.as_of == latest.c.as_of)
+        )
+    )
+    return {user_id: (as_of, balance) for user_id, as_of, balance in rows}
+
+
+def opening_balances(
+    db: Session, user_ids: list[int], chunk_size: int = 1000, ledger: FromClause = LeaveTransaction.__table__
+) -> dict[int, int]:
+    # Balances seeded before the ledger existed are implied by each user's first transaction.
+    openings = {}
+    for offset in range(0, len(user_ids), chunk_size):
+        first = select(func.min(ledger.c.id)).where(ledger.c.user_id.in_(user_ids[offset : offset + chunk_size])).group_by(
+            ledger.c.user_id
+        )
+        rows = db.execute(select(ledger.c.user_id, ledger.c.balance_after - ledger.c.change_amount).where(ledger.c.id.in_(first)))
+        openings.update(rows.all())
+    return openings
+
+
+def write_checkpoints(db: Session, as_of: datetime, chunk_size: int = 1000) -> int:
+    # Every run checkpoints each user with transactions since the previous run, so a user's
+    # latest checkpoint plus the transactions after it always covers their whole history.
+    previous = db.scalar(select(func.max(BalanceCheckpoint.as_of)))
+    if previous is not None and previous >= as_of:
+        return 0
+    tail = select(LeaveTransaction.user_id, func.sum(LeaveTransaction.change_amount)).where(LeaveTransaction.created_at < as_of)
+    if previous is not None:
+        tail = tail.where(LeaveTransaction.created_at >= previous)
+    changes = dict(db.execute(tail.group_by(LeaveTransaction.user_id)).all())
+    if not changes:
+        return 0
+
+    user_ids = sorted(changes)
+    starts = {user_id: balance for user_id, (_, balance) in latest_checkpoints(db, as_of, user_ids).items()}
+    starts.update(opening_balances(db, [user_id for user_id in user_ids if user_id not in starts], chunk_size))
+    rows = [{"user_id": user_id, "as_of": as_of, "balance": starts[user_id] + changes[user_id]} for user_id in user_ids]
+    for offset in range(0, len(rows), chunk_size):
+        db.execute(insert(BalanceCheckpoint), rows[offset : offset + chunk_size])
+    db.commit()
+    return len(rows)
+
+
+def balances_at(db: Session, cutoff: datetime, user_ids: list[int] | None = None) -> list[tuple[int, str, int]]:
+    # Balance after every transaction created strictly before cutoff: nearest checkpoint plus
+    # the few transactions after it, instead of summing each user's whole history.
+    users = select(User.id, User.username, User.leave_balance).where(User.created_at < cutoff).order_by(User.id)
+    if user_ids is not None:
+        users = users.where(User.id.in_(user_ids))
+    users = db.execute(users).all()
+    checkpoints = latest_checkpoints(db, cutoff, user_ids)
+
+    # Archiving seals every archived user with a checkpoint at the horizon, so only cutoffs
+    # before it have to read the archive.
+    horizon = archive_horizon(db)
+    ledger = ledger_table(horizon is not None and cutoff < horizon)
+
+    # No checkpoint means the whole history is the tail; the bounds push down to the
+    # (user_id, created_at) index.
+    latest = (
+        select(BalanceCheckpoint.user_id, func.max(BalanceCheckpoint.as_of).label("as_of"))
+        .where(BalanceCheckpoint.as_of <= cutoff)
+        .group_by(BalanceCheckpoint.user_id)
+        .subquery()
+    )
+    tail = (
+        select(ledger.c.user_id, func.sum(ledger.c.change_amount))
+        .outerjoin(latest, latest.c.user_id == ledger.c.user_id)
+        .where(ledger.c.created_at < cutoff, or_(latest.c.as_of.is_(None), ledger.c.created_at >= latest.c.as_of))
+        .group_by(ledger.c.user_id)
+    )
+    if user_ids is not None:
+        tail = tail.where(ledger.c.user_id.in_(user_ids))
+    tails = dict(db.execute(tail).all())
+
+    unanchored = [user_id for user_id, _, _ in users if user_id not in checkpoints]
+    openings = opening_balances(db, unanchored, ledger=ledger) if unanchored else {}
+    balances = []
+    for user_id, username, current in users:
+        if user_id in checkpoints:
+            start = checkpoints[user_id][1]
+        else:
+            # Never touched the ledger at all: the stored balance is the only one it ever had.
+            start = openings.get(user_id, current)
+        balances.append((user_id, username, start + tails.get(user_id, 0)))
+    return balances
+
+
+def replay_ledger(db: Session, batch_size: int = 5000) -> list[str]:
+    # Walks each user's transactions in id order and re-adds every change_amount. With integer
+    # hundredths the running total must equal each balance_after and checkpoint exactly, and
+    # the last one must equal users.leave_balance; any difference is real drift, not rounding.
+    # Archived years are not replayed: the checkpoint sealed at the archive horizon stands in
+    # for them as each user's opening balance.
+    balances = dict(db.execute(select(User.id, User.leave_balance)).all())
+    checkpoints: dict[int, list[tuple[datetime, int]]] = defaultdict(list)
+    for user_id, as_of, balance in db.execute(
+        select(BalanceCheckpoint.user_id, BalanceCheckpoint.as_of, BalanceCheckpoint.balance).order_by(
+            BalanceCheckpoint.user_id, BalanceCheckpoint.as_of.desc()
+        )
+    ):
+        checkpoints[user_id].append((as_of, balance))
+    rows = db.execute(
+        select(
+            LeaveTransaction.id,
+            LeaveTransaction.user_id,
+            LeaveTransaction.change_amount,
+            LeaveTransaction.balance_after,
+            LeaveTransaction.created_at,
+        )
+        .order_by(LeaveTransaction.user_id, LeaveTransaction.id)
+        .execution_options(yield_per=batch_size)
+    )
+    problems = []
+    user_id = running = None
+
+    def check_checkpoints(before: datetime | None):
+        pending = checkpoints.get(user_id, [])
+        while pending and (before is None or pending[-1][0] <= before):
+            as_of, balance = pending.pop()
+            if balance != running:
+                problems.append(f"user={user_id}: checkpoint at {as_of.isoformat()} is {balance}, ledger says {running}")
+
+    def close_user():
+        if user_id is None:
+            return
+        check_checkpoints(None)
+        if balances.get(user_id) != running:
+            problems.append(f"user={user_id}: balance {balances.get(user_id)} != ledger {running} (changed outside the ledger)")
+
+    for tx_id, tx_user_id, change_amount, balance_after, created_at in rows:
+        if tx_user_id != user_id:
+            close_user()
+            user_id = tx_user_id
+            # Balances may be seeded before the first entry, so the opening balance is implied.
+            running = balance_after - change_amount
+            if running < 0:
+                problems.append(f"user={user_id} tx={tx_id}: implied opening balance {running} < 0")
+        check_checkpoints(created_at)
+        running += change_amount
+        if running != balance_after:
+            problems.append(f"user={user_id} tx={tx_id}: balance_after {balance_after} != replayed {running}")
+            running = balance_after
+        if running < 0:
+            problems.append(f"user={user_id} tx={tx_id}: balance went negative ({running})")
+    close_user()
+    # Checkpointed users with no hot entries (all archived) cannot have moved since.
+    for orphan_user, pending in sorted(checkpoints.items()):
+        for as_of, balance in pending:
+            if balance != balances.get(orphan_user):
+                problems.append(
+                    f"user={orphan_user}: checkpoint at {as_of.isoformat()} is {balance}, balance {balances.get(orphan_user)} "
+                    "with no ledger entries since"
+                )
+    return problems
+
+
+def check_ledger(db: Session) -> int:
+    problems = replay_ledger(db)
+    if problems:
+        raise LedgerDriftError(problems)
+    return 0
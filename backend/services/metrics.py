@@ -0,0 +1,190 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Sequence
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+from backend.config import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CHAT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+
+_registry: list["Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values: str, value: float):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # per-bucket counts, then +Inf count and sum
+                series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def _samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0.0
+                for bound, count in zip((*self.buckets, "+Inf"), series):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+request_db_queries = Histogram(
+    "http_request_db_queries", "DB queries issued per HTTP request.", ("route",), buckets=QUERY_COUNT_BUCKETS
+)
+request_db_time = Histogram("http_request_db_seconds", "DB time spent per HTTP request.", ("route",))
+db_query_latency = Histogram("db_query_duration_seconds", "Cursor execution time per statement.", ("engine",))
+db_replica_healthy = Gauge("db_replica_healthy", "1 while a read replica passes its health check.", ("engine",))
+db_pool_checkout = Histogram("db_pool_checkout_seconds", "Time spent waiting for a pooled DB connection.", ("engine",))
+chat_latency = Histogram(
+    "chat_provider_duration_seconds", "Chat backend call latency by provider.", ("provider", "outcome"), buckets=CHAT_BUCKETS
+)
+job_runs = Counter("scheduler_job_runs_total", "Scheduled job runs by outcome.", ("job", "status"))
+job_duration = Histogram("scheduler_job_duration_seconds", "Scheduled job run time.", ("job",), buckets=JOB_BUCKETS)
+job_rows = Counter("scheduler_job_rows_total", "Rows written by scheduled jobs.", ("job",))
+
+
+@dataclass
+class RequestStats:
+    db_queries: int = 0
+    db_seconds: float = 0.0
+
+
+# Holds a mutable object so updates from threadpool workers and SQLAlchemy's greenlets,
+# which run on copies of the request context, are still seen by the middleware.
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+_recent_statements: deque[tuple[float, str, str, float]] = deque(maxlen=settings.db_recent_statements)
+_recent_lock = threading.Lock()
+
+
+def instrument_engine(engine: Engine, label: str):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        db_query_latency.observe(elapsed, label)
+        with _recent_lock:
+            _recent_statements.append((elapsed, label, statement, time.time()))
+        stats = request_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start time, or the
+        # pooled connection keeps it and every later timing pops the wrong entry.
+        conn = exception_context.connection
+        if conn is not None and exception_context.execution_context is not None and conn.info.get("query_started_at"):
+            conn.info["query_started_at"].pop()
+
+
+def slowest_statements(limit: int = 10) -> list[dict[str, Any]]:
+    with _recent_lock:
+        recent = list(_recent_statements)
+    recent.sort(key=lambda item: item[0], reverse=True)
+    return [
+        {"duration_ms": round(elapsed * 1000, 3), "engine": label, "statement": statement[:500], "at": at}
+        for elapsed, label, statement, at in recent[:limit]
+    ]
+
+
+def timed_pool(base: type[Pool], label: str) -> type[Pool]:
+    class TimedPool(base):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                db_pool_checkout.observe(time.perf_counter() - started, label)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
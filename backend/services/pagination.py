@@ -0,0 +1,60 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+
+
+def encode_cursor(values: tuple[Any, ...]) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: list[ColumnElement]) -> tuple[Any, ...]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(columns):
+            raise ValueError("cursor arity mismatch")
+        return tuple(
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        )
+    except (ValueError, TypeError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from exc
+
+
+def should_count(include_total: bool | None, cursor: str | None) -> bool:
+    # Counting is the expensive part of deep paging, so cursor mode skips it unless asked.
+    return include_total if include_total is not None else cursor is None
+
+
+async def count_rows(db: AsyncSession, stmt: Select) -> int:
+    return await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+
+
+async def keyset_paginate(
+    db: AsyncSession,
+    stmt: Select,
+    columns: list[ColumnElement],
+    page: int,
+    page_size: int,
+    cursor: str | None,
+    scalars: bool = True,
+) -> tuple[list[Any], str | None]:
+    # Newest first on a unique (sort key, id) tuple; a cursor seeks past the last row instead of OFFSET.
+    stmt = stmt.order_by(*(column.desc() for column in columns))
+    if cursor:
+        stmt = stmt.where(tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)))
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+
+    stmt = stmt.limit(page_size + 1)
+    items = list((await db.scalars(stmt)).all() if scalars else (await db.execute(stmt)).all())
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    return items, encode_cursor(tuple(getattr(items[-1], column.key) for column in columns))
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from backend.config import settings
+from backend.services.cache import TTLCache
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+failed_logins = TTLCache("failed_logins", settings.auth_cache_size, settings.failed_login_ttl_s)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class HashPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _release(self, _: Future | None):
+        with self._lock:
+            self.pending -= 1
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Password hashing is busy, retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        return self._submit(fn, *args).result()
+
+    async def run_async(self, fn, *args):
+        if self.workers <= 0:
+            return await asyncio.to_thread(fn, *args)
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+hash_pool = HashPool(settings.password_hash_workers, settings.password_hash_queue_max)
+
+
+def hash_password(password: str) -> str:
+    return hash_pool.run(_hash, password)
+
+
+def verify_and_update_password(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return hash_pool.run(_verify_and_update, password, hashed_password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return verify_and_update_password(password, hashed_password)[0]
+
+
+async def hash_password_async(password: str) -> str:
+    return await hash_pool.run_async(_hash, password)
+
+
+async def verify_and_update_password_async(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await hash_pool.run_async(_verify_and_update, password, hashed_password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return (await verify_and_update_password_async(password, hashed_password))[0]
+
+
+def _failed_login_key(username: str, hashed_password: str) -> str:
+    # The user plus their stored hash, so a password change starts a fresh count. No attempted
+    # password ever goes into the key.
+    message = f"{username}\0{hashed_password}".encode()
+    return hmac.new(settings.jwt_secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def login_retry_after(username: str, hashed_password: str) -> float:
+    # Seconds until the next attempt is verified again; 0 when it may go ahead.
+    entry = failed_logins.get(_failed_login_key(username, hashed_password))
+    return max(0.0, entry[1] - time.monotonic()) if entry else 0.0
+
+
+def remember_failed_login(username: str, hashed_password: str):
+    # After failed_login_free_attempts the wait doubles per failure, capped at the TTL, and
+    # attempts inside it are refused before any bcrypt work.
+    key = _failed_login_key(username, hashed_password)
+    failures = (failed_logins.get(key) or (0, 0.0))[0] + 1
+    over = failures - settings.failed_login_free_attempts
+    delay = min(settings.failed_login_backoff_s * 2 ** (over - 1), settings.failed_login_ttl_s) if over > 0 else 0.0
+    failed_logins.set(key, (failures, time.monotonic() + delay))
+
+
+def forget_failed_logins(username: str, hashed_password: str):
+    failed_logins.pop(_failed_login_key(username, hashed_password))
@@ -1,12 +1,19 @@
+from collections.abc import AsyncIterator
 from typing import Any
 
-import httpx
-
 from backend.config import QWEN_API_BASE, QWEN_API_KEY
 from backend.schemas import BotConfig, BotResult
+from backend.services.chat_stream import error_event, stream_completion
+from backend.services.http_pool import post_json
 from backend.services.timer import elapsed_ms, start_timer
 
 
+def qwen_endpoint() -> str:
+    # Never the caller's BotConfig.endpoint: the request carries QWEN_API_KEY, so it only
+    # ever goes to the configured provider.
+    return f"{QWEN_API_BASE}/chat/completions"
+
+
 async def call_qwen_api(bot: BotConfig, question: str, timeout_s: float) -> BotResult:
     if not QWEN_API_KEY:
         return BotResult(
@@ -19,32 +26,29 @@ async def call_qwen_api(bot: BotConfig, question: str, timeout_s: float) -> BotR
             error="Missing QWEN_API_KEY environment variable.",
         )
 
-    endpoint = bot.endpoint or f"{QWEN_API_BASE}/chat/completions"
+    endpoint = qwen_endpoint()
     payload: dict[str, Any] = {
         "model": bot.model,
         "messages": [{"role": "user", "content": question}],
-        "temperature": 0.7,
+        "temperature": bot.temperature,
     }
 
     headers = {"Authorization": f"Bearer {QWEN_API_KEY}"}
 
     start_time = start_timer()
     try:
-        async with httpx.AsyncClient(timeout=timeout_s) as client:
-            response = await client.post(endpoint, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            answer = data["choices"][0]["message"]["content"]
-            model_name = data.get("model", bot.model)
-            latency = elapsed_ms(start_time)
-            return BotResult(
-                side="right",
-                bot_name=bot.name,
-                model=model_name,
-                answer=answer,
-                latency_ms=latency,
-                provider="qwen_api",
-            )
+        data = await post_json(endpoint, payload, timeout_s, headers=headers)
+        answer = data["choices"][0]["message"]["content"]
+        model_name = data.get("model", bot.model)
+        latency = elapsed_ms(start_time)
+        return BotResult(
+            side="right",
+            bot_name=bot.name,
+            model=model_name,
+            answer=answer,
+            latency_ms=latency,
+            provider="qwen_api",
+        )
     except Exception as exc:  # pragma: no cover - surface to client
         latency = elapsed_ms(start_time)
         return BotResult(
@@ -56,3 +60,19 @@ async def call_qwen_api(bot: BotConfig, question: str, timeout_s: float) -> BotR
             provider="qwen_api",
             error=str(exc),
         )
+
+
+async def stream_qwen_api(bot: BotConfig, question: str, timeout_s: float, side: str = "right") -> AsyncIterator[dict[str, Any]]:
+    if not QWEN_API_KEY:
+        yield error_event(bot, side, "qwen_api", "Missing QWEN_API_KEY environment variable.")
+        return
+
+    endpoint = qwen_endpoint()
+    payload: dict[str, Any] = {
+        "model": bot.model,
+        "messages": [{"role": "user", "content": question}],
+        "temperature": bot.temperature,
+    }
+    headers = {"Authorization": f"Bearer {QWEN_API_KEY}"}
+    async for event in stream_completion(bot, side, "qwen_api", endpoint, payload, timeout_s, headers=headers):
+        yield event
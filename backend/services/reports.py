@@ -0,0 +1,93 @@
+from collections.abc import Awaitable, Callable
+from datetime import date, datetime, time, timedelta
+from typing import Any
+
+from fastapi import HTTPException, status
+from sqlalchemy import case, extract, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import settings
+from backend.models import LeaveRecord, RecordType, User
+from backend.services.cache import TTLCache
+
+report_cache = TTLCache("admin_reports", 256, settings.report_cache_ttl_s)
+
+
+def report_filters(start: date | None, end: date | None) -> list[Any]:
+    # Records are attributed to the day they start on.
+    if start and end and end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must be >= start")
+    filters = [LeaveRecord.deleted_at.is_(None)]
+    if start:
+        filters.append(LeaveRecord.start_datetime >= datetime.combine(start, time.min))
+    if end:
+        filters.append(LeaveRecord.start_datetime < datetime.combine(end + timedelta(days=1), time.min))
+    return filters
+
+
+def _minutes_of(record_type: RecordType):
+    return func.coalesce(func.sum(case((LeaveRecord.record_type == record_type, LeaveRecord.minutes), else_=0)), 0)
+
+
+async def usage_by_user(db: AsyncSession, start: date | None, end: date | None, limit: int) -> list[dict[str, Any]]:
+    totals = (
+        select(
+            LeaveRecord.user_id,
+            func.count().label("records"),
+            func.coalesce(func.sum(LeaveRecord.total_leave_days), 0).label("days"),
+            _minutes_of(RecordType.LATE).label("late_minutes"),
+            _minutes_of(RecordType.EARLY).label("early_minutes"),
+        )
+        .where(*report_filters(start, end))
+        .group_by(LeaveRecord.user_id)
+        .subquery()
+    )
+    rows = await db.execute(
+        select(totals, User.username)
+        .join(User, User.id == totals.c.user_id)
+        .order_by(totals.c.days.desc(), totals.c.user_id)
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+async def usage_by_type(db: AsyncSession, start: date | None, end: date | None) -> list[dict[str, Any]]:
+    rows = await db.execute(
+        select(
+            LeaveRecord.record_type,
+            func.count().label("records"),
+            func.coalesce(func.sum(LeaveRecord.total_leave_days), 0).label("days"),
+            func.coalesce(func.sum(LeaveRecord.minutes), 0).label("minutes"),
+        )
+        .where(*report_filters(start, end))
+        .group_by(LeaveRecord.record_type)
+        .order_by(LeaveRecord.record_type)
+    )
+    return [{**row._mapping, "record_type": row.record_type.value} for row in rows]
+
+
+async def usage_by_month(db: AsyncSession, start: date | None, end: date | None) -> list[dict[str, Any]]:
+    year = extract("year", LeaveRecord.start_datetime)
+    month = extract("month", LeaveRecord.start_datetime)
+    rows = await db.execute(
+        select(
+            year.label("year"),
+            month.label("month"),
+            func.count().label("records"),
+            func.coalesce(func.sum(LeaveRecord.total_leave_days), 0).label("days"),
+            _minutes_of(RecordType.LATE).label("late_minutes"),
+            _minutes_of(RecordType.EARLY).label("early_minutes"),
+        )
+        .where(*report_filters(start, end))
+        .group_by(year, month)
+        .order_by(year, month)
+    )
+    return [{**row._mapping, "year": int(row.year), "month": int(row.month)} for row in rows]
+
+
+async def cached_report(key: tuple[Any, ...], compute: Callable[[], Awaitable[list[dict[str, Any]]]]) -> list[dict[str, Any]]:
+    rows = report_cache.get(key)
+    if rows is None:
+        rows = await compute()
+        report_cache.set(key, rows)
+    return rows
@@ -0,0 +1,160 @@
+from calendar import monthrange
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import date, timedelta
+from typing import Any
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from backend.models import LeaveRecord, RecordType, UserLeaveSummary
+from backend.services.leave import range_halves
+from backend.services.workdays import count_business_days, is_business_day
+from backend.units import HALF_DAY, UNITS_PER_DAY
+
+SummaryKey = tuple[int, int, int, RecordType]
+SUMMARY_CONFLICT_COLUMNS = ["user_id", "year", "month", "record_type"]
+
+
+def month_parts(record: LeaveRecord) -> dict[tuple[int, int], int]:
+    start = record.start_datetime.date()
+    end = record.end_datetime.date()
+    first = (start.year, start.month)
+    parts = {first: 0}
+    if record.record_type == RecordType.RANGE and first != (end.year, end.month):
+        start_half, end_half = range_halves(record.start_datetime, record.end_datetime)
+        segment_start = start
+        while segment_start <= end:
+            month_end = date(segment_start.year, segment_start.month, monthrange(segment_start.year, segment_start.month)[1])
+            segment_end = min(end, month_end)
+            days = count_business_days(segment_start, segment_end) * UNITS_PER_DAY
+            if segment_start == start and start_half == "PM" and is_business_day(start):
+                days -= HALF_DAY
+            if segment_end == end and end_half == "AM" and is_business_day(end):
+                days -= HALF_DAY
+            parts[(segment_start.year, segment_start.month)] = days
+            segment_start = segment_end + timedelta(days=1)
+    # Anchor on the stored total so the months always add up to what was charged, even if
+    # the holiday calendar changed after the record was written.
+    parts[first] += record.total_leave_days - sum(parts.values())
+    return parts
+
+
+def summary_deltas(record: LeaveRecord, sign: int = 1) -> list[dict[str, Any]]:
+    minutes_month = (record.start_datetime.year, record.start_datetime.month)
+    return [
+        {
+            "user_id": record.user_id,
+            "year": year,
+            "month": month,
+            "record_type": record.record_type,
+            "days": sign * days,
+            "minutes": sign * (record.minutes or 0) if (year, month) == minutes_month else 0,
+        }
+        for (year, month), days in month_parts(record).items()
+    ]
+
+
+def _upsert_deltas(db: Session, rows: list[dict[str, Any]]):
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt = (pg_insert if dialect == "postgresql" else sqlite_insert)(UserLeaveSummary).values(rows)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=SUMMARY_CONFLICT_COLUMNS,
+                set_={
+                    "days": UserLeaveSummary.days + stmt.excluded.days,
+                    "minutes": UserLeaveSummary.minutes + stmt.excluded.minutes,
+                },
+            )
+        )
+        return
+    for row in rows:
+        updated = db.execute(
+            update(UserLeaveSummary)
+            .where(*(getattr(UserLeaveSummary, column) == row[column] for column in SUMMARY_CONFLICT_COLUMNS))
+            .values(days=UserLeaveSummary.days + row["days"], minutes=UserLeaveSummary.minutes + row["minutes"])
+        )
+        if updated.rowcount == 0:
+            db.execute(insert(UserLeaveSummary).values(row))
+
+
+def apply_summary_change(db: Session, record: LeaveRecord, sign: int):
+    _upsert_deltas(db, summary_deltas(record, sign))
+
+
+def apply_summary_batch(db: Session, records: Iterable[LeaveRecord], chunk_size: int = 1000):
+    # Merge deltas per bucket first: one upsert statement may not touch the same row twice.
+    merged: dict[SummaryKey, dict[str, Any]] = {}
+    for record in records:
+        for row in summary_deltas(record):
+            key = (row["user_id"], row["year"], row["month"], row["record_type"])
+            if key in merged:
+                merged[key]["days"] += row["days"]
+                merged[key]["minutes"] += row["minutes"]
+            else:
+                merged[key] = row
+    rows = list(merged.values())
+    for offset in range(0, len(rows), chunk_size):
+        _upsert_deltas(db, rows[offset : offset + chunk_size])
+
+
+def compute_summary(db: Session, batch_size: int = 1000) -> dict[SummaryKey, list[int]]:
+    totals: dict[SummaryKey, list[int]] = defaultdict(lambda: [0, 0])
+    records = db.scalars(
+        select(LeaveRecord).where(LeaveRecord.deleted_at.is_(None)).execution_options(yield_per=batch_size)
+    )
+    for record in records:
+        for row in summary_deltas(record):
+            bucket = totals[(row["user_id"], row["year"], row["month"], row["record_type"])]
+            bucket[0] += row["days"]
+            bucket[1] += row["minutes"]
+    return totals
+
+
+def rebuild_summary(db: Session, batch_size: int = 1000) -> int:
+    totals = compute_summary(db, batch_size)
+    db.execute(delete(UserLeaveSummary))
+    rows = [
+        {"user_id": user_id, "year": year, "month": month, "record_type": record_type, "days": days, "minutes": minutes}
+        for (user_id, year, month, record_type), (days, minutes) in totals.items()
+    ]
+    for offset in range(0, len(rows), batch_size):
+        db.execute(insert(UserLeaveSummary), rows[offset : offset + batch_size])
+    db.commit()
+    return len(rows)
+
+
+def verify_summary(db: Session) -> list[str]:
+    expected = {key: tuple(totals) for key, totals in compute_summary(db).items()}
+    stored = {(row.user_id, row.year, row.month, row.record_type): (row.days, row.minutes) for row in db.scalars(select(UserLeaveSummary))}
+    problems = []
+    for key in sorted(expected.keys() | stored.keys(), key=lambda item: (*item[:3], item[3].value)):
+        want = expected.get(key, (0, 0))
+        have = stored.get(key, (0, 0))
+        if want != have:
+            user_id, year, month, record_type = key
+            problems.append(
+                f"user={user_id} {year}-{month:02d} {record_type.value}: summary units={have[0]} minutes={have[1]}, "
+                f"records units={want[0]} minutes={want[1]}"
+            )
+
+    # Independent cross-check straight from SQL: per-user day totals must match the records.
+    record_totals = dict(
+        db.execute(
+            select(LeaveRecord.user_id, func.sum(LeaveRecord.total_leave_days))
+            .where(LeaveRecord.deleted_at.is_(None))
+            .group_by(LeaveRecord.user_id)
+        ).all()
+    )
+    summary_totals = dict(
+        db.execute(select(UserLeaveSummary.user_id, func.sum(UserLeaveSummary.days)).group_by(UserLeaveSummary.user_id)).all()
+    )
+    for user_id in sorted(record_totals.keys() | summary_totals.keys()):
+        if (record_totals.get(user_id) or 0) != (summary_totals.get(user_id) or 0):
+            problems.append(
+                f"user={user_id}: summary total {summary_totals.get(user_id) or 0} != records total {record_totals.get(user_id) or 0}"
+            )
+    return problems
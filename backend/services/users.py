@@ -0,0 +1,50 @@
+from typing import Literal
+
+from sqlalchemy import Select, and_, literal, select
+
+from backend.models import User, UserRole
+
+USER_LIST_COLUMNS = (User.id, User.username, User.role, User.leave_balance, User.is_active, User.created_at)
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def username_filter(q: str, match: Literal["prefix", "contains"], dialect: str):
+    if match == "contains":
+        # Served by the pg_trgm GIN index on Postgres; a LIKE scan on SQLite.
+        return User.username.ilike(f"%{escape_like(q)}%", escape="\\")
+    pattern = f"{escape_like(q)}%"
+    if dialect == "postgresql":
+        # Plain LIKE against the varchar_pattern_ops index, which compares bytes whatever the
+        # collation. Backslash is Postgres's default escape, and the pattern is inlined so
+        # prepared statements still plan the prefix into an index range.
+        return User.username.like(literal(pattern, literal_execute=True))
+    # SQLite fallback: the range lets it seek the username b-tree, since its LIKE is
+    # case-insensitive; the LIKE then applies the exact prefix inside the range.
+    return and_(User.username >= q, User.username < q + "\U0010ffff", User.username.like(pattern, escape="\\"))
+
+
+def user_list_query(
+    q: str | None = None,
+    match: Literal["prefix", "contains"] = "prefix",
+    role: UserRole | None = None,
+    is_active: bool | None = None,
+    min_balance: int | None = None,
+    max_balance: int | None = None,
+    *,
+    dialect: str,
+) -> Select:
+    stmt = select(*USER_LIST_COLUMNS)
+    if q:
+        stmt = stmt.where(username_filter(q, match, dialect))
+    if role is not None:
+        stmt = stmt.where(User.role == role)
+    if is_active is not None:
+        stmt = stmt.where(User.is_active.is_(is_active))
+    if min_balance is not None:
+        stmt = stmt.where(User.leave_balance >= min_balance)
+    if max_balance is not None:
+        stmt = stmt.where(User.leave_balance <= max_balance)
+    return stmt
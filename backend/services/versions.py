@@ -0,0 +1,64 @@
+import hashlib
+
+from fastapi import Request, Response
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from backend.models import VersionCounter
+
+# Scopes: "user:<id>" covers one user's balance, profile and records, "users" the user
+# directory, "records" every leave record, and "all" bulk jobs that touch every user.
+USERS_SCOPE = "users"
+RECORDS_SCOPE = "records"
+ALL_SCOPE = "all"
+
+
+def user_scope(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def bump_versions(db: Session, *scopes: str, chunk_size: int = 1000):
+    # Sorted so concurrent writers take the counter row locks in the same order.
+    unique = sorted(set(scopes))
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert_fn = pg_insert if dialect == "postgresql" else sqlite_insert
+        for offset in range(0, len(unique), chunk_size):
+            stmt = insert_fn(VersionCounter).values([{"scope": scope, "version": 1} for scope in unique[offset : offset + chunk_size]])
+            db.execute(stmt.on_conflict_do_update(index_elements=["scope"], set_={"version": VersionCounter.version + 1}))
+        return
+    for scope in unique:
+        updated = db.execute(update(VersionCounter).where(VersionCounter.scope == scope).values(version=VersionCounter.version + 1))
+        if updated.rowcount == 0:
+            db.execute(insert(VersionCounter).values(scope=scope, version=1))
+
+
+async def read_versions(db: AsyncSession, scopes: list[str]) -> dict[str, int]:
+    rows = await db.execute(select(VersionCounter.scope, VersionCounter.version).where(VersionCounter.scope.in_(scopes)))
+    versions = dict(rows.all())
+    return {scope: versions.get(scope, 0) for scope in scopes}
+
+
+def make_etag(request: Request, versions: dict[str, int]) -> str:
+    raw = "|".join([request.url.path, request.url.query, *(f"{scope}={version}" for scope, version in sorted(versions.items()))])
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+async def conditional_get(request: Request, response: Response, db: AsyncSession, *scopes: str) -> Response | None:
+    # Answers from the counters alone: a match costs one primary-key lookup and no table reads.
+    etag = make_etag(request, await read_versions(db, list(scopes)))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,13 +1,30 @@
+from collections.abc import AsyncIterator
 from typing import Any
 
-import httpx
-
+from backend.config import settings
 from backend.schemas import BotConfig, BotResult
+from backend.services.chat_stream import error_event, stream_completion
+from backend.services.http_pool import post_json
 from backend.services.timer import elapsed_ms, start_timer
 
 
-async def call_vllm(bot: BotConfig, question: str, timeout_s: float) -> BotResult:
+def vllm_endpoints() -> list[str]:
+    return [url.strip().rstrip("/") for url in settings.chat_vllm_endpoints.split(",") if url.strip()]
+
+
+def vllm_endpoint(bot: BotConfig) -> str | None:
+    # Only operator-configured servers: BotConfig.endpoint comes from the caller, and honouring
+    # it as given would let any signed-in user make the server POST anywhere.
+    allowed = vllm_endpoints()
     if not bot.endpoint:
+        return allowed[0] if allowed else None
+    endpoint = bot.endpoint.rstrip("/")
+    return endpoint if endpoint in allowed else None
+
+
+async def call_vllm(bot: BotConfig, question: str, timeout_s: float) -> BotResult:
+    endpoint = vllm_endpoint(bot)
+    if not endpoint:
         return BotResult(
             side="left",
             bot_name=bot.name,
@@ -15,32 +32,29 @@ async def call_vllm(bot: BotConfig, question: str, timeout_s: float) -> BotResul
             answer="",
             latency_ms=0,
             provider="vllm",
-            error="Missing vLLM endpoint.",
+            error="Missing or unlisted vLLM endpoint.",
         )
 
     payload: dict[str, Any] = {
         "model": bot.model,
         "messages": [{"role": "user", "content": question}],
-        "temperature": 0.7,
+        "temperature": bot.temperature,
     }
 
     start_time = start_timer()
     try:
-        async with httpx.AsyncClient(timeout=timeout_s) as client:
-            response = await client.post(bot.endpoint, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            answer = data["choices"][0]["message"]["content"]
-            model_name = data.get("model", bot.model)
-            latency = elapsed_ms(start_time)
-            return BotResult(
-                side="left",
-                bot_name=bot.name,
-                model=model_name,
-                answer=answer,
-                latency_ms=latency,
-                provider="vllm",
-            )
+        data = await post_json(endpoint, payload, timeout_s)
+        answer = data["choices"][0]["message"]["content"]
+        model_name = data.get("model", bot.model)
+        latency = elapsed_ms(start_time)
+        return BotResult(
+            side="left",
+            bot_name=bot.name,
+            model=model_name,
+            answer=answer,
+            latency_ms=latency,
+            provider="vllm",
+        )
     except Exception as exc:  # pragma: no cover - surface to client
         latency = elapsed_ms(start_time)
         return BotResult(
@@ -52,3 +66,18 @@ async def call_vllm(bot: BotConfig, question: str, timeout_s: float) -> BotResul
             provider="vllm",
             error=str(exc),
         )
+
+
+async def stream_vllm(bot: BotConfig, question: str, timeout_s: float, side: str = "left") -> AsyncIterator[dict[str, Any]]:
+    endpoint = vllm_endpoint(bot)
+    if not endpoint:
+        yield error_event(bot, side, "vllm", "Missing or unlisted vLLM endpoint.")
+        return
+
+    payload: dict[str, Any] = {
+        "model": bot.model,
+        "messages": [{"role": "user", "content": question}],
+        "temperature": bot.temperature,
+    }
+    async for event in stream_completion(bot, side, "vllm", endpoint, payload, timeout_s):
+        yield event
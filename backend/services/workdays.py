@@ -0,0 +1,86 @@
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Sequence
+from datetime import date
+
+import numpy as np
+
+from backend.config import settings
+
+
+class HolidayCalendar:
+    def __init__(self, holidays: Iterable[date] = ()):
+        # Weekend holidays never change a business-day count, so only weekdays are kept.
+        self._by_year: dict[int, list[date]] = {}
+        for day in sorted(set(holidays)):
+            if day.weekday() < 5:
+                self._by_year.setdefault(day.year, []).append(day)
+        self._np_holidays = np.array(
+            [day for days in self._by_year.values() for day in days], dtype="datetime64[D]"
+        )
+
+    @classmethod
+    def from_string(cls, raw: str) -> "HolidayCalendar":
+        return cls(date.fromisoformat(item.strip()) for item in raw.split(",") if item.strip())
+
+    def is_holiday(self, day: date) -> bool:
+        days = self._by_year.get(day.year)
+        if not days:
+            return False
+        idx = bisect_left(days, day)
+        return idx < len(days) and days[idx] == day
+
+    def count_between(self, start: date, end: date) -> int:
+        total = 0
+        for year, days in self._by_year.items():
+            if start.year <= year <= end.year:
+                total += bisect_right(days, end) - bisect_left(days, start)
+        return total
+
+    @property
+    def np_holidays(self) -> np.ndarray:
+        return self._np_holidays
+
+
+_calendar = HolidayCalendar.from_string(settings.holidays)
+
+
+def get_holiday_calendar() -> HolidayCalendar:
+    return _calendar
+
+
+def set_holiday_calendar(calendar: HolidayCalendar) -> None:
+    global _calendar
+    _calendar = calendar
+
+
+def is_business_day(day: date) -> bool:
+    return day.weekday() < 5 and not _calendar.is_holiday(day)
+
+
+def count_weekdays(start: date, end: date) -> int:
+    if end < start:
+        return 0
+    weeks, rem = divmod((end - start).days + 1, 7)
+    first = start.weekday()
+    # The trailing partial week covers weekdays first .. first + rem - 1, possibly wrapping past Sunday.
+    head = max(0, min(first + rem, 5) - first)
+    wrapped = max(0, min(first + rem - 7, 5))
+    return weeks * 5 + head + wrapped
+
+
+def count_business_days(start: date, end: date) -> int:
+    if end < start:
+        return 0
+    return count_weekdays(start, end) - _calendar.count_between(start, end)
+
+
+def to_datetime64(days: Sequence[date]) -> np.ndarray:
+    return np.array(days, dtype="datetime64[D]")
+
+
+def count_business_days_batch(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    return np.busday_count(starts, ends + np.timedelta64(1, "D"), holidays=_calendar.np_holidays)
+
+
+def is_business_day_batch(days: np.ndarray) -> np.ndarray:
+    return np.is_busday(days, holidays=_calendar.np_holidays)
@@ -0,0 +1,26 @@
+from decimal import Decimal, InvalidOperation
+from typing import Any
+
+# Leave quantities (balances, ledger amounts, record totals, summaries) are integer hundredths
+# of a day everywhere below the API: 1.5 days is 150. Schemas convert at the boundary.
+UNITS_PER_DAY = 100
+HALF_DAY = UNITS_PER_DAY // 2
+
+
+def days_to_units(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError("expected a number of days")
+    try:
+        units = Decimal(str(value)) * UNITS_PER_DAY
+    except InvalidOperation as exc:
+        raise ValueError("expected a number of days") from exc
+    if not units.is_finite() or units != units.to_integral_value():
+        raise ValueError("leave amounts allow at most 2 decimal places")
+    return int(units)
+
+
+def units_to_days(value: Any) -> float:
+    # Strict on purpose: a float here means days leaked past the boundary somewhere.
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("expected integer hundredths of a day")
+    return value / UNITS_PER_DAY
@@ -1,6 +1,9 @@
 const API = `${window.location.origin}/api`;
 let token = localStorage.getItem('token');
 let me = null;
+let pollTimer = null;
+const POLL_MS = 30000;
+const etagCache = new Map();
 
 const $ = (id) => document.getElementById(id);
 
@@ -13,6 +16,21 @@ async function api(path, options = {}) {
   return res.json();
 }
 
+// Polled reads send the last ETag; a 304 costs the server one counter lookup and we reuse the stored body.
+async function getCached(path) {
+  const headers = {};
+  if (token) headers.Authorization = `Bearer ${token}`;
+  const cached = etagCache.get(path);
+  if (cached) headers['If-None-Match'] = cached.etag;
+  const res = await fetch(`${API}${path}`, { headers, cache: 'no-store' });
+  if (res.status === 304 && cached) return cached.data;
+  if (!res.ok) throw new Error(await res.text());
+  const data = await res.json();
+  const etag = res.headers.get('ETag');
+  if (etag) etagCache.set(path, { etag, data });
+  return data;
+}
+
 async function loginOrRegister(path) {
   const username = $('username').value.trim();
   const password = $('password').value;
@@ -42,7 +60,7 @@ async function createRecord() {
 }
 
 async function loadBalance() {
-  const data = await api('/leave/balance');
+  const data = await getCached('/leave/balance');
   $('balance').textContent = `Balance: ${data.leave_balance}`;
 }
 
@@ -57,19 +75,43 @@ function renderRecords(target, items) {
 }
 
 async function loadMyRecords() {
-  const data = await api('/leave/my?page=1&page_size=20');
+  const data = await getCached('/leave/my?page=1&page_size=20');
   renderRecords($('my-list'), data.items);
 }
 
+let userCursor = null;
+
+function userListPath(cursor) {
+  const params = new URLSearchParams({ page_size: '50', include_total: 'false' });
+  const q = $('user-search').value.trim();
+  if (q) params.set('q', q);
+  if (cursor) params.set('cursor', cursor);
+  return `/admin/users?${params}`;
+}
+
+function renderUsers(users, append) {
+  const html = users.map((u) => `<li>${u.username} - ${u.role} - balance ${u.leave_balance}</li>`).join('');
+  $('user-list').innerHTML = append ? $('user-list').innerHTML + html : html;
+}
+
 async function loadUsers() {
   if (me.role !== 'admin') return;
-  const users = await api('/admin/users');
-  $('user-list').innerHTML = users.map((u) => `<li>${u.username} - ${u.role} - balance ${u.leave_balance}</li>`).join('');
+  const data = await getCached(userListPath(null));
+  renderUsers(data.items, false);
+  userCursor = data.next_cursor;
+  $('more-users-btn').classList.toggle('hidden', !userCursor);
+}
+
+async function loadMoreUsers() {
+  const data = await api(userListPath(userCursor));
+  renderUsers(data.items, true);
+  userCursor = data.next_cursor;
+  $('more-users-btn').classList.toggle('hidden', !userCursor);
 }
 
 async function loadAllRecords() {
   if (me.role !== 'admin') return;
-  const data = await api('/admin/all-records?page=1&page_size=20');
+  const data = await getCached('/admin/all-records?page=1&page_size=20');
   renderRecords($('all-records'), data.items);
 }
 
@@ -81,19 +123,76 @@ async function createUser() {
   await loadUsers();
 }
 
+function formatStats(stats) {
+  if (!stats) return '';
+  if (stats.error) return `Error: ${stats.error}`;
+  const first = stats.first_token_ms === null ? '-' : stats.first_token_ms.toFixed(0);
+  return `${stats.model} - first token ${first} ms, total ${stats.latency_ms.toFixed(0)} ms, ${stats.tokens_per_s.toFixed(1)} tok/s`;
+}
+
+async function streamCompare() {
+  const payload = {
+    question: $('chat-question').value,
+    left_bot: { type: 'vllm', name: 'vLLM', model: $('left-model').value, endpoint: $('left-endpoint').value || null },
+    right_bot: { type: 'qwen_api', name: 'Qwen', model: $('right-model').value },
+  };
+  ['left', 'right'].forEach((side) => { $(`${side}-answer`).textContent = ''; $(`${side}-stats`).textContent = ''; });
+
+  const headers = { 'Content-Type': 'application/json' };
+  if (token) headers.Authorization = `Bearer ${token}`;
+  const res = await fetch(`${API}/chat/compare/stream`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify(payload),
+  });
+  if (!res.ok) throw new Error(await res.text());
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+    const lines = buffered.split('\n');
+    buffered = lines.pop();
+    lines.filter(Boolean).forEach((line) => {
+      const event = JSON.parse(line);
+      if (event.type === 'delta') $(`${event.side}-answer`).textContent += event.content;
+      if (event.type === 'done') {
+        $('left-stats').textContent = formatStats(event.results[0]);
+        $('right-stats').textContent = formatStats(event.results[1]);
+      }
+    });
+  }
+}
+
 async function loadApp() {
-  me = await api('/auth/me');
+  me = await getCached('/auth/me');
   $('auth-card').classList.add('hidden');
   $('app').classList.remove('hidden');
   $('me').textContent = `${me.username} (${me.role})`;
   if (me.role === 'admin') $('admin-panel').classList.remove('hidden');
-  await Promise.all([loadBalance(), loadMyRecords(), loadUsers(), loadAllRecords()]);
+  await refreshAll();
+  clearInterval(pollTimer);
+  pollTimer = setInterval(() => refreshAll().catch(() => {}), POLL_MS);
+}
+
+function refreshAll() {
+  return Promise.all([loadBalance(), loadMyRecords(), loadUsers(), loadAllRecords()]);
 }
 
 $('login-btn').onclick = () => loginOrRegister('/auth/login').catch((e) => $('auth-msg').textContent = e.message);
 $('register-btn').onclick = () => loginOrRegister('/auth/register').catch((e) => $('auth-msg').textContent = e.message);
 $('create-btn').onclick = () => createRecord().catch((e) => $('create-msg').textContent = e.message);
 $('create-user-btn').onclick = () => createUser().catch((e) => alert(e.message));
+$('more-users-btn').onclick = () => loadMoreUsers().catch((e) => alert(e.message));
+let searchTimer = null;
+$('user-search').oninput = () => {
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => loadUsers().catch((e) => alert(e.message)), 250);
+};
+$('compare-btn').onclick = () => streamCompare().catch((e) => { $('left-stats').textContent = e.message; });
 $('logout-btn').onclick = () => { localStorage.removeItem('token'); window.location.reload(); };
 
 if (token) loadApp().catch(() => { localStorage.removeItem('token'); });
@@ -0,0 +1,83 @@
+import argparse
+import logging
+import sys
+
+from sqlalchemy import Connection, Index, Table, inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from backend.database import Base, engine
+from backend.models import LeaveRecord, LeaveTransaction, User
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("migrate-indexes")
+
+# Indexes added to tables that already existed. create_all only builds indexes along with a
+# new table, so deployed databases get them from here: (table, index, dialect or None).
+MIGRATED_INDEXES = [
+    (User.__table__, "ix_users_created_id", None),
+    (LeaveRecord.__table__, "ix_leave_records_user_deleted_start", None),
+    (LeaveRecord.__table__, "ix_leave_records_deleted_start", None),
+    (LeaveRecord.__table__, "ix_leave_records_report", None),
+    (LeaveTransaction.__table__, "ix_leave_transactions_user_created", None),
+    (User.__table__, "ix_users_username_trgm", "postgresql"),
+    (User.__table__, "ix_users_username_pattern", "postgresql"),
+]
+# Extensions an index's operator class comes from; created before the index is built.
+INDEX_EXTENSIONS = {"ix_users_username_trgm": "pg_trgm"}
+
+
+def model_index(table: Table, name: str) -> Index:
+    return next(index for index in table.indexes if index.name == name)
+
+
+def invalid_indexes(conn: Connection) -> set[str]:
+    # A CONCURRENTLY build that failed leaves an INVALID index behind; IF NOT EXISTS would
+    # keep skipping it, so those are dropped and rebuilt.
+    if conn.dialect.name != "postgresql":
+        return set()
+    rows = conn.execute(text("SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"))
+    return set(rows.scalars())
+
+
+def pending_indexes(conn: Connection) -> list[Index]:
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    invalid = invalid_indexes(conn)
+    pending = []
+    for table, name, dialect in MIGRATED_INDEXES:
+        # A missing table is created whole, indexes included, by create_all.
+        if table.name not in tables or dialect not in (None, conn.dialect.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        if name not in existing or name in invalid:
+            pending.append(model_index(table, name))
+    return pending
+
+
+def create_index(conn: Connection, index: Index):
+    sql = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+    if conn.dialect.name == "postgresql":
+        # Builds without blocking writes to the table; needs autocommit, one index at a time.
+        if index.name in invalid_indexes(conn):
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+        if index.name in INDEX_EXTENSIONS:
+            conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {INDEX_EXTENSIONS[index.name]}"))
+        sql = sql.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+    conn.execute(text(sql))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create indexes that create_all does not add to existing tables.")
+    parser.add_argument("--dry-run", action="store_true", help="only list the indexes that are missing")
+    args = parser.parse_args()
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        pending = pending_indexes(conn)
+        for index in pending:
+            logger.info("%s %s on %s", "would create" if args.dry_run else "creating", index.name, index.table.name)
+            if not args.dry_run:
+                create_index(conn, index)
+    if args.dry_run:
+        sys.exit(0)
+    logger.info("created %s indexes", len(pending))
+    Base.metadata.create_all(bind=engine)
@@ -0,0 +1,85 @@
+import argparse
+import logging
+import sys
+
+from sqlalchemy import Connection, Integer, inspect, text
+
+from backend.database import Base, SessionLocal, engine
+from backend.services.ledger import replay_ledger
+from backend.services.summary import verify_summary
+from backend.units import UNITS_PER_DAY
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("migrate-leave-units")
+
+# Every column that held days as Numeric/Float before leave amounts became integer hundredths.
+LEAVE_UNIT_COLUMNS = [
+    ("users", "leave_balance"),
+    ("leave_records", "total_leave_days"),
+    ("leave_transactions", "change_amount"),
+    ("leave_transactions", "balance_after"),
+    ("user_leave_summary", "days"),
+]
+
+
+def pending_columns(conn: Connection) -> list[tuple[str, str]]:
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    pending = []
+    for table, column in LEAVE_UNIT_COLUMNS:
+        if table not in tables:
+            continue
+        types = {info["name"]: info["type"] for info in inspector.get_columns(table)}
+        if not isinstance(types[column], Integer):
+            pending.append((table, column))
+    return pending
+
+
+def convert_column(conn: Connection, table: str, column: str):
+    if conn.dialect.name == "postgresql":
+        # One rewrite per column; indexes that include the column are rebuilt in place.
+        conn.execute(
+            text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE integer USING round({column} * {UNITS_PER_DAY})::integer")
+        )
+        return
+    # SQLite cannot change a column type, and REAL affinity would keep handing back floats,
+    # so the values move into a fresh INTEGER column that then takes the old name.
+    staging = f"{column}_units"
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {staging} INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text(f"UPDATE {table} SET {staging} = CAST(round({column} * {UNITS_PER_DAY}) AS INTEGER)"))
+    conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+    conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN {staging} TO {column}"))
+
+
+def verify() -> list[str]:
+    db = SessionLocal()
+    try:
+        return verify_summary(db) + replay_ledger(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stored leave amounts from days to integer hundredths of a day.")
+    parser.add_argument("--dry-run", action="store_true", help="only list the columns that still need converting")
+    parser.add_argument("--verify-only", action="store_true", help="skip the conversion and only check summary and ledger")
+    args = parser.parse_args()
+
+    if not args.verify_only:
+        # All columns convert in one transaction: a failure leaves every table in days.
+        with engine.begin() as conn:
+            pending = pending_columns(conn)
+            for table, column in pending:
+                logger.info("%s %s.%s", "would convert" if args.dry_run else "converting", table, column)
+                if not args.dry_run:
+                    convert_column(conn, table, column)
+        if args.dry_run:
+            sys.exit(0)
+        logger.info("converted %s columns", len(pending))
+        Base.metadata.create_all(bind=engine)
+
+    problems = verify()
+    for problem in problems:
+        logger.error(problem)
+    logger.info("verification %s (%s problems)", "failed" if problems else "passed", len(problems))
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,31 @@
+import argparse
+import logging
+import sys
+
+from backend.database import Base, SessionLocal, engine
+from backend.services.leave_calendar import rebuild_leave_days
+from backend.services.summary import rebuild_summary, verify_summary
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("rebuild-summary")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute user_leave_summary and leave_days from leave_records.")
+    parser.add_argument("--verify-only", action="store_true", help="only compare the summary with the raw records")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if not args.verify_only:
+            logger.info("rebuilt user_leave_summary with %s rows", rebuild_summary(db))
+            logger.info("rebuilt leave_days from %s records", rebuild_leave_days(db))
+        problems = verify_summary(db)
+    finally:
+        db.close()
+
+    for problem in problems:
+        logger.error(problem)
+    logger.info("verification %s (%s mismatches)", "failed" if problems else "passed", len(problems))
+    sys.exit(1 if problems else 0)
@@ -1,22 +1,65 @@
 import logging
-import time
+import signal
+import threading
 
+from backend.config import settings
 from backend.database import SessionLocal
-from backend.services.leave import run_monthly_accrual
+from backend.services.jobs import (
+    SCHEDULER_LEASE,
+    LeaseLost,
+    acquire_lease,
+    release_lease,
+    run_due_jobs,
+    run_pending_runs,
+    worker_id,
+)
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("scheduler")
 
 
+def tick(holder: str) -> bool:
+    # Every replica ticks; only the lease holder runs jobs. A holder that dies stops
+    # renewing and another replica takes over once scheduler_lease_ttl_s has passed.
+    db = SessionLocal()
+    try:
+        if not acquire_lease(db, SCHEDULER_LEASE, holder, settings.scheduler_lease_ttl_s):
+            return False
+        # Jobs can outlast the lease TTL; the job heartbeat renews it alongside the job's own.
+        held = {SCHEDULER_LEASE: settings.scheduler_lease_ttl_s}
+        run_pending_runs(db, holder, held)
+        run_due_jobs(db, holder, held=held)
+        return True
+    except LeaseLost:
+        logger.warning("scheduler %s lost its lease mid-run", holder)
+        db.rollback()
+        return False
+    except Exception:
+        logger.exception("Scheduler tick failed")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
 if __name__ == "__main__":
-    while True:
-        db = SessionLocal()
-        try:
-            changed = run_monthly_accrual(db)
-            logger.info("daily-check complete, accrual_run=%s", changed)
-        except Exception:
-            logger.exception("Scheduler job failed")
-            db.rollback()
-        finally:
-            db.close()
-        time.sleep(24 * 60 * 60)
+    holder = worker_id()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    logger.info("scheduler %s started, tick=%ss", holder, settings.scheduler_tick_s)
+
+    leader = False
+    while not stopping.is_set():
+        is_leader = tick(holder)
+        if is_leader != leader:
+            logger.info("scheduler %s %s the lease", holder, "acquired" if is_leader else "lost")
+            leader = is_leader
+        stopping.wait(settings.scheduler_tick_s)
+
+    # Hand over right away instead of making the next replica wait for the lease to expire.
+    db = SessionLocal()
+    try:
+        release_lease(db, SCHEDULER_LEASE, holder)
+    finally:
+        db.close()
@@ -0,0 +1,83 @@
+"""Compare per-call httpx clients with the pooled chat clients against a local stub server.
+
+Usage:
+    python -m scripts.bench_chat --requests 2000 --concurrency 32
+
+The stub speaks the OpenAI chat-completions shape on 127.0.0.1 and answers immediately,
+so the numbers isolate connection setup and client overhead from model latency.
+"""
+
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from backend.services.http_pool import close_clients, post_json
+
+stub = FastAPI()
+
+
+@stub.post("/v1/chat/completions")
+async def completions(payload: dict):
+    return {"model": payload["model"], "choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+
+
+async def fresh_client_call(url: str, payload: dict) -> None:
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.post(url, json=payload)
+        response.raise_for_status()
+        response.json()
+
+
+async def pooled_call(url: str, payload: dict) -> None:
+    await post_json(url, payload, 10)
+
+
+async def measure(call, url: str, total: int, concurrency: int) -> list[float]:
+    payload = {"model": "stub", "messages": [{"role": "user", "content": "hi"}]}
+    latencies: list[float] = []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            start = time.perf_counter()
+            await call(url, payload)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies
+
+
+def report(name: str, latencies: list[float]) -> None:
+    cuts = statistics.quantiles(latencies, n=100)
+    print(f"{name:<8} n={len(latencies)} p50={cuts[49]:7.2f} ms p99={cuts[98]:7.2f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    server = uvicorn.Server(uvicorn.Config(stub, port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    url = f"http://127.0.0.1:{args.port}/v1/chat/completions"
+    report("fresh", await measure(fresh_client_call, url, args.requests, args.concurrency))
+    report("pooled", await measure(pooled_call, url, args.requests, args.concurrency))
+    await close_clients()
+    server.should_exit = True
+    thread.join()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Measure login throughput alongside cheap balance reads against a running API.
+
+Usage:
+    uvicorn backend.main:app --workers 2 &
+    python -m scripts.bench_login --base-url http://127.0.0.1:8000 --seconds 20
+
+The script registers its own bench users, so run it against a scratch database.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def login_loop(client: httpx.AsyncClient, username: str, password: str, deadline: float, counts: dict[str, int]):
+    while time.perf_counter() < deadline:
+        response = await client.post("/auth/login", json={"username": username, "password": password})
+        counts[f"login_{response.status_code}"] = counts.get(f"login_{response.status_code}", 0) + 1
+
+
+async def balance_loop(client: httpx.AsyncClient, token: str, deadline: float, counts: dict[str, int]):
+    headers = {"Authorization": f"Bearer {token}"}
+    while time.perf_counter() < deadline:
+        response = await client.get("/leave/balance", headers=headers)
+        counts[f"balance_{response.status_code}"] = counts.get(f"balance_{response.status_code}", 0) + 1
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--login-clients", type=int, default=32)
+    parser.add_argument("--read-clients", type=int, default=32)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.login_clients + args.read_clients)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        username, password = f"bench_{int(time.time())}", "bench-password"
+        response = await client.post("/auth/register", json={"username": username, "password": password})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+        counts: dict[str, int] = {}
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(
+            *(login_loop(client, username, password, deadline, counts) for _ in range(args.login_clients)),
+            *(balance_loop(client, token, deadline, counts) for _ in range(args.read_clients)),
+        )
+
+    for key in sorted(counts):
+        print(f"{key:<14} {counts[key]:>8} total {counts[key] / args.seconds:10.1f}/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,516 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.context import CryptContext
+from sqlalchemy import create_engine, event, insert, select, text, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import QueuePool
+
+from backend.auth import create_access_token, token_cache, user_cache
+from backend.config import settings
+from backend import database
+from backend.database import (
+    Base,
+    ReplicaPool,
+    SessionLocal,
+    async_engine,
+    create_replica_engine,
+    engine,
+    install_idle_pre_ping,
+    primary_pins,
+)
+from backend.main import app
+from backend.models import LeaveTransaction, User, UserRole
+from backend.services.jobs import run_pending_runs
+from backend.services.passwords import failed_logins, hash_password
+from backend.services.ledger import replay_ledger
+from backend.services.leave_calendar import calendar_cache
+from backend.services.reports import report_cache
+from backend.services.summary import rebuild_summary, verify_summary
+from backend.services.versions import bump_versions, user_scope
+from backend.services.users import user_list_query
+
+
+@pytest.fixture
+def client():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    token_cache.clear()
+    user_cache.clear()
+    failed_logins.clear()
+    report_cache.clear()
+    calendar_cache.clear()
+    db = SessionLocal()
+    db.add(User(username="admin", password_hash=hash_password("secret1"), role=UserRole.ADMIN, leave_balance=0))
+    db.add(User(username="alice", password_hash=hash_password("secret1"), role=UserRole.USER, leave_balance=100))
+    db.commit()
+    db.close()
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def auth(username: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {create_access_token(username)}"}
+
+
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    return statements, lambda: event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_cached_user_skips_db_and_is_invalidated_by_admin_adjust(client):
+    alice, admin = auth("alice"), auth("admin")
+    assert client.get("/leave/balance", headers=alice).json() == {"leave_balance": 1}
+    assert client.get("/admin/cache-stats", headers=admin).status_code == 200
+
+    # Routes that need nothing beyond the user authenticate from the cache and its version check.
+    statements, stop = count_queries()
+    try:
+        assert client.get("/admin/cache-stats", headers=admin).status_code == 200
+        assert client.get("/chat/batch/nosuchjob", headers=alice).status_code == 404
+    finally:
+        stop()
+    assert len(statements) == 2 and all("FROM version_counters" in statement for statement in statements)
+
+    alice_id = client.get("/auth/me", headers=alice).json()["id"]
+    adjusted = client.post("/admin/adjust-leave", headers=admin, json={"user_id": alice_id, "change_amount": 2})
+    assert adjusted.json() == {"message": "Leave adjusted", "balance": 3}
+    assert client.get("/leave/balance", headers=alice).json() == {"leave_balance": 3}
+    rejected = client.post("/admin/adjust-leave", headers=admin, json={"user_id": alice_id, "change_amount": 0.333})
+    assert rejected.status_code == 422
+    assert user_cache.hits > 0 and user_cache.misses > 0
+
+    # Another worker deactivating alice only bumps the shared counter; this cache still drops her.
+    db = SessionLocal()
+    db.execute(update(User).where(User.id == alice_id).values(is_active=False))
+    bump_versions(db, user_scope(alice_id))
+    db.commit()
+    db.close()
+    assert client.get("/leave/balance", headers=alice).status_code == 401
+
+
+def test_balance_and_me_answer_304_from_the_version_counter_alone(client):
+    alice = auth("alice")
+    first = client.get("/leave/balance", headers=alice)
+    me_etag = client.get("/auth/me", headers=alice).headers["etag"]
+
+    statements, stop = count_queries()
+    try:
+        assert client.get("/leave/balance", headers={**alice, "If-None-Match": first.headers["etag"]}).status_code == 304
+        assert client.get("/auth/me", headers={**alice, "If-None-Match": me_etag}).status_code == 304
+    finally:
+        stop()
+    # One counter read to authenticate and one for the ETag, per request.
+    assert len(statements) == 4 and all("FROM version_counters" in statement for statement in statements)
+
+    # A 200 re-reads the user row, so the body can never be older than its ETag.
+    statements, stop = count_queries()
+    try:
+        assert client.get("/leave/balance", headers=alice).json() == {"leave_balance": 1}
+    finally:
+        stop()
+    assert any("FROM users" in statement for statement in statements)
+
+
+def test_login_backs_off_after_failures_and_rehashes_outdated_cost(client, monkeypatch):
+    monkeypatch.setattr(settings, "failed_login_free_attempts", 1)
+    monkeypatch.setattr(settings, "failed_login_backoff_s", 30)
+    db = SessionLocal()
+    alice = db.query(User).filter(User.username == "alice").first()
+    alice.password_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret1")
+    db.commit()
+
+    assert client.post("/auth/login", json={"username": "alice", "password": "wrong-1"}).status_code == 401
+    assert client.post("/auth/login", json={"username": "alice", "password": "wrong-2"}).status_code == 401
+    # Counted per user, not per password: even the right one waits out the backoff unverified.
+    backed_off = client.post("/auth/login", json={"username": "alice", "password": "secret1"})
+    assert backed_off.status_code == 429 and 0 < int(backed_off.headers["retry-after"]) <= 30
+    assert failed_logins.stats()["size"] == 1
+
+    failed_logins.clear()
+    assert client.post("/auth/login", json={"username": "alice", "password": "secret1"}).status_code == 200
+    db.refresh(alice)
+    assert alice.password_hash.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+    db.close()
+
+
+def test_my_leaves_cursor_pages_match_offset_pages(client):
+    alice = auth("alice")
+    for day in (2, 3, 3, 4, 5):
+        client.post("/leave", headers=alice, json={"record_type": "LATE", "start_date": f"2026-03-0{day}T00:00:00", "minutes": 5})
+
+    offset_ids = [item["id"] for item in client.get("/leave/my?page_size=5", headers=alice).json()["items"]]
+    page = client.get("/leave/my?page_size=2", headers=alice).json()
+    cursor_ids = [item["id"] for item in page["items"]]
+    assert page["total"] == 5
+    while page["next_cursor"]:
+        page = client.get(f"/leave/my?page_size=2&cursor={page['next_cursor']}", headers=alice).json()
+        assert page["total"] is None
+        cursor_ids += [item["id"] for item in page["items"]]
+
+    assert cursor_ids == offset_ids
+    assert client.get("/leave/my?cursor=not-a-cursor", headers=alice).status_code == 400
+
+
+def test_metrics_group_by_route_template_and_count_db_queries(client):
+    alice = auth("alice")
+    assert client.delete("/leave/999", headers=alice).status_code == 404
+    assert client.delete("/leave/998", headers=alice).status_code == 404
+
+    body = client.get("/metrics").text
+    assert 'http_requests_total{method="DELETE",route="/leave/{record_id}",status="404"} 2' in body
+    assert "/leave/999" not in body
+    assert 'http_request_db_queries_count{route="/leave/{record_id}"} 2' in body
+    assert 'http_request_db_queries_sum{route="/leave/{record_id}"} 0.0' not in body
+    assert 'db_query_duration_seconds_count{engine="async"}' in body
+    assert 'db_pool_checkout_seconds_count{engine="async"}' in body
+
+
+def test_db_pool_endpoint_reports_pool_and_slow_statements(client):
+    assert client.get("/auth/me", headers=auth("alice")).status_code == 200
+    body = client.get("/admin/db-pool", headers=auth("admin")).json()
+    assert body["pools"]["async"]["checked_out"] == 1  # the admin request's own session
+    assert body["config"]["pre_ping"] == settings.db_pre_ping
+    assert body["slowest_statements"] and body["slowest_statements"][0]["duration_ms"] >= 0
+    assert client.get("/admin/db-pool", headers=auth("alice")).status_code == 403
+
+    # A failed statement leaves no start time behind on the pooled connection.
+    with engine.connect() as conn:
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        assert conn.info["query_started_at"] == []
+
+
+def test_idle_pre_ping_replaces_dead_connection(tmp_path):
+    idle_engine = create_engine(f"sqlite:///{tmp_path / 'ping.db'}", poolclass=QueuePool, pool_size=1)
+    install_idle_pre_ping(idle_engine, idle_s=0)
+    with idle_engine.connect() as conn:
+        dead = conn.connection.dbapi_connection
+    dead.close()
+
+    with idle_engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+        assert conn.connection.dbapi_connection is not dead
+
+
+def test_leave_summary_tracks_writes_and_matches_rebuild(client):
+    alice, admin = auth("alice"), auth("admin")
+    alice_id = client.get("/auth/me", headers=alice).json()["id"]
+    client.post("/admin/adjust-leave", headers=admin, json={"user_id": alice_id, "change_amount": 20})
+
+    leave = client.post(
+        "/leave",
+        headers=alice,
+        json={"record_type": "RANGE", "start_date": "2026-01-29T00:00:00", "end_date": "2026-02-03T00:00:00", "start_half": "PM", "end_half": "AM"},
+    ).json()
+    assert leave["total_leave_days"] == 3
+    client.post("/leave", headers=alice, json={"record_type": "LATE", "start_date": "2026-02-10T00:00:00", "minutes": 15})
+    full_day = client.post("/leave", headers=alice, json={"record_type": "FULL_DAY", "start_date": "2026-03-02T00:00:00"}).json()
+    client.delete(f"/leave/{full_day['id']}", headers=alice)
+    updated = client.put(f"/leave/{leave['id']}", headers=alice, json={"end_date": "2026-02-02T00:00:00"}).json()
+    assert updated["total_leave_days"] == 2
+
+    summary = client.get("/leave/summary?year=2026", headers=alice).json()
+    assert (summary["total_days"], summary["total_minutes"]) == (2, 15)
+    assert [(row["month"], row["record_type"], row["days"], row["minutes"]) for row in summary["rows"]] == [
+        (1, "RANGE", 1.5, 0),
+        (2, "LATE", 0, 15),
+        (2, "RANGE", 0.5, 0),
+    ]
+    items = client.get("/admin/summary?year=2026", headers=admin).json()["items"]
+    assert [(row["username"], row["record_type"], row["days"], row["minutes"]) for row in items] == [
+        ("alice", "LATE", 0, 15),
+        ("alice", "RANGE", 2, 0),
+    ]
+
+    db = SessionLocal()
+    try:
+        assert verify_summary(db) == []
+        rebuild_summary(db)
+        assert verify_summary(db) == []
+    finally:
+        db.close()
+
+
+def test_admin_reports_aggregate_in_database_and_cache_by_filters(client):
+    alice, admin = auth("alice"), auth("admin")
+    alice_id = client.get("/auth/me", headers=alice).json()["id"]
+    client.post("/admin/adjust-leave", headers=admin, json={"user_id": alice_id, "change_amount": 5})
+    client.post("/leave", headers=alice, json={"record_type": "FULL_DAY", "start_date": "2026-03-02T00:00:00"})
+    client.post("/leave", headers=alice, json={"record_type": "HALF_AM", "start_date": "2026-04-01T00:00:00"})
+    client.post("/leave", headers=alice, json={"record_type": "LATE", "start_date": "2026-04-02T00:00:00", "minutes": 10})
+    client.post("/leave", headers=alice, json={"record_type": "EARLY", "start_date": "2026-04-03T00:00:00", "minutes": 20})
+
+    by_user = client.get("/admin/reports/by-user", headers=admin).json()["rows"]
+    assert by_user == [
+        {"user_id": alice_id, "username": "alice", "records": 4, "days": 1.5, "late_minutes": 10, "early_minutes": 20}
+    ]
+    by_month = client.get("/admin/reports/by-month?start=2026-04-01&end=2026-04-02", headers=admin).json()["rows"]
+    assert by_month == [{"year": 2026, "month": 4, "records": 2, "days": 0.5, "late_minutes": 10, "early_minutes": 0}]
+    by_type = {row["record_type"]: row for row in client.get("/admin/reports/by-type", headers=admin).json()["rows"]}
+    assert by_type["EARLY"]["minutes"] == 20 and by_type["FULL_DAY"]["days"] == 1
+
+    client.post("/leave", headers=alice, json={"record_type": "FULL_DAY", "start_date": "2026-03-03T00:00:00"})
+    assert client.get("/admin/reports/by-user", headers=admin).json()["rows"][0]["records"] == 4
+    assert client.get("/admin/reports/by-user?limit=10", headers=admin).json()["rows"][0]["records"] == 5
+    assert client.get("/admin/reports/by-user?start=2026-05-01&end=2026-04-01", headers=admin).status_code == 400
+
+
+def test_exports_stream_csv_and_gzipped_ndjson(client):
+    alice, admin = auth("alice"), auth("admin")
+    alice_id = client.get("/auth/me", headers=alice).json()["id"]
+    client.post("/admin/adjust-leave", headers=admin, json={"user_id": alice_id, "change_amount": 5})
+    for day in (2, 3, 4):
+        client.post("/leave", headers=alice, json={"record_type": "FULL_DAY", "start_date": f"2026-03-0{day}T00:00:00"})
+
+    response = client.get("/admin/export/records?start=2026-03-03", headers=admin)
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["start_datetime"][:10] for row in rows] == ["2026-03-03", "2026-03-04"]
+    assert rows[0]["username"] == "alice" and rows[0]["record_type"] == "FULL_DAY"
+
+    response = client.get(f"/admin/export/transactions?format=ndjson&gzip=true&user_id={alice_id}", headers=admin)
+    assert response.headers["content-disposition"] == 'attachment; filename="leave_transactions.ndjson.gz"'
+    ledger = [json.loads(line) for line in gzip.decompress(response.content).splitlines()]
+    assert [(row["source"], row["balance_after"]) for row in ledger] == [
+        ("ADMIN_ADJUST", 6),
+        ("LEAVE_USED", 5),
+        ("LEAVE_USED", 4),
+        ("LEAVE_USED", 3),
+    ]
+    assert client.get("/admin/export/records?start=2026-03-03&end=2026-03-01", headers=admin).status_code == 400
+    assert client.get("/admin/export/records", headers=alice).status_code == 403
+
+
+def test_bulk_import_validates_rows_and_charges_once_per_user(client):
+    alice, admin = auth("alice"), auth("admin")
+    alice_id = client.get("/auth/me", headers=alice).json()["id"]
+    client.post("/admin/adjust-leave", headers=admin, json={"user_id": alice_id, "change_amount": 4})
+    upload = (
+        "username,record_type,start_date,end_date,start_half,end_half,minutes,note\n"
+        "alice,FULL_DAY,2026-03-02T00:00:00,,,,,migrated\n"
+        "alice,HALF_AM,2026-03-03T00:00:00,,,,,\n"
+        "bob,FULL_DAY,2026-03-02T00:00:00,,,,,\n"
+        "alice,LATE,2026-03-04T00:00:00,,,,,\n"
+        "alice,RANGE,2026-03-10T00:00:00,2026-03-09T00:00:00,AM,PM,,\n"
+        "admin,FULL_DAY,2026-03-02T00:00:00,,,,,\n"
+        "alice,LATE,2026-03-04T00:00:00,,,,10,\n"
+        "alice,BOGUS,2026-03-04T00:00:00,,,,,\n"
+    )
+
+    def post(dry_run: bool):
+        files = {"file": ("history.csv", upload, "text/csv")}
+        return client.post("/admin/import/leave", headers=admin, files=files, data={"dry_run": str(dry_run).lower()}).json()
+
+    preview = post(dry_run=True)
+    assert (preview["valid"], preview["imported"], preview["failed"]) == (3, 0, 5)
+    assert [error["row"] for error in preview["errors"]] == [3, 4, 5, 6, 8]
+    assert preview["errors"][1]["error"] == "minutes is required for LATE/EARLY"
+    assert client.get("/leave/balance", headers=alice).json() == {"leave_balance": 5}
+
+    result = post(dry_run=False)
+    assert (result["imported"], result["failed"], result["charged_users"]) == (3, 5, ["alice"])
+    assert client.get("/leave/balance", headers=alice).json() == {"leave_balance": 3.5}
+    assert client.get("/leave/my", headers=alice).json()["total"] == 3
+    ledger = client.get(f"/admin/export/transactions?format=ndjson&user_id={alice_id}", headers=admin).text.splitlines()
+    assert [json.loads(line)["change_amount"] for line in ledger] == [4, -1.5]
+
+    jsonl = "\n".join(
+        json.dumps(row)
+        for row in (
+            {"username": "admin", "record_type": "FULL_DAY", "start_date": "2026-03-05T00:00:00"},
+            {"username": "admin", "record_type": "RANGE", "start_date": "2026-03-06T00:00:00", "end_date": "2026-03-10T00:00:00",
+             "start_half": "PM", "end_half": "AM"},
+        )
+    )
+    files = {"file": ("history.jsonl", jsonl, "application/x-ndjson")}
+    result = client.post("/admin/import/leave", headers=admin, files=files, data={"charge_balance": "false"}).json()
+    assert (result["imported"], result["charged_users"]) == (2, [])
+    assert sorted(item["total_leave_days"] for item in client.get("/leave/my", headers=admin).json()["items"]) == [1, 2]
+    db = SessionLocal()
+    try:
+        assert verify_summary(db) == []
+    finally:
+        db.close()
+
+
+def test_calendar_lists_absences_and_rejects_overlapping_leave(client):
+    alice, admin = auth("alice"), auth("admin")
+    alice_id = client.get("/auth/me", headers=alice).json()["id"]
+    admin_id = client.get("/auth/me", headers=admin).json()["id"]
+    client.post("/admin/adjust-leave", headers=admin, json={"user_id": alice_id, "change_amount": 5})
+    client.post("/admin/adjust-leave", headers=admin, json={"user_id": admin_id, "change_amount": 5})
+    client.post(
+        "/leave",
+        headers=alice,
+        json={"record_type": "RANGE", "start_date": "2026-03-30T00:00:00", "end_date": "2026-04-01T00:00:00", "start_half": "PM", "end_half": "AM"},
+    )
+    client.post("/leave", headers=admin, json={"record_type": "HALF_PM", "start_date": "2026-03-31T00:00:00"})
+
+    calendar = client.get("/leave/calendar?start=2026-03-30&end=2026-04-02", headers=alice).json()["days"]
+    assert [[(item["username"], item["part"]) for item in day["absences"]] for day in calendar] == [
+        [("alice", "PM")],
+        [("admin", "PM"), ("alice", "FULL")],
+        [("alice", "AM")],
+        [],
+    ]
+    filtered = client.get(f"/leave/calendar?start=2026-03-31&end=2026-03-31&user_ids={admin_id}", headers=alice).json()
+    assert [item["username"] for item in filtered["days"][0]["absences"]] == ["admin"]
+
+    assert client.post("/leave", headers=alice, json={"record_type": "HALF_AM", "start_date": "2026-03-30T00:00:00"}).status_code == 200
+    assert client.post("/leave", headers=alice, json={"record_type": "HALF_PM", "start_date": "2026-04-01T00:00:00"}).status_code == 200
+    clash = client.post("/leave", headers=alice, json={"record_type": "FULL_DAY", "start_date": "2026-03-31T00:00:00"})
+    assert clash.status_code == 409 and clash.json()["detail"] == "Overlaps existing leave on 2026-03-31"
+    assert client.get("/leave/balance", headers=alice).json() == {"leave_balance": 3}
+
+    calendar = client.get("/leave/calendar?start=2026-03-30&end=2026-03-30", headers=alice).json()["days"]
+    assert sorted(item["part"] for item in calendar[0]["absences"]) == ["AM", "PM"]
+
+    files = {"file": ("history.csv", "username,record_type,start_date\nalice,FULL_DAY,2026-04-01T00:00:00\n", "text/csv")}
+    result = client.post("/admin/import/leave", headers=admin, files=files).json()
+    assert result["errors"] == [{"row": 1, "error": "Overlaps existing leave on 2026-04-01"}]
+    assert client.get("/leave/calendar?start=2026-03-01&end=2026-06-30", headers=alice).status_code == 400
+
+
+def test_conditional_get_answers_304_until_a_write_bumps_the_version(client):
+    alice, admin = auth("alice"), auth("admin")
+    first = client.get("/leave/my", headers=alice)
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"') and first.headers["cache-control"] == "private, no-cache"
+    assert "Authorization" in first.headers["vary"]
+
+    cached = client.get("/leave/my", headers={**alice, "If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b"" and cached.headers["etag"] == etag
+    assert client.get("/leave/my?page_size=5", headers={**alice, "If-None-Match": etag}).status_code == 200
+    users_etag = client.get("/admin/users", headers=admin).headers["etag"]
+    records_etag = client.get("/admin/all-records", headers=admin).headers["etag"]
+    admin_etag = client.get("/leave/my", headers=admin).headers["etag"]
+
+    created = client.post("/leave", headers=alice, json={"record_type": "FULL_DAY", "start_date": "2026-03-02T00:00:00"})
+    assert created.status_code == 200
+    changed = client.get("/leave/my", headers={**alice, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert [item["id"] for item in changed.json()["items"]] == [created.json()["id"]]
+    assert client.get("/admin/users", headers={**admin, "If-None-Match": users_etag}).status_code == 200
+    assert client.get("/admin/all-records", headers={**admin, "If-None-Match": records_etag}).status_code == 200
+    assert client.get("/leave/my", headers={**admin, "If-None-Match": admin_etag}).status_code == 304
+
+
+def test_admin_users_filters_searches_and_pages_by_cursor(client):
+    admin = auth("admin")
+    for name, balance in [("carol", 5), ("carla", 2), ("marc", 0), ("car_x", 8)]:
+        client.post("/admin/users", headers=admin, json={"username": name, "password": "secret1", "role": "user", "leave_balance": balance})
+
+    def names(query):
+        return [user["username"] for user in client.get(f"/admin/users?{query}", headers=admin).json()["items"]]
+
+    assert names("q=car") == ["car_x", "carla", "carol"]
+    assert names("q=car_") == ["car_x"]
+    # Postgres gets a bare LIKE for the varchar_pattern_ops index; the range is SQLite's fallback.
+    on_postgres = str(user_list_query("car_", dialect="postgresql").compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    assert "username LIKE 'car\\_%%'" in on_postgres and ">=" not in on_postgres
+    assert names("q=arc&match=contains") == ["marc"]
+    assert names("q=car&min_balance=2&max_balance=5") == ["carla", "carol"]
+    assert names("role=admin") == ["admin"]
+    assert "password_hash" not in client.get("/admin/users", headers=admin).json()["items"][0]
+
+    first = client.get("/admin/users?page_size=4", headers=admin).json()
+    assert first["total"] == 6 and len(first["items"]) == 4 and first["next_cursor"]
+    rest = client.get(f"/admin/users?page_size=4&cursor={first['next_cursor']}", headers=admin).json()
+    assert rest["total"] is None and rest["next_cursor"] is None
+    paged = [user["username"] for user in first["items"] + rest["items"]]
+    assert sorted(paged) == ["admin", "alice", "car_x", "carla", "carol", "marc"]
+
+
+def test_admin_can_trigger_and_inspect_job_runs(client):
+    admin = auth("admin")
+    jobs = client.get("/admin/jobs", headers=admin).json()
+    accrual = next(job for job in jobs if job["name"] == "monthly_accrual")
+    assert accrual["schedule"] == "0 0 21 * *" and accrual["next_run_at"] and accrual["last_run"] is None
+
+    def work():
+        db = SessionLocal()
+        try:
+            return [(run.id, run.status.value, run.rows, run.holder) for run in run_pending_runs(db, "worker")]
+        finally:
+            db.close()
+
+    # The API only queues the run; the scheduler worker executes it.
+    queued = client.post("/admin/jobs/monthly_accrual/run", headers=admin)
+    assert queued.status_code == 202 and queued.json()["trigger"] == "MANUAL" and queued.json()["status"] == "PENDING"
+    assert client.post("/admin/jobs/monthly_accrual/run", headers=admin).status_code == 409
+    assert work() == [(queued.json()["id"], "SUCCEEDED", 2, "worker")]
+    again = client.post("/admin/jobs/monthly_accrual/run", headers=admin).json()
+    assert work() == [(again["id"], "SUCCEEDED", 0, "worker")]
+    runs = client.get("/admin/jobs/monthly_accrual/runs", headers=admin).json()
+    assert [(item["id"], item["status"]) for item in runs] == [(again["id"], "SUCCEEDED"), (queued.json()["id"], "SUCCEEDED")]
+    assert client.post("/admin/jobs/nope/run", headers=admin).status_code == 404
+
+
+def test_admin_balance_edits_go_through_the_ledger_and_balances_at_today_match(client):
+    admin = auth("admin")
+    created = client.post(
+        "/admin/users", headers=admin, json={"username": "carol", "password": "secret1", "role": "user", "leave_balance": 3}
+    ).json()
+    assert created["leave_balance"] == 3
+    assert client.patch(f"/admin/users/{created['id']}", headers=admin, json={"leave_balance": 1.5}).json()["leave_balance"] == 1.5
+
+    db = SessionLocal()
+    try:
+        changes = db.scalars(select(LeaveTransaction.change_amount).where(LeaveTransaction.user_id == created["id"])).all()
+        assert changes == [300, -150]
+        assert replay_ledger(db) == []
+    finally:
+        db.close()
+
+    today = client.get("/admin/balances", headers=admin).json()
+    assert {item["username"]: item["balance"] for item in today["items"]} == {"admin": 0, "alice": 1, "carol": 1.5}
+    mine = client.get("/leave/balance/at", headers=auth("alice"), params={"on": "2020-01-01"}).json()
+    assert mine["items"] == []
+
+
+def test_reads_use_a_healthy_replica_unless_the_client_just_wrote(client, tmp_path, monkeypatch):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    replica = create_engine(replica_url)
+    Base.metadata.create_all(replica)
+    with replica.begin() as conn:
+        conn.execute(insert(User), [{"username": "on-replica", "password_hash": "x", "role": UserRole.USER, "leave_balance": 0}])
+    replica.dispose()
+
+    async def probe() -> set[int]:
+        checked = ReplicaPool([create_replica_engine(replica_url, "up"), create_replica_engine("sqlite:////missing/dir/x.db", "down")])
+        await checked.check()
+        await checked.dispose()
+        return checked.healthy
+
+    assert asyncio.run(probe()) == {0}
+
+    pool = ReplicaPool([create_replica_engine(replica_url, "replica0")])
+    pool.healthy = {0}
+    monkeypatch.setattr(database, "replicas", pool)
+    primary_pins.clear()
+    admin = auth("admin")
+
+    def listed() -> set[str]:
+        return {item["username"] for item in client.get("/admin/users", headers=admin).json()["items"]}
+
+    assert listed() == {"on-replica"}
+    assert client.post("/admin/adjust-leave", headers=admin, json={"user_id": 2, "change_amount": 1}).status_code == 200
+    # Pinned to the primary by the token in this worker, and by the cookie in any other.
+    assert listed() == {"admin", "alice"}
+    primary_pins.clear()
+    assert listed() == {"admin", "alice"}
+    client.cookies.clear()
+    assert listed() == {"on-replica"}
+    pool.healthy = set()
+    assert listed() == {"admin", "alice"}
@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.auth import get_current_user
+from backend.config import settings
+from backend.main import app
+from backend.models import User, UserRole
+from backend.schemas import BotConfig, BotResult
+from backend.services import chat_cache, http_pool, qwen_client, vllm_client
+
+
+@pytest.fixture(autouse=True)
+def vllm_allowed(monkeypatch):
+    monkeypatch.setattr(settings, "chat_vllm_endpoints", "http://vllm.local/v1/chat/completions")
+
+
+@pytest.fixture(autouse=True)
+def signed_in():
+    app.dependency_overrides[get_current_user] = lambda: User(id=1, username="tester", role=UserRole.USER, is_active=True)
+    yield
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+def completion_handler(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"model": "stub-model", "choices": [{"message": {"content": f"from {request.url.host}"}}]})
+
+
+def test_compare_reuses_one_pooled_client_per_endpoint():
+    chat_cache.memory_cache.clear()
+    with TestClient(app) as client:
+        stub = httpx.AsyncClient(transport=httpx.MockTransport(completion_handler))
+        http_pool._clients["http://vllm.local"] = stub
+        bot = {"type": "vllm", "name": "local", "model": "stub-model", "endpoint": "http://vllm.local/v1/chat/completions"}
+
+        for _ in range(2):
+            payload = {"question": "hi", "left_bot": bot, "right_bot": bot, "bypass_cache": True}
+            response = client.post("/chat/compare", json=payload)
+            assert [result["answer"] for result in response.json()["results"]] == ["from vllm.local"] * 2
+            assert [result["side"] for result in response.json()["results"]] == ["left", "right"]
+        assert http_pool.get_client("http://vllm.local/other") is stub
+        with pytest.raises(ValueError):
+            http_pool.get_client("http://elsewhere.example/v1/chat/completions")
+        assert list(http_pool._clients) == ["http://vllm.local"]
+
+    assert stub.is_closed
+    assert http_pool._clients == {}
+
+
+def streaming_handler(request: httpx.Request) -> httpx.Response:
+    chunks = [{"model": "stub-model", "choices": [{"delta": {"content": token}}]} for token in ("Hel", "lo")]
+    chunks.append({"model": "stub-model", "choices": [], "usage": {"completion_tokens": 2}})
+    body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+    return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+
+def test_compare_stream_multiplexes_deltas_and_reports_stats():
+    with TestClient(app) as client:
+        http_pool._clients["http://vllm.local"] = httpx.AsyncClient(transport=httpx.MockTransport(streaming_handler))
+        left = {"type": "vllm", "name": "local", "model": "stub-model", "endpoint": "http://vllm.local/v1/chat/completions"}
+        right = {"type": "unknown", "name": "other", "model": "x"}
+
+        response = client.post("/chat/compare/stream", json={"question": "hi", "left_bot": left, "right_bot": right})
+        events = [json.loads(line) for line in response.text.splitlines()]
+
+    assert "".join(event["content"] for event in events if event["type"] == "delta" and event["side"] == "left") == "Hello"
+    final = events[-1]
+    assert final["type"] == "done"
+    left_stats, right_stats = final["results"]
+    assert left_stats["completion_tokens"] == 2 and left_stats["first_token_ms"] is not None
+    assert right_stats["error"] == "Unsupported bot type: unknown."
+
+
+def test_identical_questions_are_single_flighted_and_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_cache, "disk_cache", chat_cache.DiskCache(str(tmp_path / "chat_cache.db")))
+    chat_cache.memory_cache.clear()
+    bot = BotConfig(type="vllm", name="local", model="stub-model", endpoint="http://vllm.local/v1/chat/completions")
+    calls = []
+
+    async def upstream() -> BotResult:
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return BotResult(side="left", bot_name="local", model="stub-model", answer="ok", latency_ms=10, provider="vllm")
+
+    async def scenario():
+        concurrent = await asyncio.gather(*(chat_cache.cached_call(bot, "q", upstream) for _ in range(5)))
+        chat_cache.memory_cache.clear()
+        from_disk = await chat_cache.cached_call(bot, "q", upstream)
+        bypassed = await chat_cache.cached_call(bot, "q", upstream, bypass=True)
+        return concurrent, from_disk, bypassed
+
+    concurrent, from_disk, bypassed = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert [result.cached for result in concurrent] == [False, True, True, True, True]
+    assert from_disk.cached and from_disk.answer == "ok"
+    assert not bypassed.cached
+    # The endpoint only tells apart the vLLM servers actually called.
+    default = bot.model_copy(update={"endpoint": None})
+    assert chat_cache.cache_key(default, "q") == chat_cache.cache_key(bot, "q")
+    qwen = BotConfig(type="qwen_api", name="qwen", model="qwen-plus")
+    assert chat_cache.cache_key(qwen.model_copy(update={"endpoint": "http://anything/"}), "q") == chat_cache.cache_key(qwen, "q")
+
+
+def test_batch_compare_streams_results_and_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "chat_batch_dir", str(tmp_path))
+    chat_cache.memory_cache.clear()
+    hosts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        if len(hosts) == 1:
+            return httpx.Response(503)
+        return completion_handler(request)
+
+    with TestClient(app) as client:
+        http_pool._clients["http://vllm.local"] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        bot = {"type": "vllm", "name": "local", "model": "stub-model", "endpoint": "http://vllm.local/v1/chat/completions"}
+        payload = {"questions": ["a", "b", "c"], "left_bot": bot, "right_bot": bot, "job_id": "job1", "bypass_cache": True}
+
+        events = [json.loads(line) for line in client.post("/chat/batch", json=payload).text.splitlines()]
+        assert sorted(event["index"] for event in events if event["type"] == "result") == [0, 1, 2]
+        assert events[-1]["bots"]["left"]["count"] == 3 and events[-1]["bots"]["left"]["p99_ms"] is not None
+        assert len(hosts) == 6 and events[-1]["bots"]["left"]["errors"] + events[-1]["bots"]["right"]["errors"] == 1
+
+        # Only the row that errored is redone.
+        resumed = [json.loads(line) for line in client.post("/chat/batch", json=payload).text.splitlines()]
+        assert resumed[0]["already_done"] == 2 and len(hosts) == 8
+        again = [json.loads(line) for line in client.post("/chat/batch", json=payload).text.splitlines()]
+        assert again[0]["already_done"] == 3 and len(hosts) == 8
+        status_body = client.get("/chat/batch/job1").json()
+        assert status_body["completed"] == 3 and status_body["bots"]["left"]["errors"] == 0
+
+        # The same job id with other questions starts over rather than reusing rows by position.
+        response = client.post("/chat/batch", json={**payload, "questions": ["a", "x"]})
+        changed = [json.loads(line) for line in response.text.splitlines()]
+        assert changed[0]["already_done"] == 0 and changed[-1]["completed"] == 2 and len(hosts) == 12
+
+        # Jobs belong to whoever ran them.
+        app.dependency_overrides[get_current_user] = lambda: User(id=2, username="other", role=UserRole.USER, is_active=True)
+        assert client.get("/chat/batch/job1").status_code == 404
+
+        assert client.post("/chat/batch", json={**payload, "job_id": "../etc"}).status_code == 422
+        upload = client.post(
+            "/chat/batch/upload",
+            files={"file": ("q.jsonl", b'"a"\n')},
+            data={"left_bot": json.dumps(bot), "right_bot": json.dumps(bot), "job_id": "../etc"},
+        )
+        assert upload.status_code == 400
+
+
+def test_chat_requires_auth_and_only_calls_configured_endpoints(monkeypatch):
+    app.dependency_overrides.pop(get_current_user, None)
+    bot = {"type": "vllm", "name": "local", "model": "stub-model", "endpoint": "http://169.254.169.254/"}
+    with TestClient(app) as client:
+        for method, path, body in (
+            ("post", "/chat/compare", {"question": "hi", "left_bot": bot, "right_bot": bot}),
+            ("post", "/chat/compare/stream", {"question": "hi", "left_bot": bot, "right_bot": bot}),
+            ("post", "/chat/batch", {"questions": ["hi"], "left_bot": bot, "right_bot": bot}),
+            ("get", "/chat/batch/job1", None),
+        ):
+            assert getattr(client, method)(path, **({"json": body} if body else {})).status_code == 401
+
+    sent = []
+
+    async def fake_post(endpoint, payload, timeout_s, headers=None):
+        sent.append(endpoint)
+        return {"model": "m", "choices": [{"message": {"content": "ok"}}]}
+
+    with TestClient(app) as client:
+        app.dependency_overrides[get_current_user] = lambda: User(id=1, username="tester", role=UserRole.USER, is_active=True)
+        for path, body in (
+            ("/chat/compare", {"question": "hi", "left_bot": bot, "right_bot": bot}),
+            ("/chat/compare/stream", {"question": "hi", "left_bot": bot, "right_bot": bot}),
+            ("/chat/batch", {"questions": ["hi"], "left_bot": bot, "right_bot": bot}),
+        ):
+            response = client.post(path, json=body)
+            assert response.status_code == 400 and "CHAT_VLLM_ENDPOINTS" in response.json()["detail"]
+    unlisted = BotConfig(**bot)
+    assert asyncio.run(vllm_client.call_vllm(unlisted, "hi", 1)).error == "Missing or unlisted vLLM endpoint."
+    assert vllm_client.vllm_endpoint(BotConfig(type="vllm", name="d", model="m")) == "http://vllm.local/v1/chat/completions"
+
+    monkeypatch.setattr(qwen_client, "QWEN_API_KEY", "secret")
+    monkeypatch.setattr(qwen_client, "post_json", fake_post)
+    qwen = BotConfig(type="qwen_api", name="q", model="m", endpoint="http://attacker.example/steal")
+    assert asyncio.run(qwen_client.call_qwen_api(qwen, "hi", 1)).answer == "ok"
+    assert sent == [f"{qwen_client.QWEN_API_BASE}/chat/completions"]
@@ -1,16 +1,49 @@
-from datetime import date
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
 
-from sqlalchemy import create_engine
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, select, update
 from sqlalchemy.orm import sessionmaker
 
+from backend.config import settings
 from backend.database import Base
-from backend.models import User, UserRole
-from backend.services.leave import calculate_range_leave_days, run_monthly_accrual
+from backend.models import (
+    BalanceCheckpoint,
+    JobLease,
+    JobRun,
+    JobStatus,
+    JobTrigger,
+    LeaveRecord,
+    LeaveRecordArchive,
+    LeaveTransaction,
+    LeaveTransactionArchive,
+    RecordType,
+    SystemJob,
+    TransactionSource,
+    User,
+    UserRole,
+)
+from backend.services.archive import run_archive
+from backend.services.cron import CronSchedule
+from backend.services.export import transactions_export_query
+from backend.services.jobs import JOBS, Job, LeaseLost, acquire_lease, run_due_jobs, run_job
+from backend.services.ledger import balances_at, local_day_start, replay_ledger, write_checkpoints
+from backend.services.leave import (
+    VN_TZ,
+    apply_balance_change,
+    calculate_range_leave_days,
+    calculate_range_leave_days_batch,
+    run_monthly_accrual,
+)
+from backend.services.workdays import HolidayCalendar, count_business_days, set_holiday_calendar
 
 
 def test_range_skips_weekend():
     days = calculate_range_leave_days(date(2026, 2, 20), date(2026, 2, 23), "AM", "PM")
-    assert days == 2
+    assert days == 200
 
 
 def test_monthly_accrual_idempotent():
@@ -27,4 +60,323 @@ def test_monthly_accrual_idempotent():
 
     assert first is True
     assert second is False
-    assert float(user.leave_balance) == 1.2
+    assert user.leave_balance == 120
+
+
+def test_bulk_accrual_resumes_from_progress_marker(monkeypatch):
+    engine = create_engine("sqlite:///:memory:")
+    TestingSession = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    db = TestingSession()
+    for idx in range(1, 6):
+        db.add(User(id=idx, username=f"u{idx}", password_hash="x", role=UserRole.USER, leave_balance=0, is_active=idx != 4))
+    db.add(SystemJob(job_name="monthly_accrual:through:2", run_month=1, run_year=2026))
+    db.commit()
+
+    monkeypatch.setattr(settings, "accrual_chunk_size", 1)
+    assert run_monthly_accrual(db, execute_date=date(2026, 1, 21), mode="bulk") is True
+
+    balances = {u.username: u.leave_balance for u in db.query(User).all()}
+    assert balances == {"u1": 0, "u2": 0, "u3": 120, "u4": 0, "u5": 120}
+    assert db.query(LeaveTransaction).count() == 2
+    assert [job.job_name for job in db.query(SystemJob).all()] == ["monthly_accrual"]
+
+
+def test_business_day_engine_matches_day_walk_with_holidays():
+    holidays = [date(2026, 1, 1), date(2026, 4, 30), date(2026, 5, 1), date(2026, 9, 2), date(2027, 1, 1)]
+    set_holiday_calendar(HolidayCalendar(holidays))
+    try:
+        starts, ends = [], []
+        # Every start weekday, including weekends and holidays, at each length.
+        for offset in range(0, 400, 3):
+            start = date(2026, 1, 1) + timedelta(days=offset)
+            for length in (0, 1, 4, 6, 13, 40):
+                starts.append(start)
+                ends.append(start + timedelta(days=length))
+
+        for start, end in zip(starts, ends):
+            walked = (start + timedelta(days=n) for n in range((end - start).days + 1))
+            assert count_business_days(start, end) == sum(1 for day in walked if day.weekday() < 5 and day not in holidays)
+
+        for start_half in ("AM", "PM"):
+            for end_half in ("AM", "PM"):
+                scalar = [calculate_range_leave_days(s, e, start_half, end_half) for s, e in zip(starts, ends)]
+                batch = calculate_range_leave_days_batch(starts, ends, [start_half] * len(starts), [end_half] * len(starts))
+                assert batch == scalar
+        # Mixed halves within one call line up per element.
+        mixed_starts = [("AM", "PM")[n % 2] for n in range(len(starts))]
+        mixed_ends = [("AM", "PM")[n // 2 % 2] for n in range(len(starts))]
+        scalar = [calculate_range_leave_days(*args) for args in zip(starts, ends, mixed_starts, mixed_ends)]
+        assert calculate_range_leave_days_batch(starts, ends, mixed_starts, mixed_ends) == scalar
+    finally:
+        set_holiday_calendar(HolidayCalendar())
+
+
+def test_concurrent_balance_changes_match_ledger(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stress.db'}", connect_args={"timeout": 30})
+    TestingSession = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    with TestingSession() as db:
+        db.add(User(id=1, username="u1", password_hash="x", role=UserRole.USER, leave_balance=300))
+        db.commit()
+
+    rejected = []
+
+    def hammer(seed: int):
+        rng = random.Random(seed)
+        with TestingSession() as db:
+            user = db.get(User, 1)
+            for _ in range(25):
+                try:
+                    apply_balance_change(db, user, rng.choice([-100, -50, 50]), TransactionSource.ADMIN_ADJUST, None)
+                    db.commit()
+                except HTTPException:
+                    db.rollback()
+                    rejected.append(seed)
+
+    threads = [threading.Thread(target=hammer, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with TestingSession() as db:
+        ledger = db.query(LeaveTransaction).order_by(LeaveTransaction.id).all()
+        final = db.get(User, 1).leave_balance
+
+    assert len(ledger) + len(rejected) == 8 * 25
+    assert final == 300 + sum(tx.change_amount for tx in ledger)
+    balance = 300
+    for tx in ledger:
+        balance += tx.change_amount
+        assert tx.balance_after == balance >= 0
+
+    with TestingSession() as db:
+        assert replay_ledger(db, batch_size=7) == []
+        db.get(User, 1).leave_balance += 1
+        ledger[3].balance_after += 50
+        db.merge(ledger[3])
+        db.commit()
+        problems = replay_ledger(db)
+    assert problems == [
+        f"user=1 tx={ledger[3].id}: balance_after {ledger[3].balance_after} != replayed {ledger[3].balance_after - 50}",
+        f"user=1 tx={ledger[4].id}: balance_after {ledger[4].balance_after} != replayed {ledger[4].balance_after + 50}",
+        f"user=1: balance {final + 1} != ledger {final} (changed outside the ledger)",
+    ]
+
+
+def test_cron_schedule_previous_and_next_fire_times():
+    schedule = CronSchedule.parse("30 2 21 * *")
+    now = datetime(2026, 3, 21, 2, 29, tzinfo=VN_TZ)
+    assert schedule.previous(now, 2) == [datetime(2026, 2, 21, 2, 30, tzinfo=VN_TZ), datetime(2026, 1, 21, 2, 30, tzinfo=VN_TZ)]
+    assert schedule.next_after(now) == datetime(2026, 3, 21, 2, 30, tzinfo=VN_TZ)
+    weekdays = CronSchedule.parse("0 9 * * 1-5")
+    assert weekdays.next_after(datetime(2026, 3, 20, 10, 0, tzinfo=VN_TZ)) == datetime(2026, 3, 23, 9, 0, tzinfo=VN_TZ)
+
+
+def test_scheduler_catches_up_missed_accruals_under_a_single_lease():
+    engine = create_engine("sqlite:///:memory:")
+    TestingSession = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    db = TestingSession()
+    db.add(User(username="u1", password_hash="x", role=UserRole.USER, leave_balance=0, is_active=True))
+    db.add(SystemJob(job_name="monthly_accrual", run_month=1, run_year=2026))
+    db.commit()
+
+    assert acquire_lease(db, "scheduler", "a", 60) is True
+    assert acquire_lease(db, "scheduler", "b", 60) is False
+    assert acquire_lease(db, "scheduler", "a", 60) is True
+
+    # The worker was down from January's run until March 25th: February and March are owed.
+    accrual = [JOBS["monthly_accrual"]]
+    runs = run_due_jobs(db, "a", now=datetime(2026, 3, 25, 8, 0, tzinfo=VN_TZ), jobs=accrual)
+    assert [(run.trigger, run.status, run.rows) for run in runs] == [
+        (JobTrigger.CATCHUP, JobStatus.SUCCEEDED, 1),
+        (JobTrigger.SCHEDULE, JobStatus.SUCCEEDED, 1),
+    ]
+    assert run_due_jobs(db, "a", now=datetime(2026, 3, 26, 8, 0, tzinfo=VN_TZ), jobs=accrual) == []
+
+    assert db.query(User).one().leave_balance == 240
+    assert db.query(SystemJob).filter(SystemJob.job_name == "monthly_accrual").count() == 3
+    assert [run.scheduled_for for run in db.query(JobRun).order_by(JobRun.id)] == [datetime(2026, 2, 20, 17), datetime(2026, 3, 20, 17)]
+
+
+def test_scheduler_serves_every_missed_accrual_and_records_capped_skips():
+    engine = create_engine("sqlite:///:memory:")
+    TestingSession = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    db = TestingSession()
+    db.add(User(username="u1", password_hash="x", role=UserRole.USER, leave_balance=0, is_active=True))
+    db.add(SystemJob(job_name="monthly_accrual", run_month=1, run_year=2026))
+    db.commit()
+
+    # Down from January to July: five months owed, more than the catchup cap.
+    runs = run_due_jobs(db, "a", now=datetime(2026, 7, 1, 8, 0, tzinfo=VN_TZ), jobs=[JOBS["monthly_accrual"]])
+    assert [run.scheduled_for.month for run in runs] == [2, 3, 4, 5, 6]
+    assert db.query(User).one().leave_balance == 600
+
+    served = []
+    daily = Job(
+        name="daily", schedule=CronSchedule.parse("0 1 * * *"), run=lambda db, at: served.append(at.day) or 0, catchup_runs=2
+    )
+    # Done through July 1st; the 2nd to the 5th are missed and only the newest two are served.
+    db.add(
+        JobRun(
+            job_name="daily",
+            scheduled_for=datetime(2026, 6, 30, 18),
+            trigger=JobTrigger.SCHEDULE,
+            status=JobStatus.SUCCEEDED,
+            holder="a",
+        )
+    )
+    db.commit()
+    run_due_jobs(db, "a", now=datetime(2026, 7, 5, 8, 0, tzinfo=VN_TZ), jobs=[daily])
+    run_due_jobs(db, "a", now=datetime(2026, 7, 5, 9, 0, tzinfo=VN_TZ), jobs=[daily])
+    assert served == [4, 5]
+    # Recorded once as skipped, in UTC, rather than dropped.
+    skipped = db.query(JobRun).filter(JobRun.job_name == "daily", JobRun.status == JobStatus.FAILED).order_by(JobRun.id)
+    assert [(run.scheduled_for, run.error) for run in skipped] == [
+        (datetime(2026, 7, 1, 18), "skipped: more than 2 fire times missed"),
+        (datetime(2026, 7, 2, 18), "skipped: more than 2 fire times missed"),
+    ]
+
+
+def test_job_heartbeat_renews_leases_and_aborts_a_job_that_lost_one(tmp_path, monkeypatch):
+    # A file database, so the heartbeat thread's session sees the same leases.
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"timeout": 30})
+    TestingSession = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(settings, "job_lease_ttl_s", 0.3)
+    steps = []
+    steal_at = []
+
+    def slow(db, scheduled_for):
+        for step in range(8):
+            time.sleep(0.15)
+            if step in steal_at:
+                with TestingSession() as other:
+                    other.execute(update(JobLease).where(JobLease.name == "scheduler").values(holder="b"))
+                    other.commit()
+            db.execute(select(1))
+            db.commit()
+            steps.append(step)
+        return len(steps)
+
+    job = Job(name="slow", schedule=CronSchedule.parse("0 0 * * *"), run=slow)
+    scheduled_for = datetime(2026, 3, 1, tzinfo=VN_TZ)
+    db = TestingSession()
+    assert acquire_lease(db, "scheduler", "a", 0.3)
+    # Runs four times the TTL, yet both leases stay ours throughout.
+    run = run_job(db, job, scheduled_for, JobTrigger.SCHEDULE, "a", held={"scheduler": 0.3})
+    assert (run.status, run.rows) == (JobStatus.SUCCEEDED, 8)
+    assert acquire_lease(db, "scheduler", "b", 60) is False
+
+    steps.clear()
+    steal_at.append(2)
+    with pytest.raises(LeaseLost):
+        run_job(db, job, scheduled_for, JobTrigger.SCHEDULE, "a", held={"scheduler": 0.3})
+    failed = db.scalars(select(JobRun).order_by(JobRun.id.desc())).first()
+    assert failed.status == JobStatus.FAILED and failed.error.startswith("LeaseLost")
+    assert len(steps) < 8
+
+
+def test_checkpoints_answer_balance_at_date_and_ledger_check_flags_drift():
+    engine = create_engine("sqlite:///:memory:")
+    TestingSession = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    db = TestingSession()
+    joined = datetime(2025, 12, 1)
+    db.add(User(id=1, username="u1", password_hash="x", role=UserRole.USER, leave_balance=290, created_at=joined))
+    db.add(User(id=2, username="u2", password_hash="x", role=UserRole.USER, leave_balance=300, created_at=joined))
+    # u1 was seeded with 100 before its first ledger entry; u2 never touched the ledger.
+    for change, after, created_at in ((120, 220, datetime(2026, 1, 5)), (-50, 170, datetime(2026, 1, 20)), (120, 290, datetime(2026, 2, 10))):
+        db.add(
+            LeaveTransaction(
+                user_id=1, change_amount=change, balance_after=after, source=TransactionSource.ADMIN_ADJUST, created_at=created_at
+            )
+        )
+    db.commit()
+
+    checkpoint = [JOBS["balance_checkpoint"]]
+    # Without history the first run waits for its next fire time instead of backfilling.
+    assert run_due_jobs(db, "a", now=datetime(2026, 2, 1, 8, 0, tzinfo=VN_TZ), jobs=checkpoint) == []
+    db.add(
+        JobRun(
+            job_name="balance_checkpoint",
+            scheduled_for=datetime(2026, 1, 30, 17, 5),
+            trigger=JobTrigger.SCHEDULE,
+            status=JobStatus.SUCCEEDED,
+            holder="a",
+        )
+    )
+    db.commit()
+    runs = run_due_jobs(db, "a", now=datetime(2026, 2, 1, 8, 0, tzinfo=VN_TZ), jobs=checkpoint)
+    assert [(run.status, run.rows) for run in runs] == [(JobStatus.SUCCEEDED, 1)]
+    stored = db.query(BalanceCheckpoint).one()
+    assert (stored.user_id, stored.as_of, stored.balance) == (1, datetime(2026, 1, 30, 17), 170)
+
+    assert balances_at(db, local_day_start(date(2026, 1, 10))) == [(1, "u1", 220), (2, "u2", 300)]
+    assert balances_at(db, local_day_start(date(2026, 3, 1)), [1]) == [(1, "u1", 290)]
+    assert balances_at(db, local_day_start(date(2025, 11, 1))) == []
+    assert replay_ledger(db) == []
+
+    stored.balance = 171
+    db.commit()
+    assert replay_ledger(db) == ["user=1: checkpoint at 2026-01-30T17:00:00 is 171, ledger says 170"]
+    check = [JOBS["ledger_check"]]
+    assert run_due_jobs(db, "a", now=datetime(2026, 2, 1, 8, 0, tzinfo=VN_TZ), jobs=check) == []
+    failed = db.query(JobRun).filter(JobRun.job_name == "ledger_check").one()
+    assert failed.status == JobStatus.FAILED and "checkpoint at" in failed.error
+    # A failed check is the finding, not something to retry until it passes.
+    run_due_jobs(db, "a", now=datetime(2026, 2, 1, 8, 0, tzinfo=VN_TZ), jobs=check)
+    assert db.query(JobRun).filter(JobRun.job_name == "ledger_check").count() == 1
+
+
+def test_archive_moves_closed_years_and_deleted_records_without_changing_balances():
+    engine = create_engine("sqlite:///:memory:")
+    TestingSession = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    db = TestingSession()
+    joined = datetime(2023, 1, 1)
+    db.add(User(id=1, username="u1", password_hash="x", role=UserRole.USER, leave_balance=290, created_at=joined))
+    db.add(User(id=2, username="u2", password_hash="x", role=UserRole.USER, leave_balance=50, created_at=joined))
+    ledger = [
+        (1, 120, 220, datetime(2023, 5, 1)),
+        (2, 50, 50, datetime(2023, 6, 1)),
+        (1, -50, 170, datetime(2024, 2, 1)),
+        (1, 120, 290, datetime(2026, 2, 1)),
+    ]
+    for user_id, change, after, created_at in ledger:
+        db.add(
+            LeaveTransaction(
+                user_id=user_id, change_amount=change, balance_after=after, source=TransactionSource.ADMIN_ADJUST, created_at=created_at
+            )
+        )
+    for deleted_at in (datetime(2025, 6, 1), datetime(2026, 2, 20), None):
+        start = (deleted_at or datetime(2026, 1, 5)) - timedelta(days=30)
+        db.add(
+            LeaveRecord(
+                user_id=1,
+                record_type=RecordType.FULL_DAY,
+                start_datetime=start,
+                end_datetime=start,
+                total_leave_days=100,
+                deleted_at=deleted_at,
+            )
+        )
+    db.commit()
+    write_checkpoints(db, datetime(2024, 3, 1))
+
+    # With two hot years in 2026, 2024 and older are closed.
+    assert run_archive(db, date(2026, 3, 1), batch_size=1) == 4
+    assert run_archive(db, date(2026, 3, 1), batch_size=1) == 0
+    assert db.query(LeaveRecord).count() == 2 and db.query(LeaveRecordArchive).count() == 1
+    assert db.query(LeaveTransaction).count() == 1 and db.query(LeaveTransactionArchive).count() == 3
+    horizon = local_day_start(date(2025, 1, 1))
+    assert sorted((cp.user_id, cp.as_of, cp.balance) for cp in db.query(BalanceCheckpoint)) == [(1, horizon, 170), (2, horizon, 50)]
+
+    assert balances_at(db, local_day_start(date(2024, 1, 1))) == [(1, "u1", 220), (2, "u2", 50)]
+    assert balances_at(db, local_day_start(date(2026, 3, 1))) == [(1, "u1", 290), (2, "u2", 50)]
+    assert replay_ledger(db) == []
+    assert len(db.execute(transactions_export_query(None, None, None)).all()) == 1
+    assert len(db.execute(transactions_export_query(None, None, None, include_archived=True)).all()) == 4